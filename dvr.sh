@@ -39,5 +39,5 @@ fi
 if [ -z "$outputFile" ]; then
     python src/distancevector.py "$topologyFile" "$messageFile" "$changesFile"
 else
-    python src/distancevector.py "$topologyFile" "$messageFile" "$changesFile" > "$outputFile"
+    python src/distancevector.py "$topologyFile" "$messageFile" "$changesFile" "$outputFile"
 fi
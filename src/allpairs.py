@@ -0,0 +1,96 @@
+##
+# @file allpairs.py
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from instrument import count
+
+## Smallest link density (links over possible links) at which the auto engine picks the dense matrix engine
+DENSE_MIN_DENSITY = 0.25
+
+## Largest number of nodes the auto engine picks the dense matrix engine for, since it keeps several V x V matrices
+DENSE_MAX_NODES = 4000
+
+
+def choose_engine(graph):
+    """! Pick the dense matrix engine or the per-source heap engine from the size and density of a topology.
+
+    @param graph a Graph of the network
+
+    @return 'matrix' if NumPy is available, every link cost is positive and the topology is small and dense enough,
+      otherwise 'heap'.
+    """
+    numNodes = len(graph)
+    if np is None or numNodes < 2 or numNodes > DENSE_MAX_NODES or min(graph.costs, default=1) <= 0:
+        return 'heap'
+    density = len(graph.targets) / (numNodes * (numNodes - 1))
+    return 'matrix' if density >= DENSE_MIN_DENSITY else 'heap'
+
+
+def all_pairs_routes(graph):
+    """! Compute the path cost and next hop between every pair of nodes with vectorized NumPy operations.
+
+    Path costs come from Floyd-Warshall over a cost matrix. The previous hop of each destination is then the neighbor on
+    a shortest path with the smallest (d, nodeId), which is the node the heap engine would settle first, and next hops
+    are found by pointer jumping along the previous hops. Link costs have to be positive for ties to match the heap engine.
+
+    @param graph a Graph of the network
+
+    @return A tuple (order, d, p, n) where order is a list of graph indexes sorted by nodeId, d is a matrix of path costs,
+      and p and n are matrices of the positions in order of the previous hop and next hop. The matrices are indexed by
+      positions in order, with -1 for unreachable destinations in p and n.
+    """
+    if np is None:
+        raise ImportError('The matrix engine needs NumPy')
+
+    # Lay the matrix out by nodeId, so that the first of equal entries belongs to the smallest nodeId
+    order = sorted(range(len(graph)), key=lambda i: graph.nodeIds[i])
+    position = [0] * len(order)
+    for pos, i in enumerate(order):
+        position[i] = pos
+    size = len(order)
+
+    w = np.full((size, size), np.inf)
+    neighbors = []
+    for pos, i in enumerate(order):
+        start, end = graph.offsets[i], graph.offsets[i + 1]
+        targets = np.array([position[t] for t in graph.targets[start:end]], dtype=np.int64)
+        costs = np.array(graph.costs[start:end], dtype=np.float64)
+        w[pos, targets] = costs
+        neighbors.append(np.sort(targets))
+
+    # Floyd-Warshall, one vectorized relaxation per intermediate node
+    d = w.copy()
+    np.fill_diagonal(d, 0)
+    for k in range(size):
+        np.minimum(d, d[:, k, None] + d[None, k, :], out=d)
+    count('floyd_warshall_rounds', size)
+
+    # Previous hop of each destination for every source at once
+    p = np.full((size, size), -1, dtype=np.int64)
+    for x in range(size):
+        nbrs = neighbors[x]
+        if len(nbrs) == 0:
+            continue
+        viaCosts = d[:, nbrs]
+        tight = (viaCosts + w[nbrs, x] == d[:, x, None]) & np.isfinite(viaCosts)
+        keys = np.where(tight, viaCosts, np.inf)
+        best = np.argmin(keys, axis=1)
+        found = np.isfinite(keys[np.arange(size), best])
+        p[found, x] = nbrs[best[found]]
+    np.fill_diagonal(p, np.arange(size))
+
+    # Next hop by pointer jumping: a neighbor of the source points to itself, every other node to its previous hop
+    sources = np.arange(size)[:, None]
+    n = np.where(p == sources, np.arange(size)[None, :], p)
+    n[n < 0] = np.broadcast_to(np.arange(size)[None, :], (size, size))[n < 0]
+    while True:
+        jumped = np.take_along_axis(n, n, axis=1)
+        if np.array_equal(jumped, n):
+            break
+        n = jumped
+    n[p < 0] = -1
+    return order, d, p, n
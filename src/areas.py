@@ -0,0 +1,539 @@
+##
+# @file areas.py
+
+import heapq
+import math
+from collections import deque
+
+from instrument import count
+from routecache import RouteCache
+
+INFINITY = float('inf')
+
+
+def partition_areas(nodes, areaSize=None):
+    """! Split the nodes into areas of connected nodes by breadth first search.
+
+    Each area grows from the smallest nodeId that has no area yet, over nodes that have no area yet, until it has
+    areaSize nodes or nothing left to add. Neighbors are visited in nodeId order, so the areas only depend on the topology.
+
+    @param nodes    A dictionary of nodes in the network.
+    @param areaSize The largest number of nodes of an area, or None for the square root of the number of nodes.
+
+    @return A dictionary of nodeIds and their areaIds, numbered from 1 in the order the areas were grown.
+    """
+    if areaSize is None:
+        areaSize = max(1, math.isqrt(len(nodes)))
+    if areaSize < 1:
+        raise ValueError('An area needs room for at least one node')
+    areaOf = {}
+    areaId = 0
+    for seedNodeId in sorted(nodes):
+        if seedNodeId in areaOf:
+            continue
+        areaId += 1
+        areaOf[seedNodeId] = areaId
+        size = 1
+        queue = deque([seedNodeId])
+        while queue and size < areaSize:
+            currNodeId = queue.popleft()
+            for neighborId in sorted(nodes[currNodeId].neighbors):
+                if neighborId in areaOf:
+                    continue
+                areaOf[neighborId] = areaId
+                queue.append(neighborId)
+                size += 1
+                if size == areaSize:
+                    break
+    return areaOf
+
+
+def area_spf(nodes, areaOf, areaId, seeds, borders=None):
+    """! Compute the path costs and next hops inside one area, from one or more seeded nodes.
+
+    Only the links between two nodes of the area are followed. Each seed is a tuple (cost, nodeId, nextHop): a seed
+    with a next hop of None is the source itself, so each of its neighbors is its own next hop, and any other seed
+    passes its next hop on to the nodes reached through it.
+
+    @param nodes    A dictionary of nodes in the network.
+    @param areaOf   A dictionary of nodeIds and their areaIds.
+    @param areaId   The area to search.
+    @param seeds    A list of tuples (cost, nodeId, nextHop) of the nodes the search starts from.
+    @param borders  A set of the border routers of the area, to also find the nodes that a shortest path only reaches
+                    through another border router, or None.
+
+    @return A tuple (d, n, through) of dictionaries of the path cost and next hop of every reached node, and, with
+      borders, of whether a shortest path to the node passes through a border router that is not a seed.
+    """
+    d, n = {}, {}
+    through = {} if borders is not None else None
+    for cost, nodeId, nextHop in seeds:
+        if cost < d.get(nodeId, INFINITY):
+            d[nodeId] = cost
+            n[nodeId] = nextHop
+    seedIds = set(d)
+    if through is not None:
+        through = dict.fromkeys(seedIds, False)
+    heap = [(cost, nodeId) for nodeId, cost in d.items()]
+    heapq.heapify(heap)
+
+    done = set()
+    pushes = relaxations = 0
+    while heap:
+        minCost, minNodeId = heapq.heappop(heap)
+        if minNodeId in done:
+            continue
+        done.add(minNodeId)
+        hop = n[minNodeId]
+        passes = through is not None and (through[minNodeId] or (minNodeId in borders and minNodeId not in seedIds))
+
+        neighbors = nodes[minNodeId].neighbors
+        relaxations += len(neighbors)
+        for neighborId, cost in neighbors.items():
+            if neighborId in done or areaOf[neighborId] != areaId:
+                continue
+            newCost = minCost + cost
+            oldCost = d.get(neighborId, INFINITY)
+            if newCost < oldCost:
+                d[neighborId] = newCost
+                n[neighborId] = neighborId if hop is None else hop
+                if through is not None:
+                    through[neighborId] = passes
+                heapq.heappush(heap, (newCost, neighborId))
+                pushes += 1
+            elif passes and newCost == oldCost:
+                through[neighborId] = True
+
+    # Like the engines, a source is its own next hop
+    for cost, nodeId, nextHop in seeds:
+        if nextHop is None:
+            n[nodeId] = nodeId
+    count('spf_runs')
+    count('relaxations', relaxations)
+    count('heap_pushes', pushes + len(seedIds))
+    count('heap_pops', pushes + len(seedIds))
+    return d, n, through
+
+
+class AreaRowView:
+    """! Read only view of the path costs or the next hops of an AreaRow, indexed by nodeId.
+
+    Attributes:
+    - row: the AreaRow the view reads
+    - position: 0 to read the path costs, 1 to read the next hops
+    """
+    __slots__ = ('row', 'position')
+
+    def __init__(self, row, position):
+        """! Initializing the AreaRowView object.
+
+        @param row      The AreaRow the view reads.
+        @param position 0 to read the path costs, 1 to read the next hops.
+        """
+        self.row = row
+        self.position = position
+
+    def __getitem__(self, nodeId):
+        """! Get the path cost or next hop of the row for a destination.
+
+        @param nodeId The nodeId of the destination.
+
+        @return The path cost, inf if unreachable, or the next hop, None if unreachable.
+        """
+        return self.row.route(nodeId)[self.position]
+
+    def __len__(self):
+        """! Get the number of destinations in the row.
+
+        @return The number of destinations.
+        """
+        return len(self.row.state.nodes)
+
+    def __iter__(self):
+        """! Iterate over the nodeIds of the destinations.
+
+        @return An iterator of nodeIds.
+        """
+        return iter(self.row.state.nodes)
+
+    def items(self):
+        """! Iterate over the destinations and their values.
+
+        @return An iterator of tuples (nodeId, value).
+        """
+        return ((nodeId, self[nodeId]) for nodeId in self.row.state.nodes)
+
+
+class AreaRow:
+    """! Routes of one source, combined per destination from the tree of the source in its area and its exits.
+
+    Attributes:
+    - state: the AreaLinkState the row belongs to
+    - srcNodeId: the nodeId of the source
+    - areaId: the area of the source
+    - d: a dictionary of the path cost of the source to each node of its area it reaches inside the area
+    - n: a dictionary of the next hop of the source to each node of its area it reaches inside the area
+    - exits: in exact mode, a dictionary of the tuple (path cost, next hop) of the source to every border router it
+      reaches, with a next hop of None for the source itself; in summarized mode, a dictionary of the tuple
+      (advertised path cost, entry border router, next hop) towards each other area, filled as areas are read
+
+    Methods:
+    - route(dstNodeId): the path cost and next hop to a destination
+    - exit_towards(areaId): the cheapest border router of the area of the source towards another area in summarized mode
+    """
+    __slots__ = ('state', 'srcNodeId', 'areaId', 'd', 'n', 'exits')
+
+    def __init__(self, state, srcNodeId, d, n, exits):
+        """! Initializing the AreaRow object.
+
+        @param state        The AreaLinkState the row belongs to.
+        @param srcNodeId    The nodeId of the source.
+        @param d            The path costs of the source inside its area.
+        @param n            The next hops of the source inside its area.
+        @param exits        The exits of the source, which start empty in summarized mode.
+        """
+        self.state = state
+        self.srcNodeId = srcNodeId
+        self.areaId = state.areaOf[srcNodeId]
+        self.d = d
+        self.n = n
+        self.exits = exits
+
+    def exit_towards(self, areaId):
+        """! Find the cheapest border router of the area of the source towards another area, from the routes the
+        border routers learned over the overlay graph. Ties go to the route with the smaller entry border router, which
+        is the tie breaking of the overlay search, so every router along the route picks the same entry.
+
+        @param areaId The other area.
+
+        @return A tuple (advertised path cost, entry border router, next hop), or None if the area cannot be reached.
+        """
+        routes = self.state.area_routes(areaId)
+        best = None
+        for borderId in self.state.borders[self.areaId]:
+            route = routes.get(borderId)
+            if route is None or borderId not in self.d:
+                continue
+            key = (self.d[borderId] + route[0], route[1])
+            if best is None or key < best[:2]:
+                best = (*key, route[2] if borderId == self.srcNodeId else self.n[borderId])
+        return best
+
+    def route(self, dstNodeId):
+        """! Get the path cost and next hop of the source to a destination.
+
+        @param dstNodeId The nodeId of the destination.
+
+        @return A tuple (pathCost, nextHop), which is (inf, None) if the destination is unreachable.
+        """
+        if dstNodeId == self.srcNodeId:
+            return 0, dstNodeId
+        state = self.state
+        areaId = state.areaOf[dstNodeId]
+
+        if state.summarize:
+            # Routes inside an area never leave it
+            if areaId == self.areaId:
+                return self.d.get(dstNodeId, INFINITY), self.n.get(dstNodeId)
+            if areaId not in self.exits:
+                self.exits[areaId] = self.exit_towards(areaId)
+            exit = self.exits[areaId]
+            if exit is None:
+                return INFINITY, None
+            advertisedCost, entryId, nextHop = exit
+            inside = state.trees[entryId][0].get(dstNodeId)
+            if inside is None:
+                return INFINITY, None
+            # The advertised cost of the entry border router is replaced by its actual cost to the destination
+            return advertisedCost - state.advertised[entryId] + inside, nextHop
+
+        best = (self.d.get(dstNodeId, INFINITY), self.n.get(dstNodeId)) if areaId == self.areaId else (INFINITY, None)
+        for borderId in state.borders[areaId]:
+            exit = self.exits.get(borderId)
+            if exit is None:
+                continue
+            d, n = state.trees[borderId]
+            inside = d.get(dstNodeId)
+            if inside is not None and exit[0] + inside < best[0]:
+                best = (exit[0] + inside, exit[1] if exit[1] is not None else n[dstNodeId])
+        return best
+
+
+class AreaLinkState:
+    """! Link state information computed area by area, like OSPF areas, with the border routers joining the areas.
+
+    The nodes are split into areas, and a border router is a node with a link to another area. Each border router keeps
+    the shortest path tree of its area, and the border routers form an overlay graph whose edges are the inter-area links
+    and the path costs between two border routers of the same area. A change to a link only recomputes the trees of the
+    areas at its two ends, or only the overlay graph for a cost change between two border routers.
+
+    The state can be used in place of the linkState dictionary: the rows are computed the first time they are read and
+    kept in a RouteCache, and state[srcNodeId] is a tuple (d, None, n) of AreaRowView views. A row only holds the tree of
+    the source inside its area and one exit per border router or area, and each path cost is combined when it is read.
+    - In exact mode, the source searches the overlay graph from the border routers of its area, and the path cost to a
+      destination is the smallest, over the border routers of its area, of the cost to the border router plus the cost
+      inside the area. The path costs are the same as the flat engines.
+    - In summarized mode, each border router only advertises the largest path cost into its own area, as an OSPF area
+      range does. A router knows the topology of its area and, for each other area, the cheapest border router of its
+      area towards it, and routes inside an area never leave it. These routes can be longer than the shortest path,
+      and is_summarized tells which routes may be.
+
+    Attributes:
+    - nodes: a dictionary of nodes in the network, shared with the caller
+    - areaOf: a dictionary of nodeIds and their areaIds
+    - members: a dictionary of areaIds and the sorted list of their nodeIds
+    - summarize: True in summarized mode
+    - borders: a dictionary of areaIds and the sorted list of their border routers
+    - trees: a dictionary of the tuple (d, n) of the shortest path tree of each border router inside its area
+    - overlay: a dictionary of the edges of each border router in the overlay graph, as a dictionary of the other border
+      router to a tuple (cost, next hop); edges between two border routers of an area are left out when a shortest path
+      between them passes through a third one
+    - advertised: a dictionary of the largest path cost of each border router inside its area
+    - toArea: in summarized mode, a dictionary of areaIds and the route of each border router outside the area towards
+      it, as a tuple (advertised path cost, entry border router, next hop)
+    - cache: a RouteCache of the AreaRow of each source that was read
+
+    Methods:
+    - update_area(areaId): recompute the border routers, their trees and their overlay edges of one area
+    - update_links(links): update the state after links changed in the nodes
+    - area_routes(areaId): the routes of the border routers towards an area in summarized mode
+    - is_summarized(srcNodeId, dstNodeId): whether a route may be longer than the shortest path
+    """
+    __slots__ = ('nodes', 'areaOf', 'members', 'summarize', 'borders', 'trees', 'overlay', 'advertised', 'toArea', 'cache')
+
+    def __init__(self, nodes, areaOf, summarize=False, capacity=1024):
+        """! Initializing the AreaLinkState object.
+
+        @param nodes        A dictionary of nodes in the network.
+        @param areaOf       A dictionary of nodeIds and their areaIds, which has to cover every node.
+        @param summarize    If True, route between areas with summarized path costs.
+        @param capacity     The largest number of rows that are kept.
+        """
+        missing = [nodeId for nodeId in nodes if nodeId not in areaOf]
+        if missing:
+            raise ValueError(f'{len(missing)} nodes have no area, such as node {min(missing)}')
+        self.nodes = nodes
+        self.areaOf = {nodeId: areaOf[nodeId] for nodeId in nodes}
+        self.members = {}
+        for nodeId in sorted(nodes):
+            self.members.setdefault(self.areaOf[nodeId], []).append(nodeId)
+        self.summarize = summarize
+        self.borders = {}
+        self.trees = {}
+        self.overlay = {}
+        self.advertised = {}
+        self.toArea = {}
+        self.cache = RouteCache(self.compute_row, capacity)
+        for areaId in self.members:
+            self.update_area(areaId)
+
+    def is_border(self, nodeId):
+        """! Check if a node has a link to another area.
+
+        @param nodeId The nodeId of the node.
+
+        @return True if the node is a border router.
+        """
+        areaOf = self.areaOf
+        areaId = areaOf[nodeId]
+        return any(areaOf[neighborId] != areaId for neighborId in self.nodes[nodeId].neighbors)
+
+    def update_area(self, areaId):
+        """! Recompute the border routers of an area, their shortest path trees inside it and their overlay edges.
+
+        @param areaId The area to recompute.
+        """
+        for borderId in self.borders.get(areaId, ()):
+            del self.trees[borderId], self.overlay[borderId], self.advertised[borderId]
+        nodes, areaOf = self.nodes, self.areaOf
+        borders = [nodeId for nodeId in self.members[areaId] if self.is_border(nodeId)]
+        self.borders[areaId] = borders
+        borderSet = set(borders)
+        for borderId in borders:
+            d, n, through = area_spf(nodes, areaOf, areaId, [(0, borderId, None)], borderSet)
+            self.trees[borderId] = (d, n)
+            self.advertised[borderId] = max(d.values())
+            edges = {otherId: (d[otherId], n[otherId]) for otherId in borders
+                     if otherId != borderId and otherId in d and not through[otherId]}
+            for neighborId, cost in nodes[borderId].neighbors.items():
+                if areaOf[neighborId] != areaId:
+                    edges[neighborId] = (cost, neighborId)
+            self.overlay[borderId] = edges
+        count('area_updates')
+
+    def update_links(self, links):
+        """! Update the state after links changed in the nodes, recomputing only the areas at the ends of the links.
+
+        @param links A list of tuples (nodeId, neighborId) of the links that changed.
+        """
+        nodes, areaOf = self.nodes, self.areaOf
+        areaIds = set()
+        for nodeId, neighborId in links:
+            if areaOf[nodeId] == areaOf[neighborId]:
+                areaIds.add(areaOf[nodeId])
+            elif nodeId in self.overlay and neighborId in self.overlay and self.is_border(nodeId) and self.is_border(neighborId):
+                # Both ends stay border routers, so only the overlay edges of the link change
+                for fromId, toId in ((nodeId, neighborId), (neighborId, nodeId)):
+                    cost = nodes[fromId].neighbors.get(toId)
+                    if cost is None:
+                        self.overlay[fromId].pop(toId, None)
+                    else:
+                        self.overlay[fromId][toId] = (cost, toId)
+            else:
+                areaIds.update((areaOf[nodeId], areaOf[neighborId]))
+        for areaId in sorted(areaIds):
+            self.update_area(areaId)
+        self.toArea.clear()
+        self.cache.invalidate()
+
+    def overlay_spf(self, seeds):
+        """! Search the overlay graph from the border routers of the area of a source.
+
+        @param seeds A list of tuples (cost, borderId, nextHop) of the path cost and next hop of the source to each
+                     border router of its area, with a next hop of None for the source itself.
+
+        @return A dictionary of the tuple (path cost, next hop) of the source to every border router it reaches.
+        """
+        overlay = self.overlay
+        best = {borderId: (cost, nextHop) for cost, borderId, nextHop in seeds}
+        heap = [(cost, borderId) for cost, borderId, _ in seeds]
+        heapq.heapify(heap)
+        done = set()
+        pushes = 0
+        while heap:
+            minCost, minNodeId = heapq.heappop(heap)
+            if minNodeId in done:
+                continue
+            done.add(minNodeId)
+            hop = best[minNodeId][1]
+            for neighborId, (cost, linkHop) in overlay[minNodeId].items():
+                if neighborId in done:
+                    continue
+                newCost = minCost + cost
+                if newCost < best.get(neighborId, (INFINITY,))[0]:
+                    best[neighborId] = (newCost, linkHop if hop is None else hop)
+                    heapq.heappush(heap, (newCost, neighborId))
+                    pushes += 1
+        count('overlay_runs')
+        count('heap_pushes', pushes + len(seeds))
+        count('heap_pops', pushes + len(seeds))
+        return best
+
+    def area_routes(self, areaId):
+        """! Find the route of every border router outside an area towards it in summarized mode, computed once per topology.
+
+        The search starts from the border routers of the area at the path cost they advertise, and never goes back
+        into the area, since a route stops at the first border router of the area it reaches. Routes are compared on
+        (path cost, entry border router), so equal cost routes agree on their entry.
+
+        @param areaId The area.
+
+        @return A dictionary of the tuple (advertised path cost, entry border router, next hop) of each border router
+          outside the area that reaches it.
+        """
+        routes = self.toArea.get(areaId)
+        if routes is not None:
+            return routes
+        areaOf, overlay, trees = self.areaOf, self.overlay, self.trees
+        best = {}
+        heap = []
+        for borderId in self.borders[areaId]:
+            best[borderId] = (self.advertised[borderId], borderId, borderId)
+            heap.append((self.advertised[borderId], borderId, borderId))
+        heapq.heapify(heap)
+        done = set()
+        pushes = 0
+        while heap:
+            minCost, entryId, minNodeId = heapq.heappop(heap)
+            if minNodeId in done:
+                continue
+            done.add(minNodeId)
+            for neighborId, (cost, _) in overlay[minNodeId].items():
+                if neighborId in done or areaOf[neighborId] == areaId:
+                    continue
+                key = (minCost + cost, entryId)
+                if neighborId not in best or key < best[neighborId][:2]:
+                    # The next hop is taken from the side of the neighbor, towards the area
+                    nextHop = trees[neighborId][1][minNodeId] if areaOf[neighborId] == areaOf[minNodeId] else minNodeId
+                    best[neighborId] = (*key, nextHop)
+                    heapq.heappush(heap, (*key, neighborId))
+                    pushes += 1
+        count('overlay_runs')
+        count('heap_pushes', pushes + len(self.borders[areaId]))
+        count('heap_pops', pushes + len(self.borders[areaId]))
+        routes = {nodeId: route for nodeId, route in best.items() if areaOf[nodeId] != areaId}
+        self.toArea[areaId] = routes
+        return routes
+
+    def compute_row(self, srcNodeId):
+        """! Compute the tree of a source inside its area and, in exact mode, its search of the overlay graph.
+
+        @param srcNodeId The nodeId of the source node.
+
+        @return The AreaRow of the source.
+        """
+        areaId = self.areaOf[srcNodeId]
+        d, n, _ = area_spf(self.nodes, self.areaOf, areaId, [(0, srcNodeId, None)])
+        if self.summarize:
+            return AreaRow(self, srcNodeId, d, n, {})
+        seeds = [(d[borderId], borderId, None if borderId == srcNodeId else n[borderId])
+                 for borderId in self.borders[areaId] if borderId in d]
+        return AreaRow(self, srcNodeId, d, n, self.overlay_spf(seeds))
+
+    def is_summarized(self, srcNodeId, dstNodeId):
+        """! Check if a route may be longer than the shortest path.
+
+        In summarized mode, that is every route to another area, and every route inside an area with more than one
+        border router, since the shortest path could leave the area and come back.
+
+        @param srcNodeId The nodeId of the source node.
+        @param dstNodeId The nodeId of the destination node.
+
+        @return True if the route may be suboptimal.
+        """
+        if not self.summarize or srcNodeId == dstNodeId:
+            return False
+        areaId = self.areaOf[srcNodeId]
+        return self.areaOf[dstNodeId] != areaId or len(self.borders[areaId]) > 1
+
+    def __getitem__(self, srcNodeId):
+        """! Get the link state information of a source, computing its row if it is not cached.
+
+        @param srcNodeId The nodeId of the source node.
+
+        @return A tuple (d, None, n) of views of the path cost and the next hop to each destination.
+        """
+        if srcNodeId not in self.nodes:
+            raise KeyError(srcNodeId)
+        row = self.cache.get(srcNodeId)
+        return AreaRowView(row, 0), None, AreaRowView(row, 1)
+
+    def __contains__(self, srcNodeId):
+        """! Check if a nodeId is a source in the network.
+
+        @param srcNodeId The nodeId to check.
+
+        @return True if the nodeId is in the network.
+        """
+        return srcNodeId in self.nodes
+
+    def __len__(self):
+        """! Get the number of sources in the network.
+
+        @return The number of sources.
+        """
+        return len(self.nodes)
+
+    def __iter__(self):
+        """! Iterate over the nodeIds of the sources.
+
+        @return An iterator of nodeIds.
+        """
+        return iter(self.nodes)
+
+    def items(self):
+        """! Iterate over the sources and their link state information, computing every row.
+
+        @return An iterator of tuples (srcNodeId, (d, None, n)).
+        """
+        return ((nodeId, self[nodeId]) for nodeId in self.nodes)
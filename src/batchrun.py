@@ -0,0 +1,267 @@
+##
+# @file batchrun.py
+
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+
+import ingest
+import instrument
+from distancevector import distanceVector_routing
+from linkstate import link_state_routing
+
+## Routing functions of the protocols by the name used in a manifest
+ROUTING_FUNCTIONS = {'ls': link_state_routing, 'dv': distanceVector_routing}
+
+## File extensions of the topology, message and change files of a scenario in a directory
+SCENARIO_EXTENSIONS = ('.topo', '.msg', '.chg')
+
+## Default number of parsed topologies each process keeps
+TOPOLOGY_CACHE_SIZE = 16
+
+
+def read_manifest(manifestFile):
+    """! Read the scenarios of a manifest file.
+
+    Each line is a JSON object with a "protocol" ("ls" or "dv"), the "topology", "messages" and "changes" files, and
+    optionally a "name", an "output" file and the "options" passed to the routing function as keyword arguments, such
+    as {"engine": "heap", "batchSize": 4}. Relative paths are relative to the manifest. Blank lines and lines starting
+    with # are skipped.
+
+    @param manifestFile The path of the manifest file.
+
+    @return A list of scenario dictionaries in file order.
+    """
+    directory = os.path.dirname(os.path.abspath(manifestFile))
+    scenarios = []
+    with open(manifestFile) as file:
+        for lineNumber, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise ValueError(f'{manifestFile}:{lineNumber}: {error}') from None
+            missing = [key for key in ('protocol', 'topology', 'messages', 'changes') if key not in entry]
+            if missing:
+                raise ValueError(f'{manifestFile}:{lineNumber}: missing {", ".join(missing)}')
+            if entry['protocol'] not in ROUTING_FUNCTIONS:
+                raise ValueError(f'{manifestFile}:{lineNumber}: unknown protocol {entry["protocol"]}')
+            files = [os.path.join(directory, entry[key]) for key in ('topology', 'messages', 'changes')]
+            name = entry.get('name') or f'{entry["protocol"]}-{os.path.splitext(os.path.basename(files[0]))[0]}'
+            scenarios.append({'name': name, 'protocol': entry['protocol'], 'files': files,
+                              'output': os.path.join(directory, entry['output']) if entry.get('output') else None,
+                              'options': entry.get('options', {})})
+    return scenarios
+
+
+def find_scenarios(directory, protocols):
+    """! Find the scenarios of a directory: every name that has a .topo, a .msg and a .chg file, once per protocol.
+
+    @param directory    The directory to search.
+    @param protocols    A list of the protocols to run each scenario with.
+
+    @return A list of scenario dictionaries, ordered by name and protocol.
+    """
+    names = {}
+    for fileName in os.listdir(directory):
+        base, extension = os.path.splitext(fileName)
+        if extension in SCENARIO_EXTENSIONS:
+            names.setdefault(base, set()).add(extension)
+    scenarios = []
+    for base in sorted(names):
+        if len(names[base]) < len(SCENARIO_EXTENSIONS):
+            continue
+        files = [os.path.join(directory, base + extension) for extension in SCENARIO_EXTENSIONS]
+        for protocol in protocols:
+            scenarios.append({'name': f'{protocol}-{base}', 'protocol': protocol, 'files': files, 'output': None, 'options': {}})
+    return scenarios
+
+
+def init_batch_worker(cacheSize):
+    """! Keep the parsed topologies in a worker process of the batch.
+
+    @param cacheSize The largest number of topologies the worker keeps.
+    """
+    ingest.keep_topologies(cacheSize)
+
+
+def run_scenario(scenario):
+    """! Run one scenario in the current process and time it.
+
+    Statistics are recorded for the scenario alone, so the result has the seconds of each phase. An error is recorded
+    in the result instead of stopping the batch.
+
+    @param scenario A scenario dictionary, whose "output" is the file the output is written to.
+
+    @return A dictionary with the name, protocol, status, seconds, seconds of each phase, whether the topology was
+      reused from an earlier scenario, and the error of a failed scenario.
+    """
+    cache = ingest.topologyCache
+    hits = cache.hits if cache is not None else 0
+    result = {'name': scenario['name'], 'protocol': scenario['protocol'], 'output': scenario['output']}
+    instrument.enable()
+    start = time.perf_counter()
+    try:
+        ROUTING_FUNCTIONS[scenario['protocol']](*scenario['files'], scenario['output'], **scenario['options'])
+        result['status'] = 'ok'
+    except Exception as error:
+        result['status'] = 'error'
+        result['error'] = f'{type(error).__name__}: {error}'
+    result['seconds'] = time.perf_counter() - start
+    summary = instrument.disable().summary()
+    result['phases'] = {name: entry['seconds'] for name, entry in summary['phases'].items()}
+    result['reused_topology'] = cache is not None and cache.hits > hits
+    return result
+
+
+def run_chunk(scenarios):
+    """! Run a chunk of scenarios in a worker process.
+
+    @param scenarios A list of scenario dictionaries.
+
+    @return A list of results, as returned by run_scenario.
+    """
+    return [run_scenario(scenario) for scenario in scenarios]
+
+
+def split_scenarios(scenarios, workers):
+    """! Group the scenarios that share a topology and split the groups into chunks for the workers.
+
+    The scenarios of a chunk run one after the other in the same worker, so only the first of a chunk parses the
+    topology. Chunks are small enough that every worker gets a few of them.
+
+    @param scenarios    A list of scenario dictionaries.
+    @param workers      The number of worker processes.
+
+    @return A list of lists of scenario dictionaries.
+    """
+    groups = {}
+    for scenario in scenarios:
+        groups.setdefault(os.path.abspath(scenario['files'][0]), []).append(scenario)
+    chunkSize = max(1, math.ceil(len(scenarios) / (4 * workers)))
+    return [group[i:i + chunkSize] for group in groups.values() for i in range(0, len(group), chunkSize)]
+
+
+def run_batch(scenarios, outputDir, workers=1, cacheSize=TOPOLOGY_CACHE_SIZE):
+    """! Run every scenario in a pool of worker processes that stay up for the whole batch.
+
+    With one worker, the scenarios run in the current process.
+
+    @param scenarios    A list of scenario dictionaries, where a scenario without an output is written to
+                        outputDir/name.out.
+    @param outputDir    The directory the outputs are written to.
+    @param workers      The number of worker processes.
+    @param cacheSize    The largest number of parsed topologies each process keeps.
+
+    @return A list of the results of the scenarios in the order of the scenarios, as returned by run_scenario.
+    """
+    names = [scenario['name'] for scenario in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError(f'Scenario names must be unique, {next(name for name in names if names.count(name) > 1)} is not')
+    os.makedirs(outputDir, exist_ok=True)
+    scenarios = [{**scenario, 'output': scenario['output'] or os.path.join(outputDir, f'{scenario["name"]}.out')}
+                 for scenario in scenarios]
+    chunks = split_scenarios(scenarios, workers)
+
+    if workers == 1:
+        previous = ingest.topologyCache
+        init_batch_worker(cacheSize)
+        try:
+            results = [result for chunk in chunks for result in run_chunk(chunk)]
+        finally:
+            ingest.topologyCache = previous
+    else:
+        with multiprocessing.Pool(workers, init_batch_worker, (cacheSize,)) as pool:
+            results = [result for chunkResults in pool.imap_unordered(run_chunk, chunks) for result in chunkResults]
+    order = {name: i for i, name in enumerate(names)}
+    return sorted(results, key=lambda result: order[result['name']])
+
+
+def summarize_batch(results, seconds):
+    """! Sum up the results of a batch.
+
+    @param results  A list of results, as returned by run_batch.
+    @param seconds  The wall time of the whole batch.
+
+    @return A dictionary with the number of scenarios, failures and reused topologies, the wall time, the time spent in
+      the scenarios and in each of their phases, and the scenarios per second.
+    """
+    phases = {}
+    for result in results:
+        for name, phaseSeconds in result['phases'].items():
+            phases[name] = phases.get(name, 0.0) + phaseSeconds
+    return {
+        'scenarios': len(results),
+        'failed': sum(1 for result in results if result['status'] != 'ok'),
+        'reused_topologies': sum(1 for result in results if result['reused_topology']),
+        'seconds': seconds,
+        'scenario_seconds': sum(result['seconds'] for result in results),
+        'phases': phases,
+        'scenarios_per_second': len(results) / seconds if seconds else 0.0,
+    }
+
+
+def format_batch(results, summary):
+    """! Format the results and the summary of a batch as a table.
+
+    @param results  A list of results, as returned by run_batch.
+    @param summary  The summary, as returned by summarize_batch.
+
+    @return The table as a string.
+    """
+    lines = [f'{"scenario":<40} {"status":<7} {"seconds":>9} {"parse":>8} {"compute":>9} {"tables":>8} {"messages":>9}']
+    for result in results:
+        phases = result['phases']
+        lines.append(f'{result["name"]:<40} {result["status"]:<7} {result["seconds"]:>9.3f} {phases.get("parse", 0.0):>8.3f} '
+                     f'{phases.get("compute", 0.0):>9.3f} {phases.get("tables", 0.0):>8.3f} {phases.get("messages", 0.0):>9.3f}')
+        if 'error' in result:
+            lines.append(f'  {result["error"]}')
+    lines.append('')
+    lines.append(f'{summary["scenarios"]} scenarios, {summary["failed"]} failed, {summary["reused_topologies"]} reused topologies, '
+                 f'{summary["seconds"]:.3f} s wall, {summary["scenario_seconds"]:.3f} s in scenarios, '
+                 f'{summary["scenarios_per_second"]:.1f} scenarios/s')
+    return '\n'.join(lines) + '\n'
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run many routing scenarios in one warm process pool.")
+    parser.add_argument("scenarios", help="a manifest file of JSON lines, or a directory of .topo, .msg and .chg files")
+    parser.add_argument("--protocols", nargs="+", choices=ROUTING_FUNCTIONS, default=["ls"], help="with a directory, the protocols to run each scenario with")
+    parser.add_argument("--options", default="{}", help="keyword arguments of the routing functions as a JSON object, under the options of each scenario, such as '{\"engine\": \"heap\"}'")
+    parser.add_argument("--output-dir", default="batch-output", help="the directory the outputs of the scenarios are written to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="the number of worker processes")
+    parser.add_argument("--topology-cache", type=int, default=TOPOLOGY_CACHE_SIZE, help="the largest number of parsed topologies each worker keeps")
+    parser.add_argument("--summary", metavar="FILE", help="write the results and the summary as JSON (default summary.json in the output directory)")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.topology_cache < 0:
+        parser.error("--topology-cache cannot be negative")
+    try:
+        options = json.loads(args.options)
+    except json.JSONDecodeError as error:
+        parser.error(f"--options is not valid JSON: {error}")
+    if not isinstance(options, dict):
+        parser.error("--options must be a JSON object")
+
+    if os.path.isdir(args.scenarios):
+        scenarios = find_scenarios(args.scenarios, args.protocols)
+    else:
+        scenarios = read_manifest(args.scenarios)
+    scenarios = [{**scenario, 'options': {**options, **scenario['options']}} for scenario in scenarios]
+
+    start = time.perf_counter()
+    results = run_batch(scenarios, args.output_dir, args.workers, args.topology_cache)
+    summary = summarize_batch(results, time.perf_counter() - start)
+    sys.stdout.write(format_batch(results, summary))
+    with open(args.summary or os.path.join(args.output_dir, 'summary.json'), 'w') as file:
+        json.dump({'scenarios': results, 'summary': summary}, file, indent=1)
+    if summary['failed']:
+        sys.exit(1)
@@ -0,0 +1,221 @@
+##
+# @file bench.py
+
+import json
+import os
+import shlex
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from topogen import TOPOLOGY_KINDS, generate_workload
+
+## Scripts of the protocols by the name used on the command line
+PROTOCOL_SCRIPTS = {'ls': 'linkstate.py', 'dv': 'distancevector.py'}
+
+## Metrics of a case that are compared with a baseline, where a larger value is worse
+BASELINE_METRICS = ('total_seconds', 'initial_seconds', 'change_p50', 'change_p95', 'peak_kb')
+
+## Absolute margin of each metric in BASELINE_METRICS under which a difference is noise, in seconds or KB. A change
+## only takes a few milliseconds on small workloads, where the scheduler alone moves its percentiles by as much.
+NOISE_FLOOR = {'total_seconds': 0.05, 'initial_seconds': 0.05, 'change_p50': 0.02, 'change_p95': 0.02, 'peak_kb': 1024}
+
+
+def percentile(values, fraction):
+    """! Get a percentile of a list of values by the nearest rank.
+
+    @param values   A list of numbers.
+    @param fraction The percentile as a fraction between 0 and 1.
+
+    @return The value at the percentile, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def run_case(protocol, files, options=(), timeout=None):
+    """! Run a protocol over a workload in its own process and collect the statistics it records.
+
+    Each run gets a fresh process, so the peak memory is the one of the run alone.
+
+    @param protocol The protocol in PROTOCOL_SCRIPTS.
+    @param files    A tuple (topologyFile, messageFile, changeFile).
+    @param options  Extra command line options of the protocol, such as ['--engine', 'heap'].
+    @param timeout  The number of seconds after which the run is stopped, or None.
+
+    @return A tuple (records, summary) of the phase records and the summary written by the instrument module.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), PROTOCOL_SCRIPTS[protocol])
+    with tempfile.TemporaryDirectory() as directory:
+        outputFile = os.path.join(directory, 'output.txt')
+        statsFile = os.path.join(directory, 'stats.json')
+        command = [sys.executable, script, *files, outputFile, *options, '--stats', 'json', '--stats-file', statsFile]
+        result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=timeout)
+        if result.returncode != 0:
+            raise ValueError(f'{protocol} failed on {files[0]}: {result.stderr.strip().splitlines()[-1] if result.stderr.strip() else result.returncode}')
+        with open(statsFile) as file:
+            lines = [json.loads(line) for line in file]
+    return lines[:-1], lines[-1]['summary']
+
+
+def case_metrics(records, summary, numMessages):
+    """! Turn the statistics of a run into the metrics of a benchmark case.
+
+    @param records      The phase records of the run.
+    @param summary      The summary of the run.
+    @param numMessages  The number of messages in the message file, which are answered once per change and once for the
+                        initial topology.
+
+    @return A dictionary with the total and initial seconds, the latency percentiles of a change, the throughput of
+      changes and messages per second and the peak memory.
+    """
+    perChange = {}
+    messageSeconds = 0.0
+    for record in records:
+        perChange[record['change']] = perChange.get(record['change'], 0.0) + record['seconds']
+        if record['phase'] == 'messages':
+            messageSeconds += record['seconds']
+    latencies = [seconds for change, seconds in perChange.items() if change > 0]
+    changeSeconds = sum(latencies)
+    return {
+        'total_seconds': summary['seconds'],
+        'initial_seconds': perChange.get(0, 0.0),
+        'changes': len(latencies),
+        'change_p50': percentile(latencies, 0.5),
+        'change_p95': percentile(latencies, 0.95),
+        'change_max': max(latencies, default=0.0),
+        'changes_per_second': len(latencies) / changeSeconds if changeSeconds else 0.0,
+        'messages_per_second': numMessages * len(perChange) / messageSeconds if messageSeconds else 0.0,
+        'peak_kb': summary['peak_kb'],
+    }
+
+
+def run_benchmark(cases, repeat=5, timeout=None):
+    """! Run every case and keep, for each metric, the median over the repeats.
+
+    @param cases    A list of tuples (name, protocol, files, options, numMessages).
+    @param repeat   The number of runs of each case.
+    @param timeout  The number of seconds after which a run is stopped, or None.
+
+    @return A dictionary of the metrics of each case by its name, where a case that failed or timed out has an "error".
+      The "spread" of a case holds the difference between the largest and smallest run of each metric in
+      BASELINE_METRICS.
+    """
+    results = {}
+    for name, protocol, files, options, numMessages in cases:
+        runs = []
+        try:
+            for _ in range(repeat):
+                runs.append(case_metrics(*run_case(protocol, files, options, timeout), numMessages))
+        except subprocess.TimeoutExpired:
+            results[name] = {'error': f'timed out after {timeout} seconds'}
+            continue
+        except ValueError as error:
+            results[name] = {'error': str(error)}
+            continue
+        results[name] = {metric: statistics.median(run[metric] for run in runs) if runs[0][metric] is not None else None
+                         for metric in runs[0]}
+        results[name]['spread'] = {metric: max(run[metric] for run in runs) - min(run[metric] for run in runs)
+                                   for metric in BASELINE_METRICS if runs[0][metric] is not None}
+    return results
+
+
+def compare_baseline(results, baseline, threshold):
+    """! Find the metrics that got worse than a saved baseline by more than a threshold.
+
+    A metric only regressed when its new median exceeds the baseline median by more than the threshold, plus the larger
+    spread of the two runs and its NOISE_FLOOR, so the jitter between runs of the same code is not flagged. Cases that
+    are missing from either side are skipped, and a baseline without spreads counts as having none.
+
+    @param results      A dictionary of the metrics of each case, as returned by run_benchmark.
+    @param baseline     A dictionary in the same form, from an earlier run.
+    @param threshold    The largest allowed relative increase, such as 0.1 for 10%.
+
+    @return A list of tuples (name, metric, baseline value, new value) of the regressions.
+    """
+    regressions = []
+    for name, metrics in results.items():
+        before = baseline.get(name)
+        if before is None or 'error' in before:
+            continue
+        if 'error' in metrics:
+            regressions.append((name, 'error', None, metrics['error']))
+            continue
+        for metric in BASELINE_METRICS:
+            old, new = before.get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            spread = max(before.get('spread', {}).get(metric, 0), metrics.get('spread', {}).get(metric, 0))
+            if new > old * (1 + threshold) + spread + NOISE_FLOOR[metric]:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def format_results(results):
+    """! Format the metrics of every case as a table.
+
+    @param results A dictionary of the metrics of each case, as returned by run_benchmark.
+
+    @return The table as a string.
+    """
+    lines = [f'{"case":<40} {"total s":>9} {"initial s":>10} {"chg p50":>9} {"chg p95":>9} {"chg/s":>9} {"msg/s":>10} {"peak KB":>9}']
+    for name, metrics in results.items():
+        if 'error' in metrics:
+            lines.append(f'{name:<40} {metrics["error"]}')
+            continue
+        lines.append(f'{name:<40} {metrics["total_seconds"]:>9.3f} {metrics["initial_seconds"]:>10.3f} '
+                     f'{metrics["change_p50"]:>9.4f} {metrics["change_p95"]:>9.4f} {metrics["changes_per_second"]:>9.1f} '
+                     f'{metrics["messages_per_second"]:>10.0f} {metrics["peak_kb"] if metrics["peak_kb"] is not None else "-":>9}')
+    return '\n'.join(lines) + '\n'
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the routing protocols on generated topologies and compare the results with a baseline.")
+    parser.add_argument("--kinds", nargs="+", choices=TOPOLOGY_KINDS, default=list(TOPOLOGY_KINDS), help="the shapes of the topologies")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000], help="the numbers of nodes")
+    parser.add_argument("--protocols", nargs="+", choices=PROTOCOL_SCRIPTS, default=list(PROTOCOL_SCRIPTS), help="the protocols to run")
+    parser.add_argument("--ls-options", default="", help="extra options of the link state runs, such as \"--engine heap --incremental\"")
+    parser.add_argument("--dv-options", default="", help="extra options of the distance vector runs, such as \"--compact\"")
+    parser.add_argument("--messages", type=int, default=100, help="the number of messages of each workload")
+    parser.add_argument("--changes", type=int, default=20, help="the number of changes of each workload")
+    parser.add_argument("--seed", type=int, default=1, help="the seed of the workload generator")
+    parser.add_argument("--workloads", default="bench", help="the directory the generated workloads are kept in")
+    parser.add_argument("--repeat", type=int, default=5, help="the number of runs of each case, of which the median is kept")
+    parser.add_argument("--timeout", type=float, help="the number of seconds after which a run is stopped")
+    parser.add_argument("--json", metavar="FILE", help="also write the results as JSON")
+    parser.add_argument("--save-baseline", metavar="FILE", help="save the results as a baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="compare the results with a saved baseline and exit with status 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=0.1, help="the relative increase of a metric over the baseline that is a regression")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    options = {'ls': shlex.split(args.ls_options), 'dv': shlex.split(args.dv_options)}
+    cases = []
+    for kind in args.kinds:
+        for size in args.sizes:
+            files = generate_workload(kind, size, args.messages, args.changes, args.seed, args.workloads)
+            for protocol in args.protocols:
+                name = ' '.join([f'{protocol}:{kind}-{size}', *options[protocol]])
+                cases.append((name, protocol, files, options[protocol], args.messages))
+
+    results = run_benchmark(cases, args.repeat, args.timeout)
+    sys.stdout.write(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=1)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as file:
+            json.dump(results, file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare_baseline(results, json.load(file), args.threshold)
+        for name, metric, old, new in regressions:
+            print(f'REGRESSION {name} {metric}: {old} -> {new}')
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,51 @@
+##
+# @file changebatch.py
+
+## Cost in a change file that removes a link
+LINK_REMOVED = -999
+
+
+def batch_changes(changes, batchSize, key=None):
+    """! Split the changes into batches of consecutive changes that are applied before a single recompute.
+
+    @param changes      A list of tuples (nodeId, neighborId, cost) in file order.
+    @param batchSize    The largest number of changes in a batch.
+    @param key          A function of a change, where a new batch starts whenever its value differs from the one of the
+                        first change of the current batch, or None to only split by size.
+
+    @return A generator of lists of changes.
+    """
+    if batchSize < 1:
+        raise ValueError('A batch needs room for at least one change')
+    batch = []
+    for change in changes:
+        if batch and (len(batch) == batchSize or (key is not None and key(change) != key(batch[0]))):
+            yield batch
+            batch = []
+        batch.append(change)
+    if batch:
+        yield batch
+
+
+def coalesce_changes(nodes, changes):
+    """! Collapse the changes of a batch to one net change per link, dropping links that end up as they started.
+
+    Only the last change of a link matters once the batch is applied as a whole, so flaps of the same link collapse into
+    one change, and changes that cancel each other out, such as a removal followed by the old cost, disappear.
+
+    @param nodes    A dictionary of nodes before the batch, where each Node has a dictionary of neighbors and link costs.
+    @param changes  A list of tuples (nodeId, neighborId, cost) in file order, where a cost of LINK_REMOVED removes the link.
+
+    @return A list of tuples (nodeId, neighborId, cost) with one change per link that differs from its current cost,
+      in the order each link first changed.
+    """
+    final = {}
+    for change in changes:
+        nodeId, neighborId, _ = change
+        final[(min(nodeId, neighborId), max(nodeId, neighborId))] = change
+
+    coalesced = []
+    for nodeId, neighborId, cost in final.values():
+        if nodes[nodeId].neighbors.get(neighborId) != (None if cost == LINK_REMOVED else cost):
+            coalesced.append((nodeId, neighborId, cost))
+    return coalesced
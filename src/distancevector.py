@@ -1,6 +1,23 @@
 ##
 # @file distancevector.py
 
+import heapq
+from contextlib import nullcontext
+
+from changebatch import LINK_REMOVED, batch_changes, coalesce_changes
+from dvsim import simulate_routing_tables
+from ecmp import EcmpRoutes, flow_key, format_link_load
+from graph import Graph, csr_bellman_ford
+from ingest import MESSAGE_CHUNK_SIZE, graph_adjacency, read_adjacency, read_changes, read_message_chunks, read_messages, read_topology_graph
+from instrument import count, phase, set_change
+from parallel import bellman_ford_task, keep_pool, map_nodes
+from routecache import RouteCache
+from routewriter import RouteWriter, format_table
+from snapshot import load_distance_vector, save_distance_vector
+
+## Largest number of (source, destination) routes that are kept between topology changes
+PATH_CACHE_SIZE = 1 << 16
+
 class Node:
     """! @brief Defines a node in the network topology.
 
@@ -15,6 +32,8 @@ class Node:
     - remove_neighbor(neighborId): remove the neighbor node with the given id.
     - update_routing_table(destination, nextHop, pathCost): add an element to the routing table dictionary.
     """
+    __slots__ = ('nodeId', 'routingTable', 'neighbors')
+
     def __init__(self, nodeId):
         """! Initializing the Node object.
 
@@ -59,19 +78,22 @@ def read_topology_file(topologyFile):
 
     @param topologyFile the file containing the network topology information.
 
+    @return nodes  A dictionary of nodes, where the key is the node_id and the value is the Node object.
+    """
+    return create_nodes(read_adjacency(topologyFile))
+
+def create_nodes(neighbors):
+    """! Create the nodes of a topology from the neighbors of each node.
+
+    @param neighbors  A dictionary where each key is a nodeId and each value is a dictionary of its neighbors and link costs, which the nodes take over.
+
     @return nodes  A dictionary of nodes, where the key is the node_id and the value is the Node object.
     """
     nodes = {}
-    with open(topologyFile, 'r') as file:
-        for line in file:
-            nodeId, neighborId, cost = map(int, line.strip().split())
-            if nodeId not in nodes:
-                nodes[nodeId] = Node(nodeId)
-            if neighborId not in nodes:
-                nodes[neighborId] = Node(neighborId)
-            nodes[nodeId].add_neighbor(neighborId, cost)
-            nodes[neighborId].add_neighbor(nodeId, cost)
-    return nodes          
+    for nodeId, links in neighbors.items():
+        nodes[nodeId] = Node(nodeId)
+        nodes[nodeId].neighbors = links
+    return nodes
 
 def read_message_file(messageFile):
     """! Read the messages from the given file.
@@ -80,13 +102,7 @@ def read_message_file(messageFile):
 
     @return msgs    A list of messages, where each message is a tuple (srcNodeId, destNodeId, msgText).
     """
-    msgs = []
-    with open(messageFile, 'r') as file:
-        for line in file:
-            srcNodeId, destNodeId, msgText = line.split(maxsplit=2)
-            msgs.append((int(srcNodeId), int(destNodeId), msgText))
-
-    return msgs
+    return read_messages(messageFile)
 
 def read_topology_change_file(changesFile):
     """! Read the topology changes from the given file.
@@ -95,35 +111,73 @@ def read_topology_change_file(changesFile):
 
     @return changes    A list of topology changes, where each change is a tuple (nodeId, neighborId, cost).
     """
-    changes = []
-    with open(changesFile, 'r') as file:
-        for line in file:
-            nodeId, neighborId, cost = map(int, line.split(maxsplit=2))
-            changes.append((int(nodeId), int(neighborId), cost))
-    return changes
-
-def bellman_ford(dst, routers, links):
+    return read_changes(changesFile)
+
+def bellman_ford(dst, routers, links, detectNegativeCycle=False):
     """! Run bellman_ford algorithm to find the distances from one to all other possible nodes with a route.
 
-    
-    @param dst    A nodeId of specific node. 
-    @param routers A list of all nodes in the topology. 
-    @param links  A list of tuples that establish a connection between nodes in the form (nodeId, neighborId, cost).
+    Links are relaxed in the same order as a full pass over links, but the links leaving a node are skipped
+    until the distance of that node changes, since relaxing them again cannot change anything. The passes stop
+    as soon as one of them changes nothing, so the result is identical to running len(routers) - 1 full passes.
+
+    @param dst                  A nodeId of specific node. 
+    @param routers              A list of all nodes in the topology. 
+    @param links                A list of tuples that establish a connection between nodes in the form (nodeId, neighborId, cost),
+                                or a Graph of the topology, in which case routers is taken from the Graph.
+    @param detectNegativeCycle  If True, raise a ValueError when a negative cycle is reachable from dst.
 
     @return distance    A dictionary where each key is a destination node, and each value is a tuple containing the nextHop and pathCost.
     @return nexthop     A dictionary of where each key is a node, and each value is the next hop of the key to the destination node dst. 
     """
+    if isinstance(links, Graph):
+        distance, nexthop = csr_bellman_ford(links, links.index[dst], detectNegativeCycle)
+        nodeIds = links.nodeIds
+        return dict(zip(nodeIds, distance)), {nodeId: (nodeIds[nextHop] if nextHop >= 0 else None) for nodeId, nextHop in zip(nodeIds, nexthop)}
+
     INFINITY = float('inf')
     distance = {r: INFINITY for r in routers}
     nexthop = {r: None for r in routers}
     distance[dst] = 0
 
+    # Group consecutive links that leave the same node, keeping the order of links
+    groups = []
+    for (r1, r2, dist) in links:
+        if groups and groups[-1][0] == r1:
+            groups[-1][1].append((r2, dist))
+        else:
+            groups.append((r1, [(r2, dist)]))
+
+    # The version of a node counts the changes to its distance, and each group remembers the version it was relaxed with
+    version = {r: 0 for r in routers}
+    version[dst] = 1
+    relaxedVersion = [0] * len(groups)
+
+    passes = relaxations = 0
     for _ in range(len(routers) - 1):
-        for (r1, r2, dist) in links:
-            if distance[r1] + dist < distance[r2]:
-                distance[r2] = distance[r1] + dist
-                nexthop[r2] = r1
-    print(nexthop)
+        changed = False
+        passes += 1
+        for i, (r1, neighbors) in enumerate(groups):
+            if relaxedVersion[i] == version[r1]:
+                continue
+            relaxedVersion[i] = version[r1]
+            relaxations += len(neighbors)
+            for (r2, dist) in neighbors:
+                if distance[r1] + dist < distance[r2]:
+                    distance[r2] = distance[r1] + dist
+                    nexthop[r2] = r1
+                    version[r2] += 1
+                    changed = True
+        if not changed:
+            break
+    else:
+        if detectNegativeCycle:
+            for (r1, r2, dist) in links:
+                if distance[r1] + dist < distance[r2]:
+                    raise ValueError(f"Negative cycle reachable from node {dst} through the link {r1} {r2}")
+
+    count('bf_runs')
+    count('bf_passes', passes)
+    count('relaxations', relaxations)
     return distance, nexthop
 
 def update_distance_vector(node, distanceVector, nexthop):
@@ -152,35 +206,142 @@ def update_distance_vector(node, distanceVector, nexthop):
                     nextNode = nexthop[nextNode]
                 node.update_routing_table(destination, nextNode, cost)
         
-def run_bellman_ford(nodes, routers, links):
+def run_bellman_ford(nodes, routers, links, detectNegativeCycle=False, workers=1):
     """! Loop through each node in the topology to run the bellman_form algorithm and update the routing table.
 
-    @param nodes    A dictionary of nodes, where the key is the node_id and the value is the Node object.
-    @param routers  A list of all nodes in the topology.
-    @param links    A list of tuples that establish a connection between nodes in the form (nodeId, neighborId, cost).
+    @param nodes                A dictionary of nodes, where the key is the node_id and the value is the Node object.
+    @param routers              A list of all nodes in the topology.
+    @param links                A list of tuples that establish a connection between nodes in the form (nodeId, neighborId, cost), or a Graph of the topology.
+    @param detectNegativeCycle  If True, raise a ValueError when the topology has a negative cycle.
+    @param workers              The number of worker processes. With more than one, the nodes are split over a process pool
+                                that runs over a Graph of the topology.
 
     @return None
     """
+    if workers > 1:
+        graph = links if isinstance(links, Graph) else Graph.from_nodes(nodes)
+        nodeIds = graph.nodeIds
+        for nodeIndex, distance, nextHop in map_nodes(graph, bellman_ford_task, workers, detectNegativeCycle):
+            node = nodes[nodeIds[nodeIndex]]
+            for destIndex, pathCost in enumerate(distance):
+                if pathCost != float('inf'):
+                    node.update_routing_table(nodeIds[destIndex], nodeIds[nextHop[destIndex]], int(pathCost))
+        return
+
     for nodeId, node in nodes.items():
-        distanceVector, nexthop = bellman_ford(nodeId, routers, links)
+        distanceVector, nexthop = bellman_ford(nodeId, routers, links, detectNegativeCycle)
         nexthop[nodeId] = nodeId
         update_distance_vector(node, distanceVector, nexthop)
         
+class LazyDistanceVector:
+    """! Routes towards a destination that are computed the first time a message is sent to it.
+
+    A single Bellman-Ford run from a destination gives the path cost and next hop of every node towards it, so each
+    message destination costs one run instead of one run per node. The runs are kept in a bounded RouteCache. The
+    path costs are the same as run_bellman_ford, but the nextHop of equal cost routes can differ, since the routes
+    come from the tree of the destination instead of the tree of each node.
+
+    Attributes:
+    - nodes: a dictionary of nodes, where the key is the node_id and the value is the Node object.
+    - compact: whether Bellman-Ford runs over a compact Graph instead of a list of links.
+    - detectNegativeCycle: whether a ValueError is raised when a negative cycle is reachable from a destination.
+    - links: the links or Graph of the current topology, built on first use.
+    - cache: a RouteCache of the tuple (distance, nexthop) of each destination.
+
+    Methods:
+    - get_route(nodeId, destination): get the (nextHop, pathCost) of a node towards a destination.
+    - invalidate(): drop every computed destination after the topology changed.
+    """
+    __slots__ = ('nodes', 'compact', 'detectNegativeCycle', 'links', 'cache')
+
+    def __init__(self, nodes, compact=False, detectNegativeCycle=False, capacity=1024):
+        """! Initializing the LazyDistanceVector object.
+
+        @param nodes                A dictionary of nodes, where the key is the node_id and the value is the Node object.
+        @param compact              If True, run Bellman-Ford over a compact Graph.
+        @param detectNegativeCycle  If True, raise a ValueError when a negative cycle is reachable from a destination.
+        @param capacity             The largest number of destinations that are kept.
+        """
+        self.nodes = nodes
+        self.compact = compact
+        self.detectNegativeCycle = detectNegativeCycle
+        self.links = None
+        self.cache = RouteCache(self.compute_routes, capacity)
+
+    def compute_routes(self, destination):
+        """! Run Bellman-Ford from a destination.
+
+        @param destination  The nodeId of the destination.
+
+        @return A tuple (distance, nexthop) as returned by bellman_ford, where nexthop is the next hop of each node towards the destination.
+        """
+        if self.links is None:
+            self.links = Graph.from_nodes(self.nodes) if self.compact else get_links(self.nodes)
+        return bellman_ford(destination, list(self.nodes.keys()), self.links, self.detectNegativeCycle)
+
+    def get_route(self, nodeId, destination):
+        """! Get the route of a node towards a destination.
+
+        @param nodeId       The nodeId of the node.
+        @param destination  The nodeId of the destination.
+
+        @return A tuple (nextHop, pathCost), or None if the destination is unreachable.
+        """
+        distance, nexthop = self.cache.get(destination)
+        if nodeId == destination:
+            return destination, 0
+        if distance[nodeId] == float('inf'):
+            return None
+        return nexthop[nodeId], distance[nodeId]
+
+    def invalidate(self):
+        """! Drop every computed destination, so that the next routes use the current topology.
+        """
+        self.cache.invalidate()
+        self.links = None
+
+
+def get_tables(nodes):
+    """! Get the rows of the routing table of each node.
+
+    @param nodes    A dictionary of nodes, where the key is the node_id and the value is the Node object.
+
+    @return tables  A generator of tuples (nodeId, rows) in nodeId order, where rows is a list of tuples (dest, nextHop, pathCost) in dest order.
+    """
+    for nodeId, node in sorted(nodes.items()):
+        yield nodeId, [(dest, nextHop, pathCost) for dest, (nextHop, pathCost) in sorted(node.routingTable.items(), key=lambda x: x[0])]
+
+def get_lazy_tables(routes):
+    """! Get the rows of the routing table of each node from lazily computed routes, running Bellman-Ford from every destination.
+
+    @param routes   A LazyDistanceVector of the topology.
+
+    @return tables  A generator of tuples (nodeId, rows) in nodeId order, where rows is a list of tuples (dest, nextHop, pathCost) in dest order.
+    """
+    nodeIds = sorted(routes.nodes)
+    tables = {nodeId: [] for nodeId in nodeIds}
+    for dest in nodeIds:
+        for nodeId in nodeIds:
+            route = routes.get_route(nodeId, dest)
+            if route is not None:
+                tables[nodeId].append((dest, route[0], route[1]))
+    for nodeId in nodeIds:
+        yield nodeId, tables[nodeId]
+
 def write_routing_table(nodes, outputFile):
     """! Write the routing table to the outputFile for each node.
 
-    @param nodes        A dictionary of nodes, where the key is the node_id and the value is the Node object.
-    @param outputFile   A file where all the output results and messages are written to.
+    @param nodes        A dictionary of nodes, where the key is the node_id and the value is the Node object, or a LazyDistanceVector.
+    @param outputFile   An open file where all the output results and messages are written to. A RouteWriter may only write the changed routes.
 
     @return The routing table for each node in the topology written to the outputFile.
     """
-    sortedNodes = dict(sorted(nodes.items()))
-    for nodeId, node in sortedNodes.items():
-        sortedTable = sorted(node.routingTable.items(), key=lambda x: x[0])
-        with open(outputFile, 'a') as f:
-            for dest, (nextHop, pathCost) in sortedTable:
-                f.write(f"{dest} {nextHop} {pathCost}\n")
-            f.write("\n")
+    tables = get_lazy_tables(nodes) if isinstance(nodes, LazyDistanceVector) else get_tables(nodes)
+    if isinstance(outputFile, RouteWriter):
+        outputFile.write_table(tables)
+    else:
+        for _, rows in tables:
+            outputFile.write(format_table(rows))
 
 def get_links(nodes):
     """! Get all links and the costs between nodes.
@@ -195,33 +356,117 @@ def get_links(nodes):
             links.append((nodeId, neighborId, cost))
     return links
 
-def write_messages(nodes, msgs, outputFile):
+def format_route(source, destination, pathCost, hops):
+    """! Format the route of a message.
+
+    @param source       The nodeId of the source node.
+    @param destination  The nodeId of the destination node.
+    @param pathCost     The pathCost from the source to the destination.
+    @param hops         A list of the nodeIds after the source up to the destination, or None if the destination is unreachable.
+
+    @return The output line of a message up to the message text, "from source to destination cost pathCost hops ...".
+    """
+    if hops is None:
+        return f"from {source} to {destination} cost infinite hops unreachable"
+    hopString = "".join([f" {nextHop}" for nextHop in hops])
+    return f"from {source} to {destination} cost {pathCost} hops{hopString} {destination}"
+
+def find_route(nodes, source, destination):
+    """! Find the route of a message by following the next hop of each node, and format it.
+
+    @param nodes        A dictionary of nodes, where the key is the node_id and the value is the Node object, or a LazyDistanceVector.
+    @param source       The nodeId of the source node.
+    @param destination  The nodeId of the destination node.
+
+    @return The output line of a message up to the message text, as returned by format_route.
+    """
+    if isinstance(nodes, LazyDistanceVector):
+        getRoute = nodes.get_route
+    else:
+        getRoute = lambda nodeId, dest: nodes[nodeId].routingTable.get(dest)
+
+    route = getRoute(source, destination)
+    if route is None:
+        return format_route(source, destination, None, None)
+    hops = []
+    nextHop = source
+    while nextHop != destination:
+        nextHop = getRoute(nextHop, destination)[0]
+        hops.append(nextHop)
+    count('path_walk_steps', len(hops))
+    return format_route(source, destination, route[1], hops)
+
+def route_cost(nodes, nodeId, destination):
+    """! Get the path cost of a node towards a destination from the routing tables.
+
+    @param nodes        A dictionary of nodes, where the key is the node_id and the value is the Node object, or a LazyDistanceVector.
+    @param nodeId       The nodeId of the node.
+    @param destination  The nodeId of the destination.
+
+    @return The path cost, or inf if the destination is unreachable.
+    """
+    if isinstance(nodes, LazyDistanceVector):
+        route = nodes.get_route(nodeId, destination)
+    else:
+        route = nodes[nodeId].routingTable.get(destination)
+    return route[1] if route is not None else float('inf')
+
+def find_flow(ecmp, msg):
+    """! Find the route of a message that is spread over the equal cost paths by the hash of its flow, and format it.
+
+    @param ecmp  An EcmpRoutes of the current routing tables.
+    @param msg   A tuple in the form (sourceNode, destinationNode, message).
+
+    @return The output line of a message up to the message text, as returned by format_route.
+    """
+    route = ecmp.route(msg[0], msg[1], flow_key(*msg))
+    if route is None:
+        return format_route(msg[0], msg[1], None, None)
+    return format_route(msg[0], msg[1], route[0], route[1][1:])
+
+def write_messages(nodes, msgs, outputFile, pathCache=None, end=True, ecmp=None):
     """! Write the results from the messages based on the current network topology.
 
-    @param nodes         A dictionary of nodes, where the key is the node_id and the value is the Node object.
+    @param nodes         A dictionary of nodes, where the key is the node_id and the value is the Node object, or a LazyDistanceVector.
     @param msgs          A list containing important items from the message file where each item is a tuple in the form (sourceNode, destinationNode, message).
-    @param outputFile    A file where all the output results and messages are written to.
+    @param outputFile    An open file where all the output results and messages are written to.
+    @param pathCache     A RouteCache of the formatted route of each (source, destination) in the current topology, so that
+                         messages between the same nodes are only routed once.
+    @param end           If True, end the messages with the two blank lines that close the output of a topology.
+    @param ecmp          An EcmpRoutes of the current routing tables that spreads the messages over the equal cost paths,
+                         instead of the routing tables and the pathCache.
 
     @return The results from the messages written to the outputFile.
     """
-    with open(outputFile, 'a') as f:
-        for msg in msgs:
-            if nodes[msg[1]].nodeId not in nodes[msg[0]].routingTable.keys():
-                f.write(f"from {msg[0]} to {msg[1]} cost infinite hops unreachable message {msg[2]}")
-            else:
-                hopString = ""
-                source = msg[0]
-                destination = msg[1]
-                pathCost = nodes[source].routingTable[destination][1]
-                nextHop = source
-                while nextHop != destination:
-                    nextHop = nodes[nextHop].routingTable[destination][0]
-                    hopString = f"{hopString} {nextHop}"
-                hopString = f"{hopString} {nextHop}"
-
-                f.write(f"from {msg[0]} to {msg[1]} cost {pathCost} hops{hopString} message {msg[2]}")
-        f.write("\n")
-        f.write("\n")
+    lines = []
+    for msg in msgs:
+        if ecmp is not None:
+            route = find_flow(ecmp, msg)
+        elif pathCache is not None:
+            route = pathCache.get((msg[0], msg[1]))
+        else:
+            route = find_route(nodes, msg[0], msg[1])
+        lines.append(f"{route} message {msg[2]}")
+    if end:
+        lines.append("\n")
+        lines.append("\n")
+    outputFile.write("".join(lines))
+
+def write_message_file(nodes, messageFile, outputFile, pathCache=None, chunkSize=MESSAGE_CHUNK_SIZE, ecmp=None):
+    """! Stream the messages from the messageFile and write their results one chunk at a time.
+
+    @param nodes         A dictionary of nodes, where the key is the node_id and the value is the Node object, or a LazyDistanceVector.
+    @param messageFile   The filepath of the messages that need to be considered to route to.
+    @param outputFile    An open file where all the output results and messages are written to.
+    @param pathCache     A RouteCache of the formatted route of each (source, destination) in the current topology.
+    @param chunkSize     The number of messages that are read and written at a time.
+    @param ecmp          An EcmpRoutes of the current routing tables that spreads the messages over the equal cost paths.
+
+    @return The results from the messages written to the outputFile, followed by two blank lines.
+    """
+    for msgs in read_message_chunks(messageFile, chunkSize):
+        write_messages(nodes, msgs, outputFile, pathCache, end=False, ecmp=ecmp)
+    outputFile.write("\n\n")
 
 def change_nodes(nodes, change):
     """! Changes the nodes in the topology based on a change from the topology changes file.
@@ -234,52 +479,321 @@ def change_nodes(nodes, change):
     r1 = change[0]
     r2 = change[1]
     pathCost = change[2]
-    if pathCost == -999:
+    if pathCost == LINK_REMOVED:
         nodes[r1].remove_neighbor(r2)
         nodes[r2].remove_neighbor(r1)
     else:
         nodes[r1].add_neighbor(r2, pathCost)
         nodes[r2].add_neighbor(r1, pathCost)
 
-def distanceVector_routing(topologyFile, messageFile, changesFile, outputFile='output.txt'):
-    """! The controller functions which runs the distance vector routing including reading the initial topology, reading messages, and reading changes.
+def advertised_cost(nodes, fromNodeId, toNodeId, destination):
+    """! Get the path cost that a node advertises to a neighbor for a destination, using poison reverse.
+
+    @param nodes        A dictionary of nodes, where the key is the node_id and the value is the Node object.
+    @param fromNodeId   The nodeId of the node sending its distance vector.
+    @param toNodeId     The nodeId of the neighbor receiving the distance vector.
+    @param destination  The nodeId of the destination.
+
+    @return The advertised pathCost, which is infinite if the route goes through the receiving neighbor.
+    """
+    if destination not in nodes[fromNodeId].routingTable:
+        return float('inf')
+    nextHop, pathCost = nodes[fromNodeId].routingTable[destination]
+    if nextHop == toNodeId and destination != fromNodeId:
+        return float('inf')
+    return pathCost
 
-    @param topologyFile    The filepath of the initial topology of the network.
-    @param messageFile     The filepath of the messages that need to be considered to route to. 
-    @param changesFile     The filepath of the changes to add in the network topology.
-    @param outputFile      A filepath where all the output results and messages are written to.
+def poison_routes(nodes, nodeId, neighborId, destination, poisoned):
+    """! Remove the routes to a destination that go over the link from nodeId to neighborId.
+
+    The route of nodeId is removed, followed by the routes of every node whose next hop is a node with a removed route.
+
+    @param nodes        A dictionary of nodes, where the key is the node_id and the value is the Node object.
+    @param nodeId       The nodeId of the node whose route uses the link.
+    @param neighborId   The nodeId of the next hop of nodeId over the link.
+    @param destination  The nodeId of the destination.
+    @param poisoned     A set that the nodeIds of the removed routes are added to.
 
     @return None
     """
-    nodes = read_topology_file(topologyFile)
-    routers = list(nodes.keys())
-    links = get_links(nodes)  
- 
-    open(outputFile, 'w')
-    run_bellman_ford(nodes, routers, links)
-    write_routing_table(nodes, outputFile)
-    msgs = read_message_file(messageFile)
-    write_messages(nodes, msgs, outputFile)
-    changes = read_topology_change_file(changesFile)
-
-    for change in changes:
-        change_nodes(nodes, change)
-        routers = list(nodes.keys())
-        links = get_links(nodes)
-        run_bellman_ford(nodes, routers, links)
-        write_routing_table(nodes, outputFile)
-        write_messages(nodes, msgs, outputFile)
+    stack = [nodeId]
+    poisoned.add(nodeId)
+    while stack:
+        currNodeId = stack.pop()
+        del nodes[currNodeId].routingTable[destination]
+        for otherNodeId in nodes[currNodeId].neighbors:
+            entry = nodes[otherNodeId].routingTable.get(destination)
+            if otherNodeId not in poisoned and entry is not None and entry[0] == currNodeId:
+                poisoned.add(otherNodeId)
+                stack.append(otherNodeId)
+
+def propagate_routes(nodes, destination, heap):
+    """! Send triggered updates for a destination until no routing table changes.
+
+    Each node in the heap has a new route to the destination, which is offered to its neighbors. A neighbor takes the
+    route if it is cheaper than its own, and then triggers an update of its own.
 
-if __name__ == "__main__":
-    import sys
+    @param nodes        A dictionary of nodes, where the key is the node_id and the value is the Node object.
+    @param destination  The nodeId of the destination.
+    @param heap         A list of tuples (pathCost, nodeId) of the nodes whose route changed.
+
+    @return None
+    """
+    heapq.heapify(heap)
+    while heap:
+        pathCost, nodeId = heapq.heappop(heap)
+        if nodes[nodeId].routingTable[destination][1] != pathCost:
+            continue
+        for neighborId, linkCost in nodes[nodeId].neighbors.items():
+            neighborTable = nodes[neighborId].routingTable
+            if neighborId == destination or advertised_cost(nodes, nodeId, neighborId, destination) == float('inf'):
+                continue
+            if destination not in neighborTable or pathCost + linkCost < neighborTable[destination][1]:
+                nodes[neighborId].update_routing_table(destination, nodeId, pathCost + linkCost)
+                heapq.heappush(heap, (pathCost + linkCost, neighborId))
+
+def triggered_update(nodes, change):
+    """! Apply a change to the topology and reconverge the routing tables with triggered updates.
+
+    Only the routes that the changed link invalidates or improves are updated, starting from the current routing
+    tables. Routes that went over a link that got more expensive or was removed are poisoned first, so they cannot
+    count to infinity, and are then rebuilt from the neighbors that still have a valid route. The path costs are the
+    same as a full run_bellman_ford, but the nextHop of equal cost routes can differ.
+
+    @param nodes    A dictionary of nodes, where the key is the node_id and the value is the Node object.
+    @param change   A tuple containing the changes involved in the form with a new link cost between nodes (nodeId, neighbourId, linkCost).
 
-    if len(sys.argv) < 4:
-        print("Usage: python src/distancevector.py <topologyFile> <messageFile> <changesFile> [outputFile]")
-        sys.exit(1)
+    @return None
+    """
+    r1, r2, pathCost = change
+    oldCost = nodes[r1].neighbors.get(r2)
+    change_nodes(nodes, change)
+
+    if pathCost == LINK_REMOVED or (oldCost is not None and pathCost > oldCost):
+        # Poison every route that went over the link
+        poisoned = {}
+        for nodeId, neighborId in ((r1, r2), (r2, r1)):
+            for destination, (nextHop, _) in list(nodes[nodeId].routingTable.items()):
+                if nextHop == neighborId and destination != nodeId:
+                    poison_routes(nodes, nodeId, neighborId, destination, poisoned.setdefault(destination, set()))
+
+        # Rebuild the poisoned routes from the neighbors that still have a route
+        for destination, poisonedNodes in poisoned.items():
+            heap = []
+            for nodeId in poisonedNodes:
+                best = None
+                for neighborId, linkCost in nodes[nodeId].neighbors.items():
+                    if neighborId not in poisonedNodes:
+                        cost = advertised_cost(nodes, neighborId, nodeId, destination) + linkCost
+                        if cost != float('inf') and (best is None or (cost, neighborId) < best):
+                            best = (cost, neighborId)
+                if best is not None:
+                    nodes[nodeId].update_routing_table(destination, best[1], best[0])
+                    heap.append((best[0], nodeId))
+            propagate_routes(nodes, destination, heap)
+
+    elif oldCost is None or pathCost < oldCost:
+        # Offer the routes of each end of the link to the other end
+        updates = {}
+        for nodeId, neighborId in ((r1, r2), (r2, r1)):
+            for destination in list(nodes[neighborId].routingTable):
+                cost = advertised_cost(nodes, neighborId, nodeId, destination) + pathCost
+                table = nodes[nodeId].routingTable
+                if cost != float('inf') and (destination not in table or cost < table[destination][1]):
+                    nodes[nodeId].update_routing_table(destination, neighborId, cost)
+                    updates.setdefault(destination, []).append((cost, nodeId))
+        for destination, heap in updates.items():
+            propagate_routes(nodes, destination, heap)
+
+def distanceVector_routing(topologyFile, messageFile, changesFile, outputFile='output.txt', detectNegativeCycle=False, triggered=False, compact=False,
+                           workers=1, delta=False, lazy=False, fullTables=False, cacheSize=1024, chunkSize=MESSAGE_CHUNK_SIZE,
+                           saveSnapshot=None, loadSnapshot=None, batchSize=1, simulate=False, ecmp=False, linkLoad=None):
+    """! The controller functions which runs the distance vector routing including reading the initial topology, reading messages, and reading changes.
 
-    topologyFile = sys.argv[1]
-    messageFile = sys.argv[2]
-    changesFile = sys.argv[3]
-    outputFile = sys.argv[4] if len(sys.argv) >= 5 else "output.txt"
+    When statistics are enabled in the instrument module, the parse, compute, tables and messages phases of the initial
+    topology and of every change are recorded.
+
+    @param topologyFile         The filepath of the initial topology of the network.
+    @param messageFile          The filepath of the messages that need to be considered to route to. 
+    @param changesFile          The filepath of the changes to add in the network topology.
+    @param outputFile           A filepath where all the output results and messages are written to.
+    @param detectNegativeCycle  If True, stop with a ValueError when the topology has a negative cycle.
+    @param triggered            If True, reconverge after each change with triggered updates instead of rerunning run_bellman_ford.
+    @param compact              If True, run Bellman-Ford over a compact Graph instead of a list of links.
+    @param workers              The number of worker processes used to run Bellman-Ford.
+    @param delta                If True, write only the routes that changed after each change instead of every routing table.
+    @param lazy                 If True, run Bellman-Ford only from the destinations of the messages, and skip the routing tables.
+    @param fullTables           If True in lazy mode, still write the routing table of every node.
+    @param cacheSize            In lazy mode, the largest number of destinations whose routes are kept.
+    @param chunkSize            The number of messages that are read and written at a time.
+    @param saveSnapshot         The path of a snapshot file the routing tables of the initial topology are saved to.
+    @param loadSnapshot         The path of a snapshot file the routing tables of the initial topology are loaded from instead of computed.
+    @param batchSize            The number of consecutive changes that are coalesced and applied before the routing tables are
+                                updated and written once, where 1 writes the output after every change.
+    @param simulate             If True, fill the routing tables by simulating routers that exchange distance vectors in
+                                rounds, split over the worker processes (src/dvsim.py), instead of running Bellman-Ford.
+    @param ecmp                 If True, spread the messages over every equal cost path by the hash of their flow.
+    @param linkLoad             With ecmp, the path of a file the number of messages sent over each link is written to,
+                                one block per topology.
 
-    distanceVector_routing(topologyFile, messageFile, changesFile, outputFile)
\ No newline at end of file
+    @return None
+    """
+    if simulate and (lazy or triggered):
+        raise ValueError("The simulation recomputes every routing table and cannot be combined with the lazy mode or triggered updates")
+    if lazy and (triggered or workers > 1):
+        raise ValueError("The lazy mode runs one destination at a time and cannot be combined with triggered updates or workers")
+    if lazy and (saveSnapshot or loadSnapshot):
+        raise ValueError("The lazy mode has no routing tables to save or load")
+    if linkLoad and not ecmp:
+        raise ValueError("The link load is only counted in the equal cost multipath mode")
+
+    # The compact mode reads the topology straight into the Graph that Bellman-Ford runs over, and builds the nodes that
+    # keep the routing tables from it
+    with phase('parse'):
+        if compact and not lazy:
+            graph = read_topology_graph(topologyFile)
+            nodes = create_nodes(graph_adjacency(graph))
+        else:
+            graph = None
+            nodes = read_topology_file(topologyFile)
+
+    if lazy:
+        with phase('compute'):
+            routes = LazyDistanceVector(nodes, compact, detectNegativeCycle, cacheSize)
+        pathCache = RouteCache(lambda pair: find_route(routes, pair[0], pair[1]), PATH_CACHE_SIZE)
+        ecmpRoutes = EcmpRoutes(nodes, lambda nodeId, dest: route_cost(routes, nodeId, dest)) if ecmp else None
+        with RouteWriter(outputFile, delta) as f, open(linkLoad, 'w') if linkLoad else nullcontext() as loadFile:
+            if fullTables:
+                with phase('tables'):
+                    write_routing_table(routes, f)
+            with phase('messages'):
+                write_message_file(routes, messageFile, f, pathCache, chunkSize, ecmpRoutes)
+            if loadFile is not None:
+                loadFile.write(format_link_load(nodes, ecmpRoutes.take_load()))
+            with phase('parse'):
+                changes = read_topology_change_file(changesFile)
+
+            for batchIndex, batch in enumerate(batch_changes(changes, batchSize), start=1):
+                set_change(batchIndex)
+                with phase('compute'):
+                    for change in (coalesce_changes(nodes, batch) if batchSize > 1 else batch):
+                        change_nodes(nodes, change)
+                    routes.invalidate()
+                pathCache.invalidate()
+                if ecmpRoutes is not None:
+                    ecmpRoutes.invalidate()
+                if fullTables:
+                    with phase('tables'):
+                        write_routing_table(routes, f)
+                with phase('messages'):
+                    write_message_file(routes, messageFile, f, pathCache, chunkSize, ecmpRoutes)
+                if loadFile is not None:
+                    loadFile.write(format_link_load(nodes, ecmpRoutes.take_load()))
+        return
+
+    routers = list(nodes.keys())
+    links = graph if compact else get_links(nodes)
+    pathCache = RouteCache(lambda pair: find_route(nodes, pair[0], pair[1]), PATH_CACHE_SIZE)
+    ecmpRoutes = EcmpRoutes(nodes, lambda nodeId, dest: route_cost(nodes, nodeId, dest)) if ecmp else None
+
+    with RouteWriter(outputFile, delta) as f, open(linkLoad, 'w') if linkLoad else nullcontext() as loadFile, keep_pool(workers):
+        with phase('compute'):
+            if graph is None and (loadSnapshot or saveSnapshot):
+                graph = Graph.from_nodes(nodes)
+            if loadSnapshot:
+                load_distance_vector(loadSnapshot, graph, nodes)
+            elif simulate:
+                simulate_routing_tables(nodes, workers)
+            else:
+                run_bellman_ford(nodes, routers, links, detectNegativeCycle, workers)
+            if saveSnapshot:
+                save_distance_vector(saveSnapshot, graph, nodes)
+        with phase('tables'):
+            write_routing_table(nodes, f)
+        with phase('messages'):
+            write_message_file(nodes, messageFile, f, pathCache, chunkSize, ecmpRoutes)
+        if loadFile is not None:
+            loadFile.write(format_link_load(nodes, ecmpRoutes.take_load()))
+        with phase('parse'):
+            changes = read_topology_change_file(changesFile)
+
+        for batchIndex, batch in enumerate(batch_changes(changes, batchSize), start=1):
+            set_change(batchIndex)
+            with phase('compute'):
+                # A batch whose changes cancel each other out leaves the routing tables as they are
+                if batchSize > 1:
+                    batch = coalesce_changes(nodes, batch)
+                if triggered:
+                    for change in batch:
+                        triggered_update(nodes, change)
+                elif batch:
+                    for change in batch:
+                        change_nodes(nodes, change)
+                    if simulate:
+                        simulate_routing_tables(nodes, workers)
+                    else:
+                        routers = list(nodes.keys())
+                        links = Graph.from_nodes(nodes) if compact else get_links(nodes)
+                        run_bellman_ford(nodes, routers, links, detectNegativeCycle, workers)
+            pathCache.invalidate()
+            if ecmpRoutes is not None:
+                ecmpRoutes.invalidate()
+            with phase('tables'):
+                write_routing_table(nodes, f)
+            with phase('messages'):
+                write_message_file(nodes, messageFile, f, pathCache, chunkSize, ecmpRoutes)
+            if loadFile is not None:
+                loadFile.write(format_link_load(nodes, ecmpRoutes.take_load()))
+
+if __name__ == "__main__":
+    import argparse
+
+    import instrument
+
+    parser = argparse.ArgumentParser(description="Run the distance vector routing protocol.")
+    parser.add_argument("topologyFile", help="The filepath of the initial topology of the network.")
+    parser.add_argument("messageFile", help="The filepath of the messages that need to be considered to route to.")
+    parser.add_argument("changesFile", help="The filepath of the changes to add in the network topology.")
+    parser.add_argument("outputFile", nargs="?", default="output.txt", help="A filepath where all the output results and messages are written to.")
+    parser.add_argument("--detect-negative-cycles", action="store_true", help="Stop with an error when the topology has a negative cycle.")
+    parser.add_argument("--triggered", action="store_true", help="Reconverge after each change with triggered updates and poison reverse.")
+    parser.add_argument("--compact", action="store_true", help="Run Bellman-Ford over a compact CSR graph instead of a list of links.")
+    parser.add_argument("--workers", type=int, default=1, help="The number of worker processes used to run Bellman-Ford.")
+    parser.add_argument("--delta", action="store_true", help="Write only the routes that changed after each change.")
+    parser.add_argument("--lazy", action="store_true", help="Run Bellman-Ford only from the destinations of the messages.")
+    parser.add_argument("--full-tables", action="store_true", help="In lazy mode, still write the routing table of every node.")
+    parser.add_argument("--cache-size", type=int, default=1024, help="In lazy mode, the largest number of destinations whose routes are kept.")
+    parser.add_argument("--chunk-size", type=int, default=MESSAGE_CHUNK_SIZE, help="The number of messages that are read and written at a time.")
+    parser.add_argument("--batch-size", type=int, default=1, help="The number of consecutive changes that are coalesced and applied before one recompute.")
+    parser.add_argument("--simulate", action="store_true", help="Fill the routing tables by simulating routers that exchange distance vectors in rounds, split over --workers processes.")
+    parser.add_argument("--ecmp", action="store_true", help="Spread the messages over every equal cost path by the hash of their flow.")
+    parser.add_argument("--link-load", metavar="FILE", help="With --ecmp, write the number of messages sent over each link after each topology.")
+    parser.add_argument("--stats", choices=instrument.REPORT_FORMATS, help="Record the time of each phase and counters of the work done, and write them as JSON lines or a table.")
+    parser.add_argument("--stats-file", metavar="FILE", help="Write the statistics to a file instead of standard error.")
+    parser.add_argument("--save-snapshot", metavar="FILE", help="Save the routing tables of the initial topology to a snapshot file.")
+    parser.add_argument("--load-snapshot", metavar="FILE", help="Load the routing tables of the initial topology from a snapshot file instead of computing them.")
+    args = parser.parse_args()
+    if args.lazy and (args.triggered or args.workers > 1):
+        parser.error("--lazy cannot be combined with --triggered or --workers")
+    if args.full_tables and not args.lazy:
+        parser.error("--full-tables only applies with --lazy")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be at least 1")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.lazy and (args.save_snapshot or args.load_snapshot):
+        parser.error("--lazy cannot be combined with --save-snapshot or --load-snapshot")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.simulate and (args.lazy or args.triggered):
+        parser.error("--simulate cannot be combined with --lazy or --triggered")
+    if args.link_load and not args.ecmp:
+        parser.error("--link-load only applies with --ecmp")
+
+    if args.stats:
+        instrument.enable()
+    distanceVector_routing(args.topologyFile, args.messageFile, args.changesFile, args.outputFile, args.detect_negative_cycles, args.triggered, args.compact,
+                           args.workers, args.delta, args.lazy, args.full_tables, args.cache_size, args.chunk_size,
+                           args.save_snapshot, args.load_snapshot, args.batch_size, args.simulate, args.ecmp, args.link_load)
+    if args.stats:
+        instrument.write_report(args.stats, args.stats_file)
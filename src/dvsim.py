@@ -0,0 +1,454 @@
+##
+# @file dvsim.py
+
+import multiprocessing
+import queue
+import threading
+from array import array
+from multiprocessing import shared_memory
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from graph import Graph
+from instrument import count
+
+## Number of destinations whose distance vectors are exchanged at a time
+DEFAULT_BLOCK_SIZE = 256
+
+## Largest number of (link, destination) values a worker relaxes at once with NumPy
+RELAX_CHUNK = 1 << 22
+
+
+def split_routers(graph, workers):
+    """! Split the routers into contiguous ranges of about the same number of routers and links.
+
+    @param graph    A Graph of the network topology.
+    @param workers  The number of worker processes.
+
+    @return A list of tuples (lo, hi) of router index ranges, one per worker, some of which can be empty.
+    """
+    size, offsets = len(graph), graph.offsets
+    total = size + offsets[size]
+    ranges = []
+    lo = 0
+    for worker in range(1, workers + 1):
+        hi = lo
+        while hi < size and hi + offsets[hi] < total * worker / workers:
+            hi += 1
+        if worker == workers:
+            hi = size
+        ranges.append((lo, hi))
+        lo = hi
+    return ranges
+
+
+def local_links(graph, lo, hi):
+    """! Get the links of a range of routers, with the links of each router sorted by the nodeId of the neighbor.
+
+    The sorting makes the next hop of equal cost routes the neighbor with the smallest nodeId, whatever the order of
+    the topology file.
+
+    @param graph    A Graph of the network topology.
+    @param lo       The index of the first router.
+    @param hi       The index after the last router.
+
+    @return A tuple (offsets, targets, costs) of arrays, where offsets start at 0 for router lo.
+    """
+    nodeIds, offsets = graph.nodeIds, graph.offsets
+    localOffsets, targets, costs = array('q', [0]), array('i'), array('d')
+    for routerIndex in range(lo, hi):
+        start, end = offsets[routerIndex], offsets[routerIndex + 1]
+        links = sorted(zip(graph.targets[start:end], graph.costs[start:end]), key=lambda link: nodeIds[link[0]])
+        targets.extend(target for target, _ in links)
+        costs.extend(cost for _, cost in links)
+        localOffsets.append(len(targets))
+    return localOffsets, targets, costs
+
+
+class RouterSet:
+    """! The routers one worker simulates.
+
+    Each round, every router takes the smallest link cost plus advertised path cost over its neighbors, from the vectors
+    its neighbors advertised in the previous round, and advertises its own vector if it changed. The vectors of a round
+    are rows of blockSize path costs, one row per router, in a buffer every worker reads; each worker only writes the
+    rows of its own routers. With NumPy the buffers are 2-D arrays, otherwise flat memoryviews.
+
+    Attributes:
+    - lo: the index of the first router
+    - hi: the index after the last router
+    - blockSize: the number of path costs in the row of a router
+    - offsets: an array where the links of router lo + i are at positions offsets[i] to offsets[i+1]
+    - targets: an array of the index of the neighbor at each position
+    - costs: an array of the cost of the link at each position
+    - buckets: with NumPy, a list of tuples (rows, targets, costs) of routers with the same number of links, where
+      targets and costs are matrices of a row of links per router
+    - degrees: the number of links of each router
+    - changed: a list of one bit mask per router, with bit r set when the vector of the router changed in round r
+    - entries: the number of changed vector entries sent to neighbors
+
+    Methods:
+    - reset(vectors, block): start a block of destinations
+    - relax(old, new, block, roundIndex): run one round, and return the number of routers whose vector changed
+    - routes(vectors, block): the path costs and next hops of the routers once the vectors converged
+    """
+    __slots__ = ('lo', 'hi', 'blockSize', 'offsets', 'targets', 'costs', 'buckets', 'degrees', 'changed', 'entries')
+
+    def __init__(self, lo, hi, offsets, targets, costs, blockSize):
+        """! Initializing the RouterSet object.
+
+        @param lo           The index of the first router.
+        @param hi           The index after the last router.
+        @param offsets      The offsets of the links of each router, starting at 0.
+        @param targets      The index of the neighbor of each link.
+        @param costs        The cost of each link.
+        @param blockSize    The number of path costs in the row of a router.
+        """
+        self.lo = lo
+        self.hi = hi
+        self.blockSize = blockSize
+        self.offsets = offsets
+        self.targets = targets
+        self.costs = costs
+        # Every router advertises its own vector once before the first round
+        self.changed = [1] * (hi - lo)
+        self.entries = 0
+        self.buckets = []
+        self.degrees = [offsets[row + 1] - offsets[row] for row in range(hi - lo)]
+        if np is None:
+            return
+
+        # Routers with the same number of links are relaxed together as dense matrices, a slice at a time
+        degrees = np.array(self.degrees, dtype=np.int64)
+        starts = np.array(offsets[:-1], dtype=np.int64)
+        allTargets = np.array(targets, dtype=np.int64)
+        allCosts = np.array(costs, dtype=np.float64)
+        self.degrees = degrees
+        for degree in np.unique(degrees[degrees > 0]).tolist():
+            rows = np.flatnonzero(degrees == degree)
+            step = max(1, RELAX_CHUNK // (degree * blockSize))
+            for first in range(0, len(rows), step):
+                sliceRows = rows[first:first + step]
+                positions = starts[sliceRows][:, None] + np.arange(degree)
+                self.buckets.append((sliceRows, allTargets[positions], allCosts[positions]))
+
+    def reset(self, vectors, block):
+        """! Set the vectors of the routers to the start of a block: 0 to themselves and inf to everything else.
+
+        @param vectors  The buffer of the vectors of the first round.
+        @param block    A list of the destination indexes of the block.
+        """
+        width = len(block)
+        if np is not None:
+            vectors[self.lo:self.hi, :width] = np.inf
+        else:
+            infinite = array('d', [float('inf')]) * width
+            for routerIndex in range(self.lo, self.hi):
+                vectors[routerIndex * self.blockSize:routerIndex * self.blockSize + width] = infinite
+        for j, destIndex in enumerate(block):
+            if self.lo <= destIndex < self.hi:
+                if np is not None:
+                    vectors[destIndex, j] = 0.0
+                else:
+                    vectors[destIndex * self.blockSize + j] = 0.0
+
+    def relax(self, old, new, block, roundIndex):
+        """! Run one round: compute the vector of every router from the vectors its neighbors advertised last round.
+
+        @param old          The buffer of the vectors of the previous round, which is only read.
+        @param new          The buffer the vectors of this round are written to, in the rows of these routers.
+        @param block        A list of the destination indexes of the block.
+        @param roundIndex   The number of the round, starting at 1.
+
+        @return The number of routers whose vector changed.
+        """
+        width = len(block)
+        changedRouters = 0
+        if np is None:
+            INFINITY = float('inf')
+            offsets, targets, costs, stride = self.offsets, self.targets, self.costs, self.blockSize
+            for row in range(self.hi - self.lo):
+                routerIndex = self.lo + row
+                base = routerIndex * stride
+                changedEntries = 0
+                for j, destIndex in enumerate(block):
+                    best = 0.0 if destIndex == routerIndex else INFINITY
+                    for position in range(offsets[row], offsets[row + 1]):
+                        pathCost = costs[position] + old[targets[position] * stride + j]
+                        if pathCost < best:
+                            best = pathCost
+                    if best != old[base + j]:
+                        changedEntries += 1
+                    new[base + j] = best
+                if changedEntries:
+                    changedRouters += 1
+                    self.changed[row] |= 1 << roundIndex
+                    self.entries += changedEntries * (offsets[row + 1] - offsets[row])
+            return changedRouters
+
+        best = np.full((self.hi - self.lo, width), np.inf)
+        for rows, targets, costs in self.buckets:
+            best[rows] = (old[targets, :width] + costs[:, :, None]).min(axis=1)
+        for j, destIndex in enumerate(block):
+            if self.lo <= destIndex < self.hi:
+                best[destIndex - self.lo, j] = 0.0
+        changedEntries = (best != old[self.lo:self.hi, :width]).sum(axis=1)
+        new[self.lo:self.hi, :width] = best
+        for row in np.flatnonzero(changedEntries).tolist():
+            self.changed[row] |= 1 << roundIndex
+        self.entries += int((changedEntries * self.degrees).sum())
+        return int(np.count_nonzero(changedEntries))
+
+    def routes(self, vectors, block):
+        """! Get the path costs and next hops of the routers from the converged vectors of a block.
+
+        The next hop is the neighbor whose link cost plus advertised path cost is the smallest, with ties broken on the
+        smaller nodeId.
+
+        @param vectors  The buffer of the converged vectors.
+        @param block    A list of the destination indexes of the block.
+
+        @return A tuple (costs, hops) of an array('d') of path costs and an array('i') of next hop indexes, with -1 for
+          unreachable destinations, with a row of len(block) values per router.
+        """
+        width = len(block)
+        if np is None:
+            INFINITY = float('inf')
+            offsets, targets, costs, stride = self.offsets, self.targets, self.costs, self.blockSize
+            pathCosts, hops = array('d'), array('i')
+            for row in range(self.hi - self.lo):
+                routerIndex = self.lo + row
+                for j, destIndex in enumerate(block):
+                    pathCost = vectors[routerIndex * stride + j]
+                    hop = -1
+                    if destIndex == routerIndex:
+                        hop = routerIndex
+                    elif pathCost != INFINITY:
+                        for position in range(offsets[row], offsets[row + 1]):
+                            if costs[position] + vectors[targets[position] * stride + j] == pathCost:
+                                hop = targets[position]
+                                break
+                    pathCosts.append(pathCost)
+                    hops.append(hop)
+            return pathCosts, hops
+
+        pathCosts = np.array(vectors[self.lo:self.hi, :width])
+        hops = np.full((self.hi - self.lo, width), -1, dtype=np.int32)
+        for rows, targets, costs in self.buckets:
+            # The first link that matches the path cost is the one to the smallest nodeId
+            first = ((vectors[targets, :width] + costs[:, :, None]) == pathCosts[rows][:, None, :]).argmax(axis=1)
+            hops[rows] = np.take_along_axis(targets, first, axis=1)
+        hops[pathCosts == np.inf] = -1
+        for j, destIndex in enumerate(block):
+            if self.lo <= destIndex < self.hi:
+                hops[destIndex - self.lo, j] = destIndex
+        return array('d', pathCosts.tobytes()), array('i', hops.tobytes())
+
+
+def open_buffers(names, size, blockSize):
+    """! Attach to the shared memory of the vector buffers and the changed counts.
+
+    @param names        The names of the two vector buffers and of the changed counts.
+    @param size         The number of routers.
+    @param blockSize    The number of path costs in the row of a router.
+
+    @return A tuple (memories, buffers, counts) of the SharedMemory objects, the two vector buffers and a memoryview of
+      the changed counts.
+    """
+    memories = [shared_memory.SharedMemory(name=name) for name in names]
+    if np is not None:
+        buffers = [np.ndarray((size, blockSize), dtype=np.float64, buffer=memory.buf) for memory in memories[:2]]
+    else:
+        buffers = [memory.buf.cast('d') for memory in memories[:2]]
+    return memories, buffers, memories[2].buf.cast('q')
+
+
+def router_worker(workerIndex, workers, routerSet, size, destinations, names, barrier, results, tables):
+    """! Simulate a set of routers, exchanging distance vectors with the other workers until every block converged.
+
+    Every round, each worker writes the new vectors of its routers to one buffer while reading the other one, and the
+    number of routers it changed to its slot of the changed counts, then waits at the barrier. The buffers swap roles
+    every round, so no worker writes a buffer another one is still reading. The counts alternate between two sets of
+    slots for the same reason. A block ends after the first round in which no vector changed anywhere.
+
+    @param workerIndex  The index of the worker.
+    @param workers      The number of workers.
+    @param routerSet    The RouterSet of the routers of this worker.
+    @param size         The number of routers.
+    @param destinations A list of the destination indexes, simulated blockSize at a time.
+    @param names        The names of the shared memory of the two vector buffers and of the changed counts.
+    @param barrier      The barrier shared by the workers.
+    @param results      The queue the results are put on: ('block', blockIndex, lo, costs, hops) per block when tables
+                        is True, then ('done', workerIndex, changed, entries, rounds), or ('error', message).
+    @param tables       If True, send the path costs and next hops of every block.
+    """
+    memories, buffers, counts = open_buffers(names, size, routerSet.blockSize)
+    try:
+        rounds = []
+        for blockIndex, start in enumerate(range(0, len(destinations), routerSet.blockSize)):
+            block = destinations[start:start + routerSet.blockSize]
+            routerSet.reset(buffers[0], block)
+            barrier.wait()
+            roundIndex, current = 0, 0
+            while True:
+                roundIndex += 1
+                if roundIndex > size + 1:
+                    raise ValueError('The distance vectors do not converge, the topology has a negative cycle')
+                slot = (roundIndex % 2) * workers
+                counts[slot + workerIndex] = routerSet.relax(buffers[current], buffers[1 - current], block, roundIndex)
+                barrier.wait()
+                current = 1 - current
+                if sum(counts[slot:slot + workers]) == 0:
+                    break
+            rounds.append(roundIndex - 1)
+            if tables:
+                results.put(('block', blockIndex, routerSet.lo) + routerSet.routes(buffers[current], block))
+            # Nobody starts the next block while another worker still reads the vectors of this one
+            barrier.wait()
+        results.put(('done', workerIndex, routerSet.changed, routerSet.entries, rounds))
+    except threading.BrokenBarrierError:
+        results.put(('error', 'another worker stopped'))
+    except Exception as error:
+        barrier.abort()
+        results.put(('error', str(error)))
+    finally:
+        del buffers, counts
+        for memory in memories:
+            memory.close()
+
+
+def simulate_distance_vector(graph, workers=1, blockSize=DEFAULT_BLOCK_SIZE, destinations=None, onBlock=None):
+    """! Run the distance vector protocol as routers that exchange their vectors in synchronous rounds.
+
+    The routers are split over worker processes that share the vectors of each round through shared memory, and
+    a round ends at a barrier. Each destination converges on its own, so the destinations are simulated blockSize at a
+    time, which bounds the shared memory to two buffers of routers x blockSize path costs. A router that changed in a
+    round sends its vector to every neighbor, so the messages are counted per round over all blocks, as if every
+    destination were simulated at once.
+
+    @param graph        A Graph of the network topology.
+    @param workers      The number of worker processes, where 1 runs the routers in this process.
+    @param blockSize    The number of destinations simulated at a time.
+    @param destinations A list of destination indexes, or None for every router.
+    @param onBlock      A function of (block, lo, costs, hops) called with the converged path costs and next hop indexes
+                        of each block and range of routers starting at index lo, with a row of len(block) values per
+                        router, or None to skip them.
+
+    @return A dictionary with the number of routers, directed links, destinations and blocks, the rounds to converge,
+      the vector messages sent to neighbors and the changed vector entries sent to neighbors.
+    """
+    if workers < 1 or blockSize < 1:
+        raise ValueError('The simulation needs at least one worker and one destination per block')
+    size = len(graph)
+    destinations = list(range(size)) if destinations is None else list(destinations)
+    blockSize = max(1, min(blockSize, len(destinations)))
+    ranges = split_routers(graph, workers)
+
+    memories = [shared_memory.SharedMemory(create=True, size=max(8, size * blockSize * 8)) for _ in range(2)]
+    memories.append(shared_memory.SharedMemory(create=True, size=2 * workers * 8))
+    names = [memory.name for memory in memories]
+    blocks = {}
+    done = []
+    try:
+        routerSets = [RouterSet(lo, hi, *local_links(graph, lo, hi), blockSize) for lo, hi in ranges]
+        if workers == 1:
+            results = queue.Queue()
+            router_worker(0, 1, routerSets[0], size, destinations, names, threading.Barrier(1), results, onBlock is not None)
+            processes = []
+        else:
+            context = multiprocessing.get_context()
+            barrier = context.Barrier(workers)
+            results = context.Queue()
+            processes = [context.Process(target=router_worker, args=(i, workers, routerSets[i], size, destinations, names, barrier,
+                                                                     results, onBlock is not None), daemon=True)
+                         for i in range(workers)]
+            for process in processes:
+                process.start()
+
+        error = None
+        while len(done) < workers and error is None:
+            message = results.get()
+            if message[0] == 'error':
+                error = message[1]
+            elif message[0] == 'done':
+                done.append(message)
+            elif onBlock is not None:
+                _, blockIndex, lo, costs, hops = message
+                onBlock(destinations[blockIndex * blockSize:(blockIndex + 1) * blockSize], lo, costs, hops)
+        for process in processes:
+            if error is not None:
+                process.terminate()
+            process.join()
+        if error is not None:
+            raise ValueError(error)
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+
+    messages = 0
+    for _, workerIndex, changed, _, _ in done:
+        lo, hi = ranges[workerIndex]
+        offsets = graph.offsets
+        messages += sum(bin(mask).count('1') * (offsets[lo + i + 1] - offsets[lo + i]) for i, mask in enumerate(changed))
+    stats = {'routers': size, 'links': len(graph.targets), 'destinations': len(destinations),
+             'blocks': len(done[0][4]), 'rounds': max(done[0][4], default=0), 'messages': messages,
+             'entries': sum(message[3] for message in done)}
+    count('dv_rounds', stats['rounds'])
+    count('dv_messages', messages)
+    return stats
+
+
+def simulate_routing_tables(nodes, workers=1, blockSize=DEFAULT_BLOCK_SIZE):
+    """! Fill the routing table of every node by simulating the distance vector protocol.
+
+    @param nodes        A dictionary of distance vector nodes, whose routing tables are updated.
+    @param workers      The number of worker processes.
+    @param blockSize    The number of destinations simulated at a time.
+
+    @return The statistics of the simulation, as returned by simulate_distance_vector.
+    """
+    graph = Graph.from_nodes(nodes)
+    nodeIds = graph.nodeIds
+
+    def update_tables(block, lo, costs, hops):
+        width = len(block)
+        for position in range(len(costs)):
+            pathCost = costs[position]
+            if pathCost != float('inf'):
+                row, j = divmod(position, width)
+                nodes[nodeIds[lo + row]].update_routing_table(nodeIds[block[j]], nodeIds[hops[position]], int(pathCost))
+
+    return simulate_distance_vector(graph, workers, blockSize, None, update_tables)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import random
+    import time
+
+    from ingest import read_topology_graph
+
+    parser = argparse.ArgumentParser(description="Simulate the distance vector protocol as routers exchanging vectors in rounds, and report its convergence.")
+    parser.add_argument("topologyFile", help="the file containing the network topology information")
+    parser.add_argument("--workers", type=int, default=1, help="the number of worker processes the routers are split over")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="the number of destinations simulated at a time")
+    parser.add_argument("--destinations", type=int, help="simulate only this many destinations, picked at random, to estimate the convergence of a large topology")
+    parser.add_argument("--seed", type=int, default=1, help="the seed of the random pick of destinations")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.block_size < 1:
+        parser.error("--block-size must be at least 1")
+
+    graph = read_topology_graph(args.topologyFile)
+    destinations = None
+    if args.destinations is not None:
+        destinations = sorted(random.Random(args.seed).sample(range(len(graph)), min(args.destinations, len(graph))))
+    start = time.perf_counter()
+    stats = simulate_distance_vector(graph, args.workers, args.block_size, destinations)
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    print(json.dumps(stats))
@@ -0,0 +1,187 @@
+##
+# @file ecmp.py
+
+import zlib
+
+from instrument import count
+from lfa import link_key
+from routecache import RouteCache
+
+## Largest number of (nodeId, dstNodeId) next hop sets that are kept between topology changes
+ECMP_CACHE_SIZE = 1 << 16
+
+
+def flow_key(srcNodeId, dstNodeId, msgText):
+    """! Get the key of the flow a message belongs to.
+
+    @param srcNodeId    The nodeId of the source node.
+    @param dstNodeId    The nodeId of the destination node.
+    @param msgText      The text of the message.
+
+    @return The key as bytes.
+    """
+    return f'{srcNodeId} {dstNodeId} {msgText}'.encode()
+
+
+def flow_hash(flowKey, nodeId):
+    """! Hash a flow at one router.
+
+    The hash is a CRC-32 of the flow key, so the same message takes the same path in every run and every process. It
+    is seeded with the nodeId of the router, so that consecutive routers do not all split the flows the same way.
+
+    @param flowKey  The key of the flow, as returned by flow_key.
+    @param nodeId   The nodeId of the router that picks the next hop.
+
+    @return An unsigned 32 bit hash.
+    """
+    return zlib.crc32(flowKey, nodeId & 0xFFFFFFFF)
+
+
+class EcmpRoutes:
+    """! Every equal cost next hop of each node towards each destination, and a walk that spreads flows over them.
+
+    A neighbor N of a node S is an equal cost next hop towards a destination D when cost(S, N) + d(N, D) == d(S, D).
+    The sets follow from the path costs the protocol already has, whichever single next hop it picked. Each set is kept
+    as a bitmask over the neighbors of the node in nodeId order, computed the first time a walk needs it.
+
+    Attributes:
+    - nodes: a dictionary of nodes, where each Node has a dictionary of neighbors and link costs
+    - pathCost: a function of (nodeId, dstNodeId) that returns the path cost, or inf if the destination is unreachable
+    - neighbors: a dictionary of the tuple of (neighborId, cost) of each node in nodeId order, built on first use
+    - masks: a RouteCache of the bitmask of the equal cost next hops of each (nodeId, dstNodeId)
+    - load: a dictionary of the number of messages sent over each link since the last take_load, by link_key
+
+    Methods:
+    - next_hops(nodeId, dstNodeId): get the equal cost next hops of a node towards a destination
+    - route(srcNodeId, dstNodeId, flowKey): walk a flow from the source to the destination and add it to the load
+    - invalidate(): drop every next hop set after the topology changed
+    - take_load(): get the link loads and start counting again
+    """
+    __slots__ = ('nodes', 'pathCost', 'neighbors', 'masks', 'load')
+
+    def __init__(self, nodes, pathCost, capacity=ECMP_CACHE_SIZE):
+        """! Initializing the EcmpRoutes object.
+
+        @param nodes    A dictionary of nodes, where each Node has a dictionary of neighbors and link costs.
+        @param pathCost A function of (nodeId, dstNodeId) that returns the path cost of the current topology, or inf.
+        @param capacity The largest number of next hop sets that are kept.
+        """
+        self.nodes = nodes
+        self.pathCost = pathCost
+        self.neighbors = {}
+        self.masks = RouteCache(self.compute_mask, capacity)
+        self.load = {}
+
+    def neighbors_of(self, nodeId):
+        """! Get the neighbors of a node in nodeId order, which give the bit of each neighbor in a mask.
+
+        @param nodeId The nodeId of the node.
+
+        @return A tuple of tuples (neighborId, cost).
+        """
+        neighbors = self.neighbors.get(nodeId)
+        if neighbors is None:
+            neighbors = self.neighbors[nodeId] = tuple(sorted(self.nodes[nodeId].neighbors.items()))
+        return neighbors
+
+    def compute_mask(self, key):
+        """! Compute the bitmask of the equal cost next hops of a node towards a destination.
+
+        @param key A tuple (nodeId, dstNodeId).
+
+        @return An int whose bit i is set when the i-th neighbor of the node is an equal cost next hop.
+        """
+        nodeId, dstNodeId = key
+        pathCost = self.pathCost
+        target = pathCost(nodeId, dstNodeId)
+        mask = 0
+        if target == float('inf'):
+            return mask
+        for i, (neighborId, cost) in enumerate(self.neighbors_of(nodeId)):
+            if cost + pathCost(neighborId, dstNodeId) == target:
+                mask |= 1 << i
+        return mask
+
+    def next_hops(self, nodeId, dstNodeId):
+        """! Get the equal cost next hops of a node towards a destination.
+
+        @param nodeId       The nodeId of the node.
+        @param dstNodeId    The nodeId of the destination node.
+
+        @return A list of the neighborIds in nodeId order, empty if the destination is unreachable or the node itself.
+        """
+        if nodeId == dstNodeId:
+            return []
+        mask = self.masks.get((nodeId, dstNodeId))
+        return [neighborId for i, (neighborId, _) in enumerate(self.neighbors_of(nodeId)) if mask >> i & 1]
+
+    def route(self, srcNodeId, dstNodeId, flowKey):
+        """! Walk a flow from the source to the destination and add it to the load of every link it crosses.
+
+        Each node picks one of its equal cost next hops by the hash of the flow, so every message of a flow takes the
+        same path, and different flows between the same nodes spread over all the shortest paths. A node that is
+        already on the path is not picked again, which only matters for links that cost 0.
+
+        @param srcNodeId    The nodeId of the source node.
+        @param dstNodeId    The nodeId of the destination node.
+        @param flowKey      The key of the flow, as returned by flow_key.
+
+        @return A tuple (pathCost, path) where path is the list of nodeIds from the source to the destination, or None if
+          the destination cannot be reached.
+        """
+        pathCost = self.pathCost(srcNodeId, dstNodeId)
+        if pathCost == float('inf'):
+            return None
+        path = [srcNodeId]
+        visited = {srcNodeId}
+        splits = 0
+        currNodeId = srcNodeId
+        while currNodeId != dstNodeId:
+            hops = [neighborId for neighborId in self.next_hops(currNodeId, dstNodeId) if neighborId not in visited]
+            if not hops:
+                return None
+            if len(hops) > 1:
+                splits += 1
+            currNodeId = hops[flow_hash(flowKey, currNodeId) % len(hops)]
+            path.append(currNodeId)
+            visited.add(currNodeId)
+
+        load = self.load
+        for nodeId, neighborId in zip(path, path[1:]):
+            key = link_key(nodeId, neighborId)
+            load[key] = load.get(key, 0) + 1
+        count('path_walk_steps', len(path) - 1)
+        count('ecmp_splits', splits)
+        return pathCost, path
+
+    def invalidate(self):
+        """! Drop every next hop set, so that the next walks use the current topology.
+        """
+        self.masks.invalidate()
+        self.neighbors.clear()
+
+    def take_load(self):
+        """! Get the number of messages sent over each link since the last call, and start counting again.
+
+        @return A dictionary of link_key to the number of messages.
+        """
+        load, self.load = self.load, {}
+        return load
+
+
+def format_link_load(nodes, load):
+    """! Format the load of every link of a topology.
+
+    @param nodes    A dictionary of nodes, where each Node has a dictionary of neighbors and link costs.
+    @param load     A dictionary of link_key to the number of messages, as returned by EcmpRoutes.take_load.
+
+    @return One "nodeId neighborId load" line per link in nodeId order, including the links no message crossed,
+      followed by a blank line.
+    """
+    lines = []
+    for nodeId in sorted(nodes):
+        for neighborId in sorted(nodes[nodeId].neighbors):
+            if nodeId < neighborId:
+                lines.append(f'{nodeId} {neighborId} {load.get((nodeId, neighborId), 0)}\n')
+    lines.append('\n')
+    return ''.join(lines)
@@ -0,0 +1,223 @@
+##
+# @file graph.py
+
+import heapq
+from array import array
+
+from instrument import count
+
+
+class Graph:
+    """! Compact adjacency of a network topology in compressed sparse row (CSR) form.
+
+    Each nodeId is interned to an index, so nodeIds do not have to be contiguous. Indexes follow the order in which
+    nodes were first seen, and the neighbors of each node keep their order, so iterating the links visits them in the
+    same order as iterating the neighbors of each Node.
+
+    Attributes:
+    - nodeIds: a list of nodeIds, where the position of a nodeId is its index
+    - index: a dictionary of nodeIds and their indexes
+    - offsets: an array where the neighbors of the node at index i are at positions offsets[i] to offsets[i+1]
+    - targets: an array of the index of the neighbor at each position
+    - costs: an array of the cost of the link at each position
+
+    Methods:
+    - from_nodes(nodes): build a graph from a dictionary of Node objects
+    - from_links(links): build a graph from (nodeId, neighborId, cost) tuples of undirected links
+    - from_adjacency(neighbors): build a graph from a dictionary of the neighbors of each node
+    - links(): iterate over all links in the form (nodeId, neighborId, cost)
+    """
+    __slots__ = ('nodeIds', 'index', 'offsets', 'targets', 'costs')
+
+    def __init__(self, nodeIds, offsets, targets, costs):
+        """! Initializing the Graph object.
+
+        @param nodeIds  A list of nodeIds, where the position of a nodeId is its index.
+        @param offsets  An array of len(nodeIds) + 1 offsets into targets and costs.
+        @param targets  An array of the index of the neighbor at each position.
+        @param costs    An array of the cost of the link at each position.
+        """
+        self.nodeIds = nodeIds
+        self.index = {nodeId: i for i, nodeId in enumerate(nodeIds)}
+        self.offsets = offsets
+        self.targets = targets
+        self.costs = costs
+
+    def __iter__(self):
+        """! Iterate over the nodeIds in index order.
+
+        @return An iterator of nodeIds.
+        """
+        return iter(self.nodeIds)
+
+    def __len__(self):
+        """! Get the number of nodes in the graph.
+
+        @return The number of nodes.
+        """
+        return len(self.nodeIds)
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        """! Build a graph from a dictionary of nodes.
+
+        @param nodes A dictionary of nodes, where the key is the nodeId and the value is the Node object.
+
+        @return A Graph with the same nodes and links.
+        """
+        nodeIds = list(nodes)
+        index = {nodeId: i for i, nodeId in enumerate(nodeIds)}
+        offsets = array('q', [0])
+        targets = array('i')
+        costs = array('q')
+        for nodeId in nodeIds:
+            for neighborId, cost in nodes[nodeId].neighbors.items():
+                targets.append(index[neighborId])
+                costs.append(cost)
+            offsets.append(len(targets))
+        return cls(nodeIds, offsets, targets, costs)
+
+    @classmethod
+    def from_links(cls, links):
+        """! Build a graph from undirected links, the same way the topology file is read.
+
+        A link that appears twice keeps its first position and its last cost.
+
+        @param links An iterable of tuples (nodeId, neighborId, cost).
+
+        @return A Graph of the links.
+        """
+        neighbors = {}
+        for nodeId, neighborId, cost in links:
+            neighbors.setdefault(nodeId, {})[neighborId] = cost
+            neighbors.setdefault(neighborId, {})[nodeId] = cost
+        return cls.from_adjacency(neighbors)
+
+    @classmethod
+    def from_adjacency(cls, neighbors):
+        """! Build a graph from the neighbors of each node.
+
+        @param neighbors A dictionary where each key is a nodeId and each value is a dictionary of its neighbors and link costs.
+
+        @return A Graph with the nodes and neighbors in dictionary order.
+        """
+        nodeIds = list(neighbors)
+        index = {nodeId: i for i, nodeId in enumerate(nodeIds)}
+        offsets = array('q', [0])
+        targets = array('i')
+        costs = array('q')
+        for nodeId in nodeIds:
+            targets.extend(map(index.__getitem__, neighbors[nodeId]))
+            costs.extend(neighbors[nodeId].values())
+            offsets.append(len(targets))
+        return cls(nodeIds, offsets, targets, costs)
+
+    def links(self):
+        """! Iterate over all links in both directions.
+
+        @return An iterator of tuples (nodeId, neighborId, cost).
+        """
+        nodeIds, offsets, targets, costs = self.nodeIds, self.offsets, self.targets, self.costs
+        for i, nodeId in enumerate(nodeIds):
+            for k in range(offsets[i], offsets[i + 1]):
+                yield nodeId, nodeIds[targets[k]], costs[k]
+
+
+def csr_dijkstra(graph, srcIndex):
+    """! Compute the shortest path tree of one source over a Graph.
+
+    The heap is keyed on (d, nodeId), so nodes are settled in the same order as the link state engines and ties are
+    broken towards the smallest nodeId. Each node inherits the next hop of its previous hop when it is settled.
+
+    @param graph    A Graph of the network topology.
+    @param srcIndex The index of the source node.
+
+    @return A tuple (d, p, n) of lists by index, where d is the path cost to each node, p is the index of the previous
+      hop to each node and n is the index of the next hop to each node, or -1 if the node is unreachable.
+    """
+    nodeIds, offsets, targets, costs = graph.nodeIds, graph.offsets, graph.targets, graph.costs
+    size = len(nodeIds)
+    d = [float('inf')] * size
+    p = [-1] * size
+    n = [-1] * size
+    settled = bytearray(size)
+
+    d[srcIndex] = 0
+    p[srcIndex] = srcIndex
+    n[srcIndex] = srcIndex
+    heap = [(0, nodeIds[srcIndex], srcIndex)]
+    pushes = relaxations = 0
+    while heap:
+        minCost, _, u = heapq.heappop(heap)
+        if settled[u]:
+            continue
+        settled[u] = 1
+        if u != srcIndex:
+            n[u] = u if p[u] == srcIndex else n[p[u]]
+        relaxations += offsets[u + 1] - offsets[u]
+        for k in range(offsets[u], offsets[u + 1]):
+            v = targets[k]
+            if not settled[v] and minCost + costs[k] < d[v]:
+                d[v] = minCost + costs[k]
+                p[v] = u
+                heapq.heappush(heap, (d[v], nodeIds[v], v))
+                pushes += 1
+
+    # Every entry is popped, so the pops follow from the pushes
+    count('spf_runs')
+    count('relaxations', relaxations)
+    count('heap_pushes', pushes + 1)
+    count('heap_pops', pushes + 1)
+    return d, p, n
+
+
+def csr_bellman_ford(graph, dstIndex, detectNegativeCycle=False):
+    """! Run the Bellman-Ford algorithm from one node over a Graph.
+
+    Links are relaxed in the order of Graph.links(), skipping the links of a node until its distance changes, and the
+    passes stop once one changes nothing.
+
+    @param graph                A Graph of the network topology.
+    @param dstIndex             The index of the node to find the distances from.
+    @param detectNegativeCycle  If True, raise a ValueError when a negative cycle is reachable from dstIndex.
+
+    @return A tuple (distance, nexthop) of lists by index, where nexthop is the index of the neighbor each node reaches
+      dstIndex through, or -1 if there is none.
+    """
+    offsets, targets, costs = graph.offsets, graph.targets, graph.costs
+    size = len(graph.nodeIds)
+    distance = [float('inf')] * size
+    nexthop = [-1] * size
+    distance[dstIndex] = 0
+
+    version = [0] * size
+    version[dstIndex] = 1
+    relaxedVersion = [0] * size
+
+    passes = relaxations = 0
+    for _ in range(size - 1):
+        changed = False
+        passes += 1
+        for u in range(size):
+            if relaxedVersion[u] == version[u]:
+                continue
+            relaxedVersion[u] = version[u]
+            relaxations += offsets[u + 1] - offsets[u]
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                if distance[u] + costs[k] < distance[v]:
+                    distance[v] = distance[u] + costs[k]
+                    nexthop[v] = u
+                    version[v] += 1
+                    changed = True
+        if not changed:
+            break
+    else:
+        if detectNegativeCycle:
+            for nodeId, neighborId, cost in graph.links():
+                if distance[graph.index[nodeId]] + cost < distance[graph.index[neighborId]]:
+                    raise ValueError(f"Negative cycle reachable from node {graph.nodeIds[dstIndex]} through the link {nodeId} {neighborId}")
+    count('bf_runs')
+    count('bf_passes', passes)
+    count('relaxations', relaxations)
+    return distance, nexthop
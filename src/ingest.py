@@ -0,0 +1,353 @@
+##
+# @file ingest.py
+
+import os
+import warnings
+from array import array
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from graph import Graph
+from routecache import RouteCache
+
+## Number of messages that are read, routed and written at a time
+MESSAGE_CHUNK_SIZE = 4096
+
+## Size of the read buffer used when a file is streamed
+READ_BUFFER_SIZE = 1 << 20
+
+## Token that stands in for each line break while a whole file is split at once
+LINE_MARK = b'|'
+
+## RouteCache of the parsed topology files by (path, size, modification time), or None when topologies are not kept
+topologyCache = None
+
+
+def keep_topologies(capacity):
+    """! Keep the parsed topology files, so that a process that runs many scenarios only parses each topology once.
+
+    @param capacity The largest number of topologies that are kept, or 0 to stop keeping them.
+
+    @return The RouteCache of the topologies, whose hits and misses count the reused and parsed topologies, or None.
+    """
+    global topologyCache
+    topologyCache = RouteCache(lambda key: parse_adjacency(key[0]), capacity) if capacity > 0 else None
+    return topologyCache
+
+
+def line_error(fileName, lineNumber, expected, line):
+    """! Build the error for a line of an input file that cannot be parsed.
+
+    @param fileName     The path of the input file.
+    @param lineNumber   The number of the line, starting at 1.
+    @param expected     A description of what the line should contain.
+    @param line         The text of the line.
+
+    @return A ValueError naming the file, the line number and the line.
+    """
+    if isinstance(line, bytes):
+        line = line.decode(errors='replace')
+    return ValueError(f'{fileName} line {lineNumber}: expected {expected}, got {line.rstrip()!r}')
+
+
+def parse_int_lines(fileName, data, columns, expected):
+    """! Parse a file of integer columns line by line, skipping blank lines and reporting the first malformed line.
+
+    @param fileName The path of the input file.
+    @param data     The contents of the file.
+    @param columns  The number of integers on each line.
+    @param expected A description of a line for the error message.
+
+    @return A list of one list of integers per column.
+    """
+    values = [[] for _ in range(columns)]
+    for lineNumber, line in enumerate(data.splitlines(), start=1):
+        tokens = line.split()
+        if not tokens:
+            continue
+        if len(tokens) != columns:
+            raise line_error(fileName, lineNumber, expected, line)
+        try:
+            row = [int(token) for token in tokens]
+        except ValueError:
+            raise line_error(fileName, lineNumber, expected, line) from None
+        for column, value in zip(values, row):
+            column.append(value)
+    return values
+
+
+def parse_int_array(data, columns):
+    """! Parse a file of integer columns with NumPy, checking that every line that is not blank holds the right number of tokens.
+
+    Token starts are found from the bytes of the file, counted per line with bincount, and the integers are then read in
+    one pass with fromstring, all without running Python code per line.
+
+    @param data     The contents of the file, ending in a line break.
+    @param columns  The number of integers on each line.
+
+    @return An int64 array with one row per line that is not blank, or None if the file has a malformed line or a value
+      that does not fit in 64 bits.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    space = (buffer == ord(' ')) | ((buffer >= ord('\t')) & (buffer <= ord('\r')))
+    starts = ~space
+    starts[1:] &= space[:-1]
+    lineIds = np.cumsum(buffer == ord('\n'))
+    tokensPerLine = np.bincount(lineIds[starts], minlength=int(lineIds[-1]) + 1)
+    if not np.all((tokensPerLine == columns) | (tokensPerLine == 0)):
+        return None
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        try:
+            values = np.fromstring(data, dtype=np.int64, sep=' ')
+        except (ValueError, DeprecationWarning):
+            return None
+    limits = np.iinfo(np.int64)
+    if len(values) != columns * int(np.count_nonzero(tokensPerLine)) or np.any((values == limits.max) | (values == limits.min)):
+        return None
+    return values.reshape(-1, columns)
+
+
+def read_file(fileName):
+    """! Read a whole input file in one call.
+
+    @param fileName The path of the input file.
+
+    @return The contents of the file, ending in a line break unless the file is empty.
+    """
+    with open(fileName, 'rb') as file:
+        data = file.read()
+    if data and not data.endswith(b'\n'):
+        data += b'\n'
+    return data
+
+
+def read_int_columns(fileName, columns=3, expected='3 integers'):
+    """! Read a file where every line holds the same number of integers, in one read and one split.
+
+    With NumPy, the file is parsed by parse_int_array. Otherwise each line break is replaced by a marker token before
+    the whole file is split, so a file where every line has the right number of tokens has a marker at every
+    (columns + 1)th token and nowhere else. That is checked with list slices, and the columns are converted with map,
+    so no Python code runs per line. Files that fail the check, such as files with blank lines, are parsed line by
+    line, which names the first malformed line.
+
+    @param fileName The path of the input file.
+    @param columns  The number of integers on each line.
+    @param expected A description of a line for the error message.
+
+    @return A list of one list of integers per column.
+    """
+    data = read_file(fileName)
+    if np is not None and data:
+        rows = parse_int_array(data, columns)
+        if rows is not None:
+            return [rows[:, column].tolist() for column in range(columns)]
+        return parse_int_lines(fileName, data, columns, expected)
+
+    tokens = data.replace(b'\n', b' ' + LINE_MARK + b' ').split()
+    width = columns + 1
+    numLines = len(tokens) // width
+    if len(tokens) % width == 0 and tokens[columns::width].count(LINE_MARK) == numLines == tokens.count(LINE_MARK):
+        try:
+            return [list(map(int, tokens[column::width])) for column in range(columns)]
+        except ValueError:
+            pass
+    return parse_int_lines(fileName, data, columns, expected)
+
+
+def build_graph(nodeIds, neighborIds, costs):
+    """! Build a Graph from the columns of a topology file with vectorized NumPy sorts.
+
+    Every link is stored in both directions in file order. A stable sort by (node, neighbor) groups the copies of a
+    link, where the first copy gives its position among the neighbors and the last copy its cost, the same
+    as assigning each line to the neighbor dictionaries in order.
+
+    @param nodeIds      An int64 array of the first nodeId of each link.
+    @param neighborIds  An int64 array of the second nodeId of each link.
+    @param costs        An int64 array of the cost of each link.
+
+    @return A Graph with the nodes in the order they first appear and the neighbors of each node in the order their link first appears.
+    """
+    # Intern the nodeIds in the order they first appear
+    ends = np.empty(2 * len(nodeIds), dtype=np.int64)
+    ends[0::2] = nodeIds
+    ends[1::2] = neighborIds
+    uniqueIds, firstSeen, inverse = np.unique(ends, return_index=True, return_inverse=True)
+    order = np.argsort(firstSeen, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    index = rank[inverse.reshape(-1)]
+    size = len(order)
+
+    # Keep one copy of each directed link, at its first line and with its last cost. Both directions of a line sit
+    # next to each other, so a stable sort by link keeps the copies of each link in file order
+    sources = index
+    targets = index.reshape(-1, 2)[:, ::-1].reshape(-1)
+    when = np.arange(len(ends))
+    keys = sources * size + targets
+    perm = np.argsort(keys, kind='stable')
+    keys = keys[perm]
+    groupStart = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+    groupEnd = np.append(groupStart[1:], len(keys)) - 1
+    sources, targets, when = sources[perm][groupStart], targets[perm][groupStart], when[perm][groupStart]
+    linkCosts = np.repeat(costs, 2)[perm][groupEnd]
+
+    # Lay the links out by node, in the order each link first appears
+    perm = np.argsort(sources * len(ends) + when, kind='stable')
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(sources, minlength=size))))
+    return Graph(uniqueIds[order].tolist(), array('q', offsets.astype(np.int64).tobytes()),
+                 array('i', targets[perm].astype(np.int32).tobytes()), array('q', linkCosts[perm].astype(np.int64).tobytes()))
+
+
+def read_topology_graph(topologyFile):
+    """! Read a topology file straight into a Graph, without building Node objects.
+
+    @param topologyFile The path of the topology file, with one "nodeId neighborId cost" line per link.
+
+    @return A Graph of the topology, with the same node and link order as Graph.from_nodes on the nodes read from the file.
+    """
+    if topologyCache is not None:
+        # The Graph copies the kept neighbors into its own arrays, so they do not have to be copied first
+        return Graph.from_adjacency(kept_adjacency(topologyFile))
+    if np is not None:
+        data = read_file(topologyFile)
+        rows = parse_int_array(data, 3) if data else None
+        if rows is not None:
+            return build_graph(rows[:, 0], rows[:, 1], rows[:, 2])
+    return Graph.from_adjacency(read_adjacency(topologyFile))
+
+
+def read_adjacency(topologyFile):
+    """! Read a topology file into the neighbors of each node.
+
+    When keep_topologies is on and the file did not change since it was parsed, the neighbors are copied from the kept
+    topology instead, since the callers change them in place.
+
+    @param topologyFile The path of the topology file, with one "nodeId neighborId cost" line per link.
+
+    @return A dictionary where each key is a nodeId and each value is a dictionary of its neighbors and link costs.
+    """
+    if topologyCache is None:
+        return parse_adjacency(topologyFile)
+    return {nodeId: dict(links) for nodeId, links in kept_adjacency(topologyFile).items()}
+
+
+def kept_adjacency(topologyFile):
+    """! Get the kept neighbors of each node of a topology file, parsing the file when it is not kept or changed.
+
+    @param topologyFile The path of the topology file, with one "nodeId neighborId cost" line per link.
+
+    @return The dictionary of the neighbors of each node in topologyCache, which is shared and must not be changed.
+    """
+    stat = os.stat(topologyFile)
+    return topologyCache.get((os.path.abspath(topologyFile), stat.st_size, stat.st_mtime_ns))
+
+
+def graph_adjacency(graph):
+    """! Get the neighbors of each node of a Graph.
+
+    @param graph A Graph of the topology.
+
+    @return A dictionary where each key is a nodeId and each value is a dictionary of its neighbors and link costs, in
+      the node and link order of the graph.
+    """
+    nodeIds, offsets, costs = graph.nodeIds, graph.offsets, graph.costs.tolist()
+    if np is not None:
+        targetIds = np.asarray(nodeIds, dtype=np.int64)[np.frombuffer(graph.targets, dtype=np.int32)].tolist()
+    else:
+        targetIds = [nodeIds[target] for target in graph.targets]
+    return {nodeId: dict(zip(targetIds[offsets[i]:offsets[i + 1]], costs[offsets[i]:offsets[i + 1]]))
+            for i, nodeId in enumerate(nodeIds)}
+
+
+def parse_adjacency(topologyFile):
+    """! Parse a topology file into the neighbors of each node.
+
+    Nodes are kept in the order they first appear in the file, and the neighbors of each node in the order their link
+    first appears, so the result matches reading the file line by line into Node objects. A link that appears twice
+    keeps its first position and its last cost.
+
+    @param topologyFile The path of the topology file, with one "nodeId neighborId cost" line per link.
+
+    @return A dictionary where each key is a nodeId and each value is a dictionary of its neighbors and link costs.
+    """
+    if np is not None:
+        data = read_file(topologyFile)
+        rows = parse_int_array(data, 3) if data else None
+        if rows is not None:
+            return graph_adjacency(build_graph(rows[:, 0], rows[:, 1], rows[:, 2]))
+
+    nodeIds, neighborIds, costs = read_int_columns(topologyFile, 3, '"nodeId neighborId cost"')
+
+    # Interleave both ends of every link, so that dict.fromkeys keeps the order in which nodes first appear
+    ends = [None] * (2 * len(nodeIds))
+    ends[0::2] = nodeIds
+    ends[1::2] = neighborIds
+    neighbors = {nodeId: {} for nodeId in dict.fromkeys(ends)}
+    for nodeId, neighborId, cost in zip(nodeIds, neighborIds, costs):
+        neighbors[nodeId][neighborId] = cost
+        neighbors[neighborId][nodeId] = cost
+    return neighbors
+
+
+def read_changes(changeFile):
+    """! Read a topology change file.
+
+    @param changeFile The path of the change file, with one "nodeId neighborId cost" line per change, where a cost of -999 removes the link.
+
+    @return A list of tuples (nodeId, neighborId, cost) in file order.
+    """
+    return list(zip(*read_int_columns(changeFile, 3, '"nodeId neighborId cost"')))
+
+
+def read_areas(areaFile):
+    """! Read an area file.
+
+    @param areaFile The path of the area file, with one "nodeId areaId" line per node.
+
+    @return A dictionary of nodeIds and their areaIds, where a nodeId listed twice keeps its last area.
+    """
+    return dict(zip(*read_int_columns(areaFile, 2, '"nodeId areaId"')))
+
+
+def read_message_chunks(messageFile, chunkSize=MESSAGE_CHUNK_SIZE):
+    """! Read a message file in chunks through a large read buffer, without keeping the whole file in memory.
+
+    @param messageFile  The path of the message file, with one "srcNodeId dstNodeId message" line per message.
+    @param chunkSize    The largest number of messages in a chunk.
+
+    @return A generator of lists of tuples (srcNodeId, dstNodeId, msgText).
+    """
+    lineNumber = 0
+    with open(messageFile, 'r', buffering=READ_BUFFER_SIZE) as file:
+        while True:
+            lines = list(islice(file, chunkSize))
+            if not lines:
+                return
+            msgs = []
+            for line in lines:
+                lineNumber += 1
+                try:
+                    srcNodeId, dstNodeId, msgText = line.split(maxsplit=2)
+                    msgs.append((int(srcNodeId), int(dstNodeId), msgText))
+                except ValueError:
+                    raise line_error(messageFile, lineNumber, '"srcNodeId dstNodeId message"', line) from None
+            yield msgs
+
+
+def read_messages(messageFile):
+    """! Read a whole message file.
+
+    @param messageFile The path of the message file.
+
+    @return A list of tuples (srcNodeId, dstNodeId, msgText).
+    """
+    msgs = []
+    for chunk in read_message_chunks(messageFile):
+        msgs.extend(chunk)
+    return msgs
@@ -0,0 +1,218 @@
+##
+# @file instrument.py
+
+import json
+import sys
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+## Formats write_report can write the statistics in
+REPORT_FORMATS = ('json', 'table')
+
+## The Recorder of the current run, or None when statistics are disabled
+recorder = None
+
+
+def peak_memory():
+    """! Get the peak resident memory of the process so far.
+
+    @return The peak resident set size in kilobytes, or None where the resource module is not available.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes instead of kilobytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Phase:
+    """! Context manager that records the wall time, the counters and the peak memory of one phase of a run.
+
+    Attributes:
+    - recorder: the Recorder the phase is recorded in
+    - name: the name of the phase
+    - start: the perf_counter time the phase started at
+    - counters: a copy of the counters when the phase started
+    """
+    __slots__ = ('recorder', 'name', 'start', 'counters')
+
+    def __init__(self, recorder, name):
+        """! Initializing the Phase object.
+
+        @param recorder The Recorder the phase is recorded in.
+        @param name     The name of the phase.
+        """
+        self.recorder = recorder
+        self.name = name
+        self.start = None
+        self.counters = None
+
+    def __enter__(self):
+        """! Start timing the phase.
+
+        @return The Phase itself.
+        """
+        self.counters = Counter(self.recorder.counters)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        """! Stop timing the phase and record it with the counters it added.
+        """
+        seconds = time.perf_counter() - self.start
+        counters = self.recorder.counters - self.counters
+        self.recorder.records.append({'change': self.recorder.change, 'phase': self.name, 'seconds': seconds,
+                                      'counters': dict(counters), 'peak_kb': peak_memory()})
+
+
+class Recorder:
+    """! Statistics of one run: a record per phase and change, and counters of the algorithmic work.
+
+    Attributes:
+    - records: a list of dictionaries with the change index, phase name, seconds, counters added and peak memory of each phase
+    - counters: a Counter of the work done so far, such as relaxations and heap pushes
+    - change: the index of the change being processed, 0 for the initial topology
+    - start: the perf_counter time the recorder was created at
+
+    Methods:
+    - phase(name): a context manager that records a phase
+    - summary(): the totals of every phase and counter
+    """
+    __slots__ = ('records', 'counters', 'change', 'start')
+
+    def __init__(self):
+        """! Initializing the Recorder object.
+        """
+        self.records = []
+        self.counters = Counter()
+        self.change = 0
+        self.start = time.perf_counter()
+
+    def phase(self, name):
+        """! Record a phase of the run.
+
+        @param name The name of the phase.
+
+        @return A Phase context manager.
+        """
+        return Phase(self, name)
+
+    def summary(self):
+        """! Sum up the phases and counters of the run.
+
+        @return A dictionary with the total seconds, the calls, total seconds and slowest change of each phase, the
+          counters and the peak memory.
+        """
+        phases = {}
+        for record in self.records:
+            entry = phases.setdefault(record['phase'], {'calls': 0, 'seconds': 0.0, 'slowest_change': None, 'slowest_seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += record['seconds']
+            if entry['slowest_change'] is None or record['seconds'] > entry['slowest_seconds']:
+                entry['slowest_change'] = record['change']
+                entry['slowest_seconds'] = record['seconds']
+        return {'seconds': time.perf_counter() - self.start, 'phases': phases, 'counters': dict(self.counters),
+                'peak_kb': peak_memory()}
+
+
+def enable():
+    """! Start recording statistics for the run.
+
+    @return The new Recorder.
+    """
+    global recorder
+    recorder = Recorder()
+    return recorder
+
+
+def disable():
+    """! Stop recording statistics.
+
+    @return The Recorder that was recording, or None.
+    """
+    global recorder
+    previous, recorder = recorder, None
+    return previous
+
+
+def phase(name):
+    """! Record a phase of the run, when statistics are enabled.
+
+    @param name The name of the phase, such as "parse", "compute", "tables" or "messages".
+
+    @return A context manager that records the phase, or one that does nothing when statistics are disabled.
+    """
+    return recorder.phase(name) if recorder is not None else nullcontext()
+
+
+def count(name, amount=1):
+    """! Add to a counter of algorithmic work, when statistics are enabled.
+
+    Hot loops keep their counts in local variables and call this once per run of the algorithm, so a disabled
+    recorder costs one function call per run.
+
+    @param name     The name of the counter.
+    @param amount   The amount to add.
+    """
+    if recorder is not None:
+        recorder.counters[name] += amount
+
+
+def set_change(index):
+    """! Set the index of the change the following phases belong to.
+
+    @param index The index of the change or batch, starting at 1, or 0 for the initial topology.
+    """
+    if recorder is not None:
+        recorder.change = index
+
+
+def format_summary(summary):
+    """! Format a summary as a table.
+
+    @param summary A dictionary as returned by Recorder.summary.
+
+    @return The table as a string.
+    """
+    lines = [f'{"phase":<12} {"calls":>7} {"seconds":>10} {"share":>6} {"slowest change":>15}']
+    total = summary['seconds'] or 1
+    for name, entry in summary['phases'].items():
+        lines.append(f'{name:<12} {entry["calls"]:>7} {entry["seconds"]:>10.4f} {entry["seconds"] / total:>6.1%} '
+                     f'{entry["slowest_change"]:>7} ({entry["slowest_seconds"]:.4f}s)')
+    lines.append(f'{"total":<12} {"":>7} {summary["seconds"]:>10.4f}')
+    lines.append('')
+    lines.append(f'{"counter":<24} {"count":>14}')
+    for name, value in sorted(summary['counters'].items()):
+        lines.append(f'{name:<24} {value:>14}')
+    if summary['peak_kb'] is not None:
+        lines.append(f'{"peak memory (KB)":<24} {summary["peak_kb"]:>14}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_report(reportFormat, fileName=None):
+    """! Write the statistics of the current run.
+
+    In json format every phase is one JSON line, followed by a line with the summary. In table format only the summary
+    is written.
+
+    @param reportFormat 'json' or 'table'.
+    @param fileName     The path of the file to write to, or None for standard error.
+    """
+    if recorder is None:
+        return
+    summary = recorder.summary()
+    if reportFormat == 'json':
+        text = ''.join([json.dumps(record) + '\n' for record in recorder.records]) + json.dumps({'summary': summary}) + '\n'
+    else:
+        text = format_summary(summary)
+    if fileName is None:
+        sys.stderr.write(text)
+    else:
+        with open(fileName, 'w') as file:
+            file.write(text)
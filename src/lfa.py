@@ -0,0 +1,155 @@
+##
+# @file lfa.py
+
+from instrument import count
+
+
+def link_key(nodeId, neighborId):
+    """! Get the key of an undirected link.
+
+    @param nodeId       One end of the link.
+    @param neighborId   The other end of the link.
+
+    @return The tuple (smaller nodeId, larger nodeId).
+    """
+    return (nodeId, neighborId) if nodeId < neighborId else (neighborId, nodeId)
+
+
+def find_alternates(nodes, costs, nextHops):
+    """! Find a loop-free alternate next hop of every route, grouped by the primary next hop it backs up.
+
+    A neighbor N of a source S is a loop-free alternate towards a destination D when d(N, D) < d(N, S) + d(S, D): the
+    shortest path of N to D does not come back through S, so it does not use any link of S either. Among the neighbors
+    other than the primary next hop that pass this test, the one with the smallest cost(S, N) + d(N, D) is kept, with ties
+    broken on the smaller nodeId.
+
+    @param nodes    A dictionary of nodes, where each Node has a dictionary of neighbors and link costs.
+    @param costs    A dictionary of the path costs of each node, as a mapping of destination nodeIds to path costs.
+    @param nextHops A dictionary of the next hops of each node, as a mapping of destination nodeIds to next hops.
+
+    @return A dictionary of srcNodeId to a dictionary of primary next hop to a dictionary of dstNodeId to a tuple
+      (alternate next hop, alternate path cost), where the alternate is None and its cost inf if there is none.
+    """
+    INFINITY = float('inf')
+    alternates = {}
+    checks = 0
+    for srcNodeId, node in nodes.items():
+        srcCosts, srcHops = costs[srcNodeId], nextHops[srcNodeId]
+        # The cost of each neighbor back to the source does not depend on the destination
+        neighbors = [(neighborId, linkCost, costs[neighborId], costs[neighborId].get(srcNodeId, INFINITY))
+                     for neighborId, linkCost in sorted(node.neighbors.items())]
+        groups = {}
+        for dstNodeId, primary in srcHops.items():
+            if primary is None or dstNodeId == srcNodeId:
+                continue
+            srcCost = srcCosts[dstNodeId]
+            best = None
+            for neighborId, linkCost, neighborCosts, backCost in neighbors:
+                if neighborId == primary:
+                    continue
+                neighborCost = neighborCosts.get(dstNodeId, INFINITY)
+                if neighborCost < backCost + srcCost and (best is None or linkCost + neighborCost < best[1]):
+                    best = (neighborId, linkCost + neighborCost)
+            checks += len(neighbors)
+            groups.setdefault(primary, {})[dstNodeId] = best if best is not None else (None, INFINITY)
+        alternates[srcNodeId] = groups
+    count('lfa_checks', checks)
+    return alternates
+
+
+def link_state_alternates(nodes, linkState):
+    """! Find the loop-free alternates of every route of a link state.
+
+    @param nodes        A dictionary of nodes in the network.
+    @param linkState    A dictionary of tuples (d, p, n) for each node, or a RoutingState.
+
+    @return The alternates, as returned by find_alternates.
+    """
+    costs, nextHops = {}, {}
+    for nodeId in nodes:
+        d, _, n = linkState[nodeId]
+        costs[nodeId] = d if isinstance(d, dict) else dict(d.items())
+        nextHops[nodeId] = n if isinstance(n, dict) else dict(n.items())
+    return find_alternates(nodes, costs, nextHops)
+
+
+def distance_vector_alternates(nodes):
+    """! Find the loop-free alternates of every route of the distance vector routing tables.
+
+    Only the routing tables of a node and its neighbors are read, which is what a distance vector router learns from
+    its neighbors anyway.
+
+    @param nodes A dictionary of distance vector nodes with their routing tables.
+
+    @return The alternates, as returned by find_alternates.
+    """
+    costs, nextHops = {}, {}
+    for nodeId, node in nodes.items():
+        costs[nodeId] = {dest: pathCost for dest, (_, pathCost) in node.routingTable.items()}
+        nextHops[nodeId] = {dest: nextHop for dest, (nextHop, _) in node.routingTable.items()}
+        costs[nodeId][nodeId] = 0
+    return find_alternates(nodes, costs, nextHops)
+
+
+def patch_routes(alternates, patches, removed, nodeId, neighborId):
+    """! Switch the routes of both ends of a removed link over to their alternates.
+
+    Only the routes whose primary next hop is across the link are touched, so the work is proportional to the number of
+    routes the removal breaks. Routes that have no alternate, or whose alternate is also across a removed link, become
+    unreachable until the next recompute.
+
+    @param alternates   The alternates of the routes, as returned by find_alternates.
+    @param patches      A dictionary of (srcNodeId, dstNodeId) to a tuple (next hop, path cost) of the routes that were
+                        already switched, which is updated in place.
+    @param removed      A set of the link keys of the removed links, including this one.
+    @param nodeId       One end of the removed link.
+    @param neighborId   The other end of the removed link.
+
+    @return The number of routes that were switched or lost.
+    """
+    INFINITY = float('inf')
+    patched = 0
+    for srcNodeId, failedHop in ((nodeId, neighborId), (neighborId, nodeId)):
+        # Routes that already failed over across this link have nothing left to fall back on
+        for key, (nextHop, _) in patches.items():
+            if key[0] == srcNodeId and nextHop == failedHop:
+                patches[key] = (None, INFINITY)
+                patched += 1
+        for dstNodeId, (nextHop, pathCost) in alternates.get(srcNodeId, {}).get(failedHop, {}).items():
+            if nextHop is not None and link_key(srcNodeId, nextHop) in removed:
+                nextHop, pathCost = None, INFINITY
+            patches[(srcNodeId, dstNodeId)] = (nextHop, pathCost)
+            patched += 1
+    return patched
+
+
+def failover_route(nodes, nextHop, patches, removed, srcNodeId, dstNodeId):
+    """! Follow the next hops from the source to the destination, taking the patched next hop where there is one.
+
+    Links that were removed are never followed, and the walk gives up after as many hops as there are nodes, since more
+    than one removed link can make the patched routes loop until the next recompute.
+
+    @param nodes        A dictionary of nodes, where each Node has a dictionary of neighbors and link costs.
+    @param nextHop      A function of (nodeId, dstNodeId) that returns the primary next hop, or None.
+    @param patches      A dictionary of (srcNodeId, dstNodeId) to a tuple (next hop, path cost) of the switched routes.
+    @param removed      A set of the link keys of the removed links.
+    @param srcNodeId    The nodeId of the source node.
+    @param dstNodeId    The nodeId of the destination node.
+
+    @return A tuple (pathCost, path) where path is the list of nodeIds from the source to the destination, or None if
+      the destination cannot be reached.
+    """
+    path = [srcNodeId]
+    pathCost = 0
+    currNodeId = srcNodeId
+    while currNodeId != dstNodeId:
+        patch = patches.get((currNodeId, dstNodeId))
+        nextNodeId = patch[0] if patch is not None else nextHop(currNodeId, dstNodeId)
+        if (nextNodeId is None or nextNodeId not in nodes[currNodeId].neighbors or link_key(currNodeId, nextNodeId) in removed
+                or len(path) > len(nodes)):
+            return None
+        pathCost += nodes[currNodeId].neighbors[nextNodeId]
+        path.append(nextNodeId)
+        currNodeId = nextNodeId
+    count('path_walk_steps', len(path) - 1)
+    return pathCost, path
@@ -1,6 +1,26 @@
 ##
 # @file linkstate.py
 
+import heapq
+from contextlib import nullcontext
+
+from allpairs import all_pairs_routes, choose_engine
+from areas import AreaLinkState, partition_areas
+from changebatch import LINK_REMOVED, batch_changes, coalesce_changes
+from ecmp import EcmpRoutes, flow_key, format_link_load
+from graph import Graph, csr_dijkstra
+from ingest import MESSAGE_CHUNK_SIZE, graph_adjacency, read_adjacency, read_areas, read_changes, read_message_chunks, read_messages, read_topology_graph
+from instrument import count, phase, set_change
+from parallel import keep_pool, map_nodes, spf_task
+from pathquery import PathQuery
+from routecache import RouteCache
+from routewriter import RouteWriter, format_table
+from routingstate import RoutingState
+from snapshot import load_link_state, save_link_state
+
+## Largest number of (src, dst) routes that are kept between topology changes
+PATH_CACHE_SIZE = 1 << 16
+
 class Node:
     """! Represents a node in the network topology.
 
@@ -12,6 +32,8 @@ class Node:
     - add_neighbor(neighborId, cost): add a neighbor node with the given cost
     - remove_neighbor(neighborId): remove the neighbor node with the given id
     """
+    __slots__ = ('nodeId', 'neighbors')
+
     def __init__(self, nodeId):
         """! Initializing the Node object.
 
@@ -45,19 +67,23 @@ def read_topology_file(topologyFile):
 
     @param topologyFile the file containing the network topology information
 
+    @return A dictionary of nodes, where the key is the nodeId and the value is the Node object.
+    """
+    return create_nodes(read_adjacency(topologyFile))
+
+
+def create_nodes(neighbors):
+    """! Create the nodes of a topology from the neighbors of each node.
+
+    @param neighbors a dictionary where each key is a nodeId and each value is a dictionary of its neighbors and link
+                     costs, which the nodes take over
+
     @return A dictionary of nodes, where the key is the nodeId and the value is the Node object.
     """
     nodes = {}
-    with open(topologyFile, 'r') as file:
-        for line in file:
-            nodeId, neighborId, cost = map(int, line.strip().split())
-            if nodeId not in nodes:
-                nodes[nodeId] = Node(nodeId)
-            if neighborId not in nodes:
-                nodes[neighborId] = Node(neighborId)
-            # Add neighbors to each node
-            nodes[nodeId].add_neighbor(neighborId, cost)
-            nodes[neighborId].add_neighbor(nodeId, cost)
+    for nodeId, links in neighbors.items():
+        nodes[nodeId] = Node(nodeId)
+        nodes[nodeId].neighbors = links
     return nodes
 
 
@@ -68,12 +94,7 @@ def read_message_file(messageFile):
 
     @return A list of messages, where each message is a tuple (srcNodeId, dstNodeId, msgText)
     """
-    msgs = []
-    with open(messageFile, 'r') as file:
-        for line in file:
-            srcNodeId, dstNodeId, msgText = line.split(maxsplit=2)
-            msgs.append((int(srcNodeId), int(dstNodeId), msgText))
-    return msgs
+    return read_messages(messageFile)
 
 
 def read_topology_change_file(changeFile):
@@ -83,22 +104,23 @@ def read_topology_change_file(changeFile):
 
     @return A list of topology changes, where each change is a tuple (nodeId, neighborId, cost)
     """
-    changes = []
-    with open(changeFile, 'r') as file:
-        for line in file:
-            nodeId, neighborId, cost = map(int, line.split(maxsplit=2))
-            changes.append((int(nodeId), int(neighborId), cost))
-    return changes
+    return read_changes(changeFile)
 
 
 def find_next_hop(linkState):
     """! Find the next hop for each destination in the link state information.
 
-    @param linkState The link state information for each node
+    The shortest path engines already produce the next hops, so this is only needed for link state information
+    that has the path costs and previous hops without the next hops. Sources that already have next hops are skipped.
+
+    @param linkState The link state information for each node, as tuples (d, p) or (d, p, n)
 
     @return The updated link state information with the next hop for each destination.
     """
-    for srcNodeId, (d, p) in linkState.items():
+    for srcNodeId, state in linkState.items():
+        if len(state) == 3:
+            continue
+        d, p = state
         n = {}
 
         for dstNodeId, prevHopNodeId in p.items():
@@ -162,69 +184,259 @@ def get_hops(linkState, srcNodeId, dstNodeId):
         
         currNodeId = nextNodeId
 
+    count('path_walk_steps', len(hops))
     return hops
 
 
-def update_nodes(nodes):
+def scan_spf(nodes, srcNodeId, unreachableNodes):
+    """! Compute the shortest path tree of one source by scanning every node for the next node to add to n'.
+
+    @param nodes            a dictionary of nodes in the network
+    @param srcNodeId        the nodeId of the source node
+    @param unreachableNodes a set of nodeIds that have no neighbors
+
+    @return A tuple (d, p, n), where d is the path cost to each destination, p is the previous hop to each destination,
+      and n is the next hop to each destination.
+    """
+    node = nodes[srcNodeId]
+
+    # Intialize n'
+    nPrime = set()
+    nPrime.add(srcNodeId)
+
+    # Initialize d, p and n
+    d = {nodeId: float('inf') for nodeId in nodes}
+    p = {nodeId: None for nodeId in nodes}
+    n = {nodeId: None for nodeId in nodes}
+
+    d[srcNodeId] = 0
+    p[srcNodeId] = srcNodeId
+    n[srcNodeId] = srcNodeId
+
+    # Initialize step for all neighbors
+    for neighbor, cost in node.neighbors.items():
+        d[neighbor] = cost
+        p[neighbor] = srcNodeId
+
+    # Check that the node is reachable and that there are still nodes to add to n' that are reachable
+    scans = relaxations = 0
+    while srcNodeId not in unreachableNodes and (len(nPrime) < (len(nodes) - len(unreachableNodes))):
+        minCost = float('inf')
+        minNodeId = None
+        minNode = None
+
+        # Find the node not in n' with the smallest d
+        for altNodeId, altNode in nodes.items():
+            if altNodeId not in nPrime:
+                # Check if the cost is less than the current minCost or if the cost is equal to the current minCost and the nodeId is less (tie breaking)
+                if d[altNodeId] < minCost or (minNodeId and d[altNodeId] == minCost and (altNodeId < minNodeId)):
+                    minCost = d[altNodeId]
+                    minNodeId = altNodeId
+                    minNode = altNode
+
+        scans += len(nodes)
+        # The rest of the nodes are in another part of a partitioned network
+        if minNode is None:
+            break
+
+        # Add the node to n', inheriting the next hop of its previous hop unless it is a neighbor of the source
+        relaxations += len(minNode.neighbors)
+        nPrime.add(minNodeId)
+        n[minNodeId] = minNodeId if p[minNodeId] == srcNodeId else n[p[minNodeId]]
+
+        # Update d and p
+        for neighbor, cost in minNode.neighbors.items():
+            if neighbor not in nPrime:
+                if d[minNodeId] + cost < d[neighbor]:
+                    d[neighbor] = d[minNodeId] + cost
+                    p[neighbor] = minNodeId
+
+    count('spf_runs')
+    count('scan_steps', scans)
+    count('relaxations', relaxations + len(node.neighbors))
+    return d, p, n
+
+
+def heap_spf(nodes, srcNodeId, unreachableNodes=None):
+    """! Compute the shortest path tree of one source with a binary heap keyed on (d, nodeId).
+
+    Popping the smallest (d, nodeId) pair adds nodes to n' in the same order as scan_spf, so ties are broken
+    towards the smallest nodeId and the resulting d and p are identical. Runs in O(E log V) per source.
+
+    @param nodes            a dictionary of nodes in the network
+    @param srcNodeId        the nodeId of the source node
+    @param unreachableNodes unused, accepted so that every engine shares the scan_spf signature
+
+    @return A tuple (d, p, n), where d is the path cost to each destination, p is the previous hop to each destination,
+      and n is the next hop to each destination.
+    """
+    d = {nodeId: float('inf') for nodeId in nodes}
+    p = {nodeId: None for nodeId in nodes}
+    n = {nodeId: None for nodeId in nodes}
+
+    d[srcNodeId] = 0
+    p[srcNodeId] = srcNodeId
+
+    nPrime = set()
+    heap = [(0, srcNodeId)]
+    pushes = relaxations = 0
+    while heap:
+        minCost, minNodeId = heapq.heappop(heap)
+        # Skip stale heap entries for nodes that are already in n'
+        if minNodeId in nPrime:
+            continue
+        nPrime.add(minNodeId)
+        n[minNodeId] = minNodeId if p[minNodeId] == srcNodeId else n[p[minNodeId]]
+
+        neighbors = nodes[minNodeId].neighbors
+        relaxations += len(neighbors)
+        for neighbor, cost in neighbors.items():
+            if neighbor not in nPrime and minCost + cost < d[neighbor]:
+                d[neighbor] = minCost + cost
+                p[neighbor] = minNodeId
+                heapq.heappush(heap, (d[neighbor], neighbor))
+                pushes += 1
+
+    # Every entry is popped, so the pops follow from the pushes
+    count('spf_runs')
+    count('relaxations', relaxations)
+    count('heap_pushes', pushes + 1)
+    count('heap_pops', pushes + 1)
+    return d, p, n
+
+
+def csr_spf(graph, srcNodeId, unreachableNodes=None):
+    """! Compute the shortest path tree of one source over a compact Graph.
+
+    @param graph            a Graph of the network
+    @param srcNodeId        the nodeId of the source node
+    @param unreachableNodes unused, accepted so that every engine shares the scan_spf signature
+
+    @return A tuple (d, p, n), where d is the path cost to each destination, p is the previous hop to each destination,
+      and n is the next hop to each destination.
+    """
+    d, p, n = csr_dijkstra(graph, graph.index[srcNodeId])
+    nodeIds = graph.nodeIds
+    return (dict(zip(nodeIds, d)),
+            {nodeId: (nodeIds[prevHop] if prevHop >= 0 else None) for nodeId, prevHop in zip(nodeIds, p)},
+            {nodeId: (nodeIds[nextHop] if nextHop >= 0 else None) for nodeId, nextHop in zip(nodeIds, n)})
+
+
+## Shortest path engines that can be selected in update_nodes
+SPF_ENGINES = {
+    'scan': scan_spf,
+    'heap': heap_spf,
+    'csr': csr_spf,
+}
+
+## Engines that compute every source at once, or pick an engine from the topology, instead of running per source
+ALL_PAIRS_ENGINES = ('matrix', 'auto')
+
+
+def update_compact_state(graph):
+    """! Compute the link state information of each node over a Graph and keep it in typed arrays.
+
+    @param graph a Graph of the network
+
+    @return A RoutingState that can be read the same way as the link state dictionary, without the previous hops.
+    """
+    state = RoutingState(graph.nodeIds)
+    for srcIndex in range(len(graph)):
+        d, p, n = csr_dijkstra(graph, srcIndex)
+        state.set_row(srcIndex, d, n)
+    return state
+
+
+def update_all_pairs(graph, compact=False):
+    """! Compute the link state information of every node at once with the dense NumPy matrix engine.
+
+    @param graph   a Graph of the network
+    @param compact if True, return a RoutingState instead of dictionaries
+
+    @return The link state information in the same form as update_nodes or update_compact_state.
+    """
+    order, d, p, n = all_pairs_routes(graph)
+    nodeIds = [graph.nodeIds[i] for i in order]
+
+    if compact:
+        state = RoutingState(nodeIds)
+        for srcIndex in range(len(nodeIds)):
+            state.set_row(srcIndex, d[srcIndex].tolist(), n[srcIndex].tolist())
+        return state
+
+    linkState = {}
+    for srcIndex, srcNodeId in enumerate(nodeIds):
+        linkState[srcNodeId] = (
+            {nodeId: (cost if cost == float('inf') else int(cost)) for nodeId, cost in zip(nodeIds, d[srcIndex].tolist())},
+            {nodeId: (nodeIds[prevHop] if prevHop >= 0 else None) for nodeId, prevHop in zip(nodeIds, p[srcIndex].tolist())},
+            {nodeId: (nodeIds[nextHop] if nextHop >= 0 else None) for nodeId, nextHop in zip(nodeIds, n[srcIndex].tolist())})
+    return linkState
+
+
+def update_parallel(graph, workers, compact=False):
+    """! Compute the link state information of each node over a Graph in a pool of worker processes.
+
+    @param graph   a Graph of the network
+    @param workers the number of worker processes
+    @param compact if True, return a RoutingState instead of dictionaries
+
+    @return The link state information in the same form as update_nodes or update_compact_state.
+    """
+    nodeIds = graph.nodeIds
+    if compact:
+        state = RoutingState(nodeIds)
+        for srcIndex, d, p, n in map_nodes(graph, spf_task, workers):
+            state.set_row(srcIndex, d, n)
+        return state
+
+    linkState = {}
+    for srcIndex, d, p, n in map_nodes(graph, spf_task, workers):
+        linkState[nodeIds[srcIndex]] = (
+            {nodeId: (cost if cost == float('inf') else int(cost)) for nodeId, cost in zip(nodeIds, d)},
+            {nodeId: (nodeIds[prevHop] if prevHop >= 0 else None) for nodeId, prevHop in zip(nodeIds, p)},
+            {nodeId: (nodeIds[nextHop] if nextHop >= 0 else None) for nodeId, nextHop in zip(nodeIds, n)})
+    return linkState
+
+
+def update_nodes(nodes, engine='scan', compact=False, workers=1):
     """! Update the link state information for each node in the network.
 
-    @param nodes a dictionary of nodes in the network
+    @param nodes   a dictionary of nodes in the network, or a Graph of the network which always uses the csr engine
+    @param engine  the name of the shortest path engine in SPF_ENGINES used for each source, 'matrix' for the dense NumPy
+                   engine, or 'auto' to pick between 'matrix' and 'heap' from the density of the topology
+    @param compact if True, return a RoutingState computed over a Graph instead of dictionaries
+    @param workers the number of worker processes, where more than one splits the sources over a process pool using the csr engine
 
     @return A dictionary of link state information for each node, where the key is the nodeId and the value is a tuple (d, p, n),
       where d is the path cost to each destination, p is the previous hop to each destination, and n is the next hop to each destination.
     """
+    if engine not in SPF_ENGINES and engine not in ALL_PAIRS_ENGINES:
+        raise ValueError(f'Unknown shortest path engine: {engine}')
+    if engine == 'auto':
+        graph = nodes if isinstance(nodes, Graph) else Graph.from_nodes(nodes)
+        engine = choose_engine(graph)
+        if engine == 'matrix':
+            return update_all_pairs(graph, compact)
+    if engine == 'matrix':
+        return update_all_pairs(nodes if isinstance(nodes, Graph) else Graph.from_nodes(nodes), compact)
+    if workers > 1:
+        return update_parallel(nodes if isinstance(nodes, Graph) else Graph.from_nodes(nodes), workers, compact)
+    if compact:
+        return update_compact_state(nodes if isinstance(nodes, Graph) else Graph.from_nodes(nodes))
+    if isinstance(nodes, Graph):
+        engine = 'csr'
+    elif engine == 'csr':
+        nodes = Graph.from_nodes(nodes)
+    spf = SPF_ENGINES[engine]
+
     linkState = {}
 
     # Get unreachable nodes
-    unreachableNodes = count_unreachable_nodes(nodes)
+    unreachableNodes = count_unreachable_nodes(nodes) if spf is scan_spf else None
 
-    for nodeId, node in nodes.items():
-        # Intialize n'
-        nPrime = set()
-        nPrime.add(nodeId)
-
-        # Initialize d and p
-        d = {nodeId: float('inf') for nodeId in nodes}
-        p = {nodeId: None for nodeId in nodes}
-
-        d[nodeId] = 0
-        p[nodeId] = nodeId
-
-        # Initialize step for all neighbors
-        for neighbor, cost in node.neighbors.items():
-            d[neighbor] = cost
-            p[neighbor] = nodeId
-
-        # Check that the node is reachable and that there are still nodes to add to n' that are reachable
-        while nodeId not in unreachableNodes and (len(nPrime) < (len(nodes) - len(unreachableNodes))):
-            minCost = float('inf')
-            minNodeId = None
-            minNode = None
-
-            # Find the node not in n' with the smallest d
-            for altNodeId, altNode in nodes.items():
-                if altNodeId not in nPrime:
-                    # Check if the cost is less than the current minCost or if the cost is equal to the current minCost and the nodeId is less (tie breaking)
-                    if d[altNodeId] < minCost or (minNodeId and d[altNodeId] == minCost and (altNodeId < minNodeId)):
-                        minCost = d[altNodeId]
-                        minNodeId = altNodeId
-                        minNode = altNode
-                        
-            if minNode is not None:
-                # Add the node to n'
-                nPrime.add(minNodeId)
-
-                # Update d and p
-                for neighbor, cost in minNode.neighbors.items():
-                    if neighbor not in nPrime:
-                        if d[minNodeId] + cost < d[neighbor]:
-                            d[neighbor] = d[minNodeId] + cost
-                            p[neighbor] = minNodeId
-                    
-        linkState[nodeId] = (d, p)
-
-    # Append the hops dictionary to the link state
-    linkState = find_next_hop(linkState)
+    # Each engine returns the next hops along with the path costs and previous hops
+    for nodeId in nodes:
+        linkState[nodeId] = spf(nodes, nodeId, unreachableNodes)
 
     # Link state should be a dictionary of nodeId -> (d, p, n)
     # where d is the path cost to each destination, p is the previous hop of each destination, and n is the next hop to reach each destination
@@ -234,104 +446,690 @@ def update_nodes(nodes):
     return linkState
 
 
-def change_topology(changes, index, nodes):
-    """! Change the network topology based on the given changes.
+class LazyLinkState:
+    """! Link state information that computes the shortest path tree of a source the first time it is read.
 
-    @param changes a list of topology changes
-    @param index   the index of the change to apply
-    @param nodes   a dictionary of nodes in the network
+    The state can be used in place of the linkState dictionary. Trees are kept in a bounded RouteCache, so only the
+    sources that are actually read, such as the sources of the messages and the routers along their paths, are computed.
+    The all pairs engines fall back to the heap engine, since they cannot compute a single source.
 
-    @return The updated link state information after applying the change.
+    Attributes:
+    - nodes: a dictionary of nodes in the network
+    - engine: the name of the shortest path engine in SPF_ENGINES used for each source
+    - graph: a Graph of the network for the csr engine, built on first use
+    - unreachableNodes: the set of nodeIds without neighbors for the scan engine, found on first use
+    - cache: a RouteCache of the tuple (d, p, n) of each source that was read
+
+    Methods:
+    - invalidate(): drop every computed tree after the topology changed
     """
-    nodeId, neighborId, cost = changes[index]
+    __slots__ = ('nodes', 'engine', 'graph', 'unreachableNodes', 'cache')
+
+    def __init__(self, nodes, engine='scan', capacity=1024):
+        """! Initializing the LazyLinkState object.
 
-    # Remove links if cost is -999
-    if cost == -999:
+        @param nodes    A dictionary of nodes in the network.
+        @param engine   The name of the shortest path engine, where 'matrix' and 'auto' use the heap engine.
+        @param capacity The largest number of shortest path trees that are kept.
+        """
+        if engine not in SPF_ENGINES and engine not in ALL_PAIRS_ENGINES:
+            raise ValueError(f'Unknown shortest path engine: {engine}')
+        self.nodes = nodes
+        self.engine = 'heap' if engine in ALL_PAIRS_ENGINES else engine
+        self.graph = None
+        self.unreachableNodes = None
+        self.cache = RouteCache(self.compute_tree, capacity)
+
+    def compute_tree(self, srcNodeId):
+        """! Compute the shortest path tree of one source with the selected engine.
+
+        @param srcNodeId The nodeId of the source node.
+
+        @return A tuple (d, p, n) as returned by the engine.
+        """
+        if self.engine == 'csr':
+            if self.graph is None:
+                self.graph = Graph.from_nodes(self.nodes)
+            return csr_spf(self.graph, srcNodeId)
+        if self.engine == 'scan' and self.unreachableNodes is None:
+            self.unreachableNodes = count_unreachable_nodes(self.nodes)
+        return SPF_ENGINES[self.engine](self.nodes, srcNodeId, self.unreachableNodes)
+
+    def invalidate(self):
+        """! Drop every computed tree, so that the next reads use the current topology.
+        """
+        self.cache.invalidate()
+        self.graph = None
+        self.unreachableNodes = None
+
+    def __getitem__(self, srcNodeId):
+        """! Get the link state information of a source, computing it if it is not cached.
+
+        @param srcNodeId The nodeId of the source node.
+
+        @return A tuple (d, p, n) of the path cost, previous hop and next hop to each destination.
+        """
+        if srcNodeId not in self.nodes:
+            raise KeyError(srcNodeId)
+        return self.cache.get(srcNodeId)
+
+    def __contains__(self, srcNodeId):
+        """! Check if a nodeId is a source in the network.
+
+        @param srcNodeId The nodeId to check.
+
+        @return True if the nodeId is in the network.
+        """
+        return srcNodeId in self.nodes
+
+    def __len__(self):
+        """! Get the number of sources in the network.
+
+        @return The number of sources.
+        """
+        return len(self.nodes)
+
+    def __iter__(self):
+        """! Iterate over the nodeIds of the sources.
+
+        @return An iterator of nodeIds.
+        """
+        return iter(self.nodes)
+
+    def items(self):
+        """! Iterate over the sources and their link state information, computing every tree.
+
+        @return An iterator of tuples (srcNodeId, (d, p, n)).
+        """
+        return ((nodeId, self[nodeId]) for nodeId in self.nodes)
+
+
+def get_subtree(nodes, p, rootNodeId):
+    """! Get the nodes whose shortest path from the source passes through the given node.
+
+    Children are found through the neighbors of each node, so the cost is proportional to the size of the subtree.
+
+    @param nodes      a dictionary of nodes in the network
+    @param p          the previous hop to each destination from the source
+    @param rootNodeId the nodeId at the root of the subtree
+
+    @return A set of nodeIds in the subtree, including the root.
+    """
+    subtree = {rootNodeId}
+    stack = [rootNodeId]
+    while stack:
+        currNodeId = stack.pop()
+        for neighbor in nodes[currNodeId].neighbors:
+            if p[neighbor] == currNodeId and neighbor not in subtree:
+                subtree.add(neighbor)
+                stack.append(neighbor)
+    return subtree
+
+
+def find_previous_hop(nodes, d, nodeId):
+    """! Find the previous hop of a node the same way the shortest path engines break ties.
+
+    The engines keep the first neighbor added to n' that reaches the node at its path cost, which is the
+    neighbor on a shortest path with the smallest (d, nodeId).
+
+    @param nodes  a dictionary of nodes in the network
+    @param d      the path cost to each destination from the source
+    @param nodeId the nodeId of the node to find the previous hop of
+
+    @return The nodeId of the previous hop, or None if the node is unreachable.
+    """
+    prevHop = None
+    for neighbor, cost in nodes[nodeId].neighbors.items():
+        if d[neighbor] + cost == d[nodeId]:
+            if prevHop is None or (d[neighbor], neighbor) < (d[prevHop], prevHop):
+                prevHop = neighbor
+    return prevHop
+
+
+def update_next_hops(srcNodeId, d, p, n, nodeIds):
+    """! Recompute the next hop of the given nodes from their previous hops.
+
+    @param srcNodeId the nodeId of the source node
+    @param d         the path cost to each destination from the source
+    @param p         the previous hop to each destination from the source
+    @param n         the next hop to each destination from the source
+    @param nodeIds   the nodeIds to update, which must contain every node whose previous hop chain changed
+    """
+    # A previous hop always has a smaller path cost, so it is updated before the nodes that follow it
+    for nodeId in sorted(nodeIds, key=lambda x: (d[x], x)):
+        if p[nodeId] is None:
+            n[nodeId] = None
+        elif p[nodeId] == srcNodeId:
+            n[nodeId] = nodeId
+        else:
+            n[nodeId] = n[p[nodeId]]
+
+
+def repair_cost_increase(nodes, srcNodeId, d, p, n, rootNodeId):
+    """! Repair the shortest path tree of one source after a link on the tree got more expensive or was removed.
+
+    Only the subtree below the link can change, so its nodes are reset and rebuilt from the costs of the
+    nodes around it.
+
+    @param nodes      a dictionary of nodes in the network, with the change already applied
+    @param srcNodeId  the nodeId of the source node
+    @param d          the path cost to each destination from the source
+    @param p          the previous hop to each destination from the source
+    @param n          the next hop to each destination from the source
+    @param rootNodeId the endpoint of the changed link that is further from the source
+    """
+    subtree = get_subtree(nodes, p, rootNodeId)
+    for nodeId in subtree:
+        d[nodeId] = float('inf')
+        p[nodeId] = None
+
+    # Seed the subtree with the best path entering it from outside
+    heap = []
+    for nodeId in subtree:
+        for neighbor, cost in nodes[nodeId].neighbors.items():
+            if neighbor not in subtree and d[neighbor] + cost < d[nodeId]:
+                d[nodeId] = d[neighbor] + cost
+        if d[nodeId] != float('inf'):
+            heap.append((d[nodeId], nodeId))
+    heapq.heapify(heap)
+
+    # Run Dijkstra inside the subtree
+    settled = set()
+    while heap:
+        minCost, minNodeId = heapq.heappop(heap)
+        if minNodeId in settled:
+            continue
+        settled.add(minNodeId)
+        for neighbor, cost in nodes[minNodeId].neighbors.items():
+            if neighbor in subtree and neighbor not in settled and minCost + cost < d[neighbor]:
+                d[neighbor] = minCost + cost
+                heapq.heappush(heap, (d[neighbor], neighbor))
+
+    for nodeId in settled:
+        p[nodeId] = find_previous_hop(nodes, d, nodeId)
+    update_next_hops(srcNodeId, d, p, n, subtree)
+
+
+def repair_cost_decrease(nodes, srcNodeId, d, p, n, nodeId, neighborId, cost):
+    """! Repair the shortest path tree of one source after a link got cheaper or was added.
+
+    Decreases are pushed outwards from the link, then the previous hops around the decreased nodes are
+    rechecked and the next hops are updated below every node whose previous hop changed.
+
+    @param nodes      a dictionary of nodes in the network, with the change already applied
+    @param srcNodeId  the nodeId of the source node
+    @param d          the path cost to each destination from the source
+    @param p          the previous hop to each destination from the source
+    @param n          the next hop to each destination from the source
+    @param nodeId     one endpoint of the changed link
+    @param neighborId the other endpoint of the changed link
+    @param cost       the new cost of the link
+    """
+    heap = []
+    for fromNodeId, toNodeId in ((nodeId, neighborId), (neighborId, nodeId)):
+        if d[fromNodeId] + cost < d[toNodeId]:
+            d[toNodeId] = d[fromNodeId] + cost
+            heap.append((d[toNodeId], toNodeId))
+    heapq.heapify(heap)
+
+    decreased = set()
+    while heap:
+        minCost, minNodeId = heapq.heappop(heap)
+        if minCost > d[minNodeId]:
+            continue
+        decreased.add(minNodeId)
+        for neighbor, linkCost in nodes[minNodeId].neighbors.items():
+            if minCost + linkCost < d[neighbor]:
+                d[neighbor] = minCost + linkCost
+                heapq.heappush(heap, (d[neighbor], neighbor))
+
+    # A previous hop can only change next to a decreased node or on the changed link when it ties
+    candidates = {nodeId, neighborId}
+    for decreasedNodeId in decreased:
+        candidates.add(decreasedNodeId)
+        candidates.update(nodes[decreasedNodeId].neighbors)
+    candidates.discard(srcNodeId)
+
+    changed = []
+    for candidate in candidates:
+        if d[candidate] == float('inf'):
+            continue
+        prevHop = find_previous_hop(nodes, d, candidate)
+        if prevHop != p[candidate]:
+            p[candidate] = prevHop
+            changed.append(candidate)
+
+    affected = set()
+    for candidate in changed:
+        if candidate not in affected:
+            affected.update(get_subtree(nodes, p, candidate))
+    update_next_hops(srcNodeId, d, p, n, affected)
+
+
+def update_link_state(nodes, linkState, nodeId, neighborId, oldCost, newCost, engine='scan', workers=1):
+    """! Repair the link state information in place after a single link change.
+
+    Each source is checked in constant time and only sources whose shortest path tree is affected by the
+    link are repaired. Ties are broken the same way as the shortest path engines, so the result is identical
+    to running update_nodes again. Non-positive costs fall back to a full recompute.
+
+    @param nodes      a dictionary of nodes in the network, with the change already applied
+    @param linkState  the link state information for each node before the change
+    @param nodeId     one endpoint of the changed link
+    @param neighborId the other endpoint of the changed link
+    @param oldCost    the cost of the link before the change, or None if there was no link
+    @param newCost    the cost of the link after the change, or None if the link was removed
+    @param engine     the name of the shortest path engine used for a full recompute
+    @param workers    the number of worker processes used for a full recompute
+
+    @return The updated link state information.
+    """
+    if oldCost == newCost:
+        return linkState
+    if newCost is not None and newCost <= 0:
+        return update_nodes(nodes, engine, workers=workers)
+
+    repaired = 0
+    for srcNodeId, (d, p, n) in linkState.items():
+        if newCost is None or (oldCost is not None and newCost > oldCost):
+            # Only a link on the shortest path tree can change the tree when it gets more expensive
+            if p[neighborId] == nodeId:
+                repair_cost_increase(nodes, srcNodeId, d, p, n, neighborId)
+                repaired += 1
+            elif p[nodeId] == neighborId:
+                repair_cost_increase(nodes, srcNodeId, d, p, n, nodeId)
+                repaired += 1
+        else:
+            # Only a link that is at least as short as the current paths can change the tree when it gets cheaper
+            if d[nodeId] + newCost <= d[neighborId] or d[neighborId] + newCost <= d[nodeId]:
+                repair_cost_decrease(nodes, srcNodeId, d, p, n, nodeId, neighborId, newCost)
+                repaired += 1
+
+    count('repaired_trees', repaired)
+    return linkState
+
+
+def apply_change(nodes, change):
+    """! Apply one topology change to the nodes without updating the link state information.
+
+    @param nodes  a dictionary of nodes in the network
+    @param change a tuple (nodeId, neighborId, cost), where a cost of LINK_REMOVED removes the link
+
+    @return The cost of the link before the change, or None if there was no link.
+    """
+    nodeId, neighborId, cost = change
+    oldCost = nodes[nodeId].neighbors.get(neighborId)
+
+    # Remove links if cost is LINK_REMOVED
+    if cost == LINK_REMOVED:
         nodes[nodeId].remove_neighbor(neighborId)
         nodes[neighborId].remove_neighbor(nodeId)
     # Otherwise update the costs
     else:
         nodes[nodeId].neighbors[neighborId] = cost
         nodes[neighborId].neighbors[nodeId] = cost
+    return oldCost
+
+
+def change_topology(changes, index, nodes, engine='scan', linkState=None, compact=False, workers=1):
+    """! Change the network topology based on the given changes.
+
+    @param changes   a list of topology changes
+    @param index     the index of the change to apply
+    @param nodes     a dictionary of nodes in the network
+    @param engine    the name of the shortest path engine used to recompute the link state
+    @param linkState the current link state information, which is repaired in place instead of recomputed if given,
+                     a LazyLinkState whose cached trees are dropped, or an AreaLinkState that recomputes the areas of the link
+    @param compact   if True, recompute the link state as a RoutingState
+    @param workers   the number of worker processes used to recompute the link state
+
+    @return The updated link state information after applying the change.
+    """
+    nodeId, neighborId, cost = changes[index]
+    oldCost = apply_change(nodes, changes[index])
 
     # Update the link state information
-    updatedState = update_nodes(nodes)
+    if isinstance(linkState, LazyLinkState):
+        linkState.invalidate()
+        return linkState
+    if isinstance(linkState, AreaLinkState):
+        linkState.update_links([(nodeId, neighborId)])
+        return linkState
+    if linkState is not None:
+        return update_link_state(nodes, linkState, nodeId, neighborId, oldCost, None if cost == LINK_REMOVED else cost, engine, workers)
+    updatedState = update_nodes(nodes, engine, compact, workers)
     return updatedState
 
 
+def change_topology_batch(batch, nodes, engine='scan', linkState=None, compact=False, workers=1):
+    """! Change the network topology based on a batch of changes and update the link state once.
+
+    @param batch     a list of topology changes, usually coalesced to one change per link
+    @param nodes     a dictionary of nodes in the network
+    @param engine    the name of the shortest path engine used to recompute the link state
+    @param linkState the current link state information, which is repaired in place one change at a time instead of
+                     recomputed if given, a LazyLinkState whose cached trees are dropped, or an AreaLinkState that
+                     recomputes each area the batch touches once
+    @param compact   if True, recompute the link state as a RoutingState
+    @param workers   the number of worker processes used to recompute the link state
+
+    @return The updated link state information after applying every change of the batch.
+    """
+    if isinstance(linkState, LazyLinkState):
+        for change in batch:
+            apply_change(nodes, change)
+        linkState.invalidate()
+        return linkState
+    if isinstance(linkState, AreaLinkState):
+        for change in batch:
+            apply_change(nodes, change)
+        linkState.update_links([change[:2] for change in batch])
+        return linkState
+    if linkState is not None:
+        for nodeId, neighborId, cost in batch:
+            oldCost = apply_change(nodes, (nodeId, neighborId, cost))
+            linkState = update_link_state(nodes, linkState, nodeId, neighborId, oldCost, None if cost == LINK_REMOVED else cost, engine, workers)
+        return linkState
+    for change in batch:
+        apply_change(nodes, change)
+    return update_nodes(nodes, engine, compact, workers)
+
+
+def get_tables(linkState):
+    """! Get the rows of the routing table of each node from the link state information.
+
+    @param linkState the link state information for each node
+
+    @return A generator of tuples (nodeId, rows) in nodeId order, where rows is a list of tuples (dest, nextHop, pathCost)
+      for every reachable destination in nodeId order.
+    """
+    nodeIds = sorted(linkState)
+    for i in nodeIds:
+        d, _, n = linkState[i]
+        yield i, [(j, n[j], d[j]) for j in nodeIds if d[j] != float('inf')]
+
+
 def write_topology(linkState, file):
     """! Write the node topology information to the given file.
 
     @param linkState the link state information for each node
-    @param file the file to write the information to
+    @param file the file to write the information to, where a RouteWriter may write only the changed routes
+    """
+    if isinstance(file, RouteWriter):
+        file.write_table(get_tables(linkState))
+    else:
+        for _, rows in get_tables(linkState):
+            file.write(format_table(rows))
+
+
+def format_route(linkState, srcNodeId, dstNodeId, pathQuery=None):
+    """! Format the route of a message from the source node to the destination node.
+
+    @param linkState    the link state information for each node
+    @param srcNodeId    the nodeId of the source node
+    @param dstNodeId    the nodeId of the destination node
+    @param pathQuery    a PathQuery of the current topology that answers the route on its own instead of the link state
+
+    @return The output line of a message up to the message text, "from src to dst cost pathCost hops ...", where
+      "cost pathCost summarized" marks a route of a summarized AreaLinkState that may be longer than the shortest path.
     """
-    for i in range(1, len(linkState)+1):
-        for j in range(1, len(linkState)+1):
-            dest = j
-            next_hop = linkState[i][2][j]
-            path_cost = linkState[i][0][j]
+    if pathQuery is not None:
+        cost, hops = pathQuery.route(srcNodeId, dstNodeId) or (float('inf'), None)
+    else:
+        hops = get_hops(linkState, srcNodeId, dstNodeId)
+        cost = linkState[srcNodeId][0][dstNodeId]
+
+    if cost == float('inf'):
+        return f'from {srcNodeId} to {dstNodeId} cost infinite hops unreachable'
+    if isinstance(linkState, AreaLinkState) and linkState.is_summarized(srcNodeId, dstNodeId):
+        cost = f'{cost} summarized'
+    return f'from {srcNodeId} to {dstNodeId} cost {cost} hops {" ".join(str(x) for x in hops)}'
+
 
-            if path_cost != float('inf'):
-                file.write(f'{dest} {next_hop} {path_cost}\n')
-        file.write('\n')
+def format_flow(ecmp, srcNodeId, dstNodeId, msgText):
+    """! Format the route of a message that is spread over the equal cost paths by the hash of its flow.
 
+    @param ecmp         an EcmpRoutes of the current topology
+    @param srcNodeId    the nodeId of the source node
+    @param dstNodeId    the nodeId of the destination node
+    @param msgText      the text of the message, which is part of its flow
+
+    @return The output line of a message up to the message text, as returned by format_route.
+    """
+    route = ecmp.route(srcNodeId, dstNodeId, flow_key(srcNodeId, dstNodeId, msgText))
+    if route is None:
+        return f'from {srcNodeId} to {dstNodeId} cost infinite hops unreachable'
+    cost, path = route
+    return f'from {srcNodeId} to {dstNodeId} cost {cost} hops {" ".join(str(x) for x in path[:-1])}'
 
-def write_messages(linkState, msgs, file):
+
+def write_messages(linkState, msgs, file, pathQuery=None, pathCache=None, ecmp=None):
     """! Write the messages and their corresponding paths to the given file.
 
     @param linkState    the link state information for each node
     @param msgs         a list of messages to be sent
     @param file         the file to write the information to
+    @param pathQuery    a PathQuery of the current topology that answers each message on its own instead of the link state
+    @param pathCache    a RouteCache of the formatted route of each (srcNodeId, dstNodeId) in the current topology, so that
+                        messages between the same nodes are only routed once
+    @param ecmp         an EcmpRoutes of the current topology that spreads the messages over the equal cost paths, instead
+                        of the link state and the pathCache
     """
+    lines = []
     for srcNodeId, dstNodeId, msgText in msgs:
-        hops = get_hops(linkState, srcNodeId, dstNodeId)
-        cost = linkState[srcNodeId][0][dstNodeId]
-
-        if cost == float('inf'):
-            file.write(f'from {srcNodeId} to {dstNodeId} cost infinite hops unreachable message {msgText}\n')
+        if ecmp is not None:
+            route = format_flow(ecmp, srcNodeId, dstNodeId, msgText)
+        elif pathCache is not None:
+            route = pathCache.get((srcNodeId, dstNodeId))
         else:
-            file.write(f'from {srcNodeId} to {dstNodeId} cost {cost} hops {" ".join(str(x) for x in hops)} message {msgText}\n')
+            route = format_route(linkState, srcNodeId, dstNodeId, pathQuery)
+        lines.append(f'{route} message {msgText}\n')
+    file.write(''.join(lines))
+
+
+def write_message_file(linkState, messageFile, file, pathQuery=None, pathCache=None, chunkSize=MESSAGE_CHUNK_SIZE, ecmp=None):
+    """! Stream the messages from the given file and write them with their corresponding paths, one chunk at a time.
+
+    @param linkState    the link state information for each node
+    @param messageFile  the file containing the messages to be sent
+    @param file         the file to write the information to
+    @param pathQuery    a PathQuery of the current topology that answers each message on its own instead of the link state
+    @param pathCache    a RouteCache of the formatted route of each (srcNodeId, dstNodeId) in the current topology
+    @param chunkSize    the number of messages that are read and written at a time
+    @param ecmp         an EcmpRoutes of the current topology that spreads the messages over the equal cost paths
+    """
+    for msgs in read_message_chunks(messageFile, chunkSize):
+        write_messages(linkState, msgs, file, pathQuery, pathCache, ecmp)
 
 
-def link_state_routing(topologyFile, messageFile, changeFile, outputFile='output.txt'):
+def link_state_routing(topologyFile, messageFile, changeFile, outputFile='output.txt', engine='scan', incremental=False, compact=False,
+                       workers=1, delta=False, lazy=False, fullTables=False, cacheSize=1024, pointToPoint=False, landmarks=0,
+                       chunkSize=MESSAGE_CHUNK_SIZE, saveSnapshot=None, loadSnapshot=None, batchSize=1, areas=None, areaSize=None,
+                       summarize=False, ecmp=False, linkLoad=None):
     """! Execute the link state routing algorithm using the given files as input.
 
+    When statistics are enabled in the instrument module, the parse, compute, tables and messages phases of the initial
+    topology and of every change are recorded.
+
     @param topologyFile    the file containing the network topology information
     @param messageFile     the file containing the messages to be sent
     @param changeFile      the file containing the topology changes
     @param outputFile      the file to write the output to
+    @param engine          the name of the shortest path engine in SPF_ENGINES
+    @param incremental     repair the link state after each change instead of recomputing it
+    @param compact         keep the link state in a RoutingState of typed arrays
+    @param workers         the number of worker processes used to compute the link state
+    @param delta           after each change, write only the routes that changed instead of every routing table
+    @param lazy            compute the shortest path tree of a source only when it is read, and skip the routing tables
+    @param fullTables      in lazy mode, still write the routing table of every node
+    @param cacheSize       in lazy mode, the largest number of shortest path trees that are kept
+    @param pointToPoint    answer each message with a bidirectional search instead of reading the link state
+    @param landmarks       with pointToPoint, the number of landmarks used for lower bounds on the path costs
+    @param chunkSize       the number of messages that are read and written at a time
+    @param saveSnapshot    the path of a snapshot file the link state of the initial topology is saved to
+    @param loadSnapshot    the path of a snapshot file the link state of the initial topology is loaded from instead of computed
+    @param batchSize       the number of consecutive changes that are coalesced and applied before the link state is
+                           updated and written once, where 1 writes the output after every change
+    @param areas           split the nodes into areas and compute the link state area by area: 'auto' to partition the
+                           topology, or the path of a file of "nodeId areaId" lines; in lazy mode the tables are skipped
+    @param areaSize        with areas='auto', the largest number of nodes of an area, or None for the square root of the
+                           number of nodes
+    @param summarize       with areas, route between areas with the summarized path costs of the border routers
+    @param ecmp            spread the messages over every equal cost path by the hash of their flow
+    @param linkLoad        with ecmp, the path of a file the number of messages sent over each link is written to, one
+                           block per topology
 
     @return A file containing the output of the link state routing algorithm
     """
-    nodes = read_topology_file(topologyFile)
-    msgs = read_message_file(messageFile)
-    changes = read_topology_change_file(changeFile)
-    file = open(outputFile, 'w')
-    file = open(outputFile, 'a')
-
-    linkState = update_nodes(nodes)
-    write_topology(linkState, file)
-    write_messages(linkState, msgs, file)
-    
-    for i in range(len(changes)):
-        file.write('\n')
-        linkState = change_topology(changes, i, nodes)
-        write_topology(linkState, file)
-        write_messages(linkState, msgs, file)
-
-    file.close()
+    if incremental and compact:
+        raise ValueError('The incremental mode needs the previous hops, which the compact state does not keep')
+    if lazy and (incremental or compact or workers > 1):
+        raise ValueError('The lazy mode computes one source at a time and cannot be combined with incremental, compact or workers')
+    if lazy and (saveSnapshot or loadSnapshot):
+        raise ValueError('The lazy mode has no link state to save or load')
+    if areas is not None and (incremental or compact or workers > 1 or pointToPoint or saveSnapshot or loadSnapshot):
+        raise ValueError('The area mode keeps its own state and cannot be combined with incremental, compact, workers, '
+                         'point to point or snapshots')
+    if summarize and areas is None:
+        raise ValueError('The summarized mode needs areas')
+    if ecmp and (pointToPoint or summarize):
+        raise ValueError('The equal cost multipath mode needs exact path costs of every node and cannot be combined with '
+                         'point to point or summarized areas')
+    if linkLoad and not ecmp:
+        raise ValueError('The link load is only counted in the equal cost multipath mode')
+
+    # The engines that run over a Graph read the topology straight into one, and the nodes are only built from it once a
+    # change or the equal cost multipath mode needs them
+    graphFirst = (compact or workers > 1 or engine in ('csr', 'matrix')) and not (lazy or incremental or areas is not None)
+    with phase('parse'):
+        if graphFirst:
+            graph = read_topology_graph(topologyFile)
+            nodes = create_nodes(graph_adjacency(graph)) if ecmp else None
+        else:
+            graph = None
+            nodes = read_topology_file(topologyFile)
+        changes = read_topology_change_file(changeFile)
+    with RouteWriter(outputFile, delta) as file, open(linkLoad, 'w') if linkLoad else nullcontext() as loadFile, keep_pool(workers):
+        with phase('compute'):
+            if graph is None and (loadSnapshot or saveSnapshot or pointToPoint):
+                graph = Graph.from_nodes(nodes)
+            if loadSnapshot:
+                linkState = load_link_state(loadSnapshot, graph, compact)
+            elif areas is not None:
+                areaOf = partition_areas(nodes, areaSize) if areas == 'auto' else read_areas(areas)
+                linkState = AreaLinkState(nodes, areaOf, summarize, cacheSize)
+            elif lazy:
+                linkState = LazyLinkState(nodes, engine, cacheSize)
+            else:
+                linkState = update_nodes(graph if graphFirst else nodes, engine, compact, workers)
+            if saveSnapshot:
+                save_link_state(saveSnapshot, graph, linkState)
+            pathQuery = PathQuery(graph, landmarks) if pointToPoint else None
+        # The cache routes with whatever linkState and pathQuery hold, so it only has to be emptied after each change
+        pathCache = RouteCache(lambda pair: format_route(linkState, pair[0], pair[1], pathQuery), PATH_CACHE_SIZE)
+        # Links are undirected, so the cost of every node towards a destination comes from the one tree of the destination
+        ecmpRoutes = EcmpRoutes(nodes, lambda nodeId, dstNodeId: linkState[dstNodeId][0][nodeId]) if ecmp else None
+        if fullTables or not lazy:
+            with phase('tables'):
+                write_topology(linkState, file)
+        with phase('messages'):
+            write_message_file(linkState, messageFile, file, pathQuery, pathCache, chunkSize, ecmpRoutes)
+        if loadFile is not None:
+            loadFile.write(format_link_load(nodes, ecmpRoutes.take_load()))
+
+        # The lazy and area states are always updated in place
+        keep = incremental or lazy or areas is not None
+        for batchIndex, batch in enumerate(batch_changes(changes, batchSize), start=1):
+            set_change(batchIndex)
+            file.write('\n')
+            with phase('compute'):
+                if nodes is None:
+                    nodes = create_nodes(graph_adjacency(graph))
+                if batchSize == 1:
+                    linkState = change_topology(batch, 0, nodes, engine, linkState if keep else None, compact, workers)
+                else:
+                    # A batch whose changes cancel each other out leaves the link state as it is
+                    batch = coalesce_changes(nodes, batch)
+                    if batch:
+                        linkState = change_topology_batch(batch, nodes, engine, linkState if keep else None, compact, workers)
+                if pointToPoint:
+                    pathQuery = PathQuery(Graph.from_nodes(nodes), landmarks)
+            pathCache.invalidate()
+            if ecmpRoutes is not None:
+                ecmpRoutes.invalidate()
+            if fullTables or not lazy:
+                with phase('tables'):
+                    write_topology(linkState, file)
+            with phase('messages'):
+                write_message_file(linkState, messageFile, file, pathQuery, pathCache, chunkSize, ecmpRoutes)
+            if loadFile is not None:
+                loadFile.write(format_link_load(nodes, ecmpRoutes.take_load()))
 
 
 if __name__ == "__main__":
-    import sys
-
-    if len(sys.argv) < 4:
-        print("Usage: python lsr.py <topologyFile> <messageFile> <changesFile> [outputFile]")
-        sys.exit(1)
-
-    topologyFile = sys.argv[1]
-    messageFile = sys.argv[2]
-    changeFile = sys.argv[3]
-    outputFile = sys.argv[4] if len(sys.argv) >= 5 else "output.txt"
-
-    link_state_routing(topologyFile, messageFile, changeFile, outputFile)
\ No newline at end of file
+    import argparse
+
+    import instrument
+
+    parser = argparse.ArgumentParser(description="Run the link state routing protocol.")
+    parser.add_argument("topologyFile", help="the file containing the network topology information")
+    parser.add_argument("messageFile", help="the file containing the messages to be sent")
+    parser.add_argument("changeFile", help="the file containing the topology changes")
+    parser.add_argument("outputFile", nargs="?", default="output.txt", help="the file to write the output to")
+    parser.add_argument("--engine", choices=sorted(SPF_ENGINES) + list(ALL_PAIRS_ENGINES), default="scan", help="the shortest path engine")
+    parser.add_argument("--incremental", action="store_true", help="repair only the affected shortest path trees after each change")
+    parser.add_argument("--compact", action="store_true", help="keep path costs and next hops in typed arrays instead of dictionaries")
+    parser.add_argument("--workers", type=int, default=1, help="the number of worker processes used to compute the link state")
+    parser.add_argument("--delta", action="store_true", help="after each change, write only the routes that changed")
+    parser.add_argument("--lazy", action="store_true", help="compute shortest path trees only for the routers the messages are sent through")
+    parser.add_argument("--full-tables", action="store_true", help="in lazy mode, still write the routing table of every node")
+    parser.add_argument("--cache-size", type=int, default=1024, help="in lazy mode, the largest number of shortest path trees that are kept")
+    parser.add_argument("--point-to-point", action="store_true", help="answer each message with a bidirectional search between its source and destination")
+    parser.add_argument("--landmarks", type=int, default=0, help="with --point-to-point, the number of landmarks used for lower bounds")
+    parser.add_argument("--chunk-size", type=int, default=MESSAGE_CHUNK_SIZE, help="the number of messages that are read and written at a time")
+    parser.add_argument("--batch-size", type=int, default=1, help="the number of consecutive changes that are coalesced and applied before one recompute")
+    parser.add_argument("--areas", metavar="FILE|auto", help="compute the link state area by area, with the areas of a \"nodeId areaId\" file or an automatic partition")
+    parser.add_argument("--area-size", type=int, help="with --areas auto, the largest number of nodes of an area (default the square root of the number of nodes)")
+    parser.add_argument("--summarize", action="store_true", help="with --areas, route between areas with the summarized costs of the border routers")
+    parser.add_argument("--ecmp", action="store_true", help="spread the messages over every equal cost path by the hash of their flow")
+    parser.add_argument("--link-load", metavar="FILE", help="with --ecmp, write the number of messages sent over each link after each topology")
+    parser.add_argument("--stats", choices=instrument.REPORT_FORMATS, help="record the time of each phase and counters of the work done, and write them as JSON lines or a table")
+    parser.add_argument("--stats-file", metavar="FILE", help="write the statistics to a file instead of standard error")
+    parser.add_argument("--save-snapshot", metavar="FILE", help="save the link state of the initial topology to a snapshot file")
+    parser.add_argument("--load-snapshot", metavar="FILE", help="load the link state of the initial topology from a snapshot file instead of computing it")
+    args = parser.parse_args()
+    if args.incremental and args.compact:
+        parser.error("--incremental cannot be combined with --compact")
+    if args.lazy and (args.incremental or args.compact or args.workers > 1):
+        parser.error("--lazy cannot be combined with --incremental, --compact or --workers")
+    if args.full_tables and not args.lazy:
+        parser.error("--full-tables only applies with --lazy")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be at least 1")
+    if args.chunk_size < 1:
+        parser.error("--chunk-size must be at least 1")
+    if args.lazy and (args.save_snapshot or args.load_snapshot):
+        parser.error("--lazy cannot be combined with --save-snapshot or --load-snapshot")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.areas and (args.incremental or args.compact or args.workers > 1 or args.point_to_point or args.save_snapshot or args.load_snapshot):
+        parser.error("--areas cannot be combined with --incremental, --compact, --workers, --point-to-point or snapshots")
+    if args.area_size is not None and args.areas != "auto":
+        parser.error("--area-size only applies with --areas auto")
+    if args.area_size is not None and args.area_size < 1:
+        parser.error("--area-size must be at least 1")
+    if args.summarize and not args.areas:
+        parser.error("--summarize only applies with --areas")
+    if args.ecmp and (args.point_to_point or args.summarize):
+        parser.error("--ecmp cannot be combined with --point-to-point or --summarize")
+    if args.link_load and not args.ecmp:
+        parser.error("--link-load only applies with --ecmp")
+
+    if args.stats:
+        instrument.enable()
+    link_state_routing(args.topologyFile, args.messageFile, args.changeFile, args.outputFile, args.engine, args.incremental, args.compact,
+                       args.workers, args.delta, args.lazy, args.full_tables, args.cache_size, args.point_to_point, args.landmarks,
+                       args.chunk_size, args.save_snapshot, args.load_snapshot, args.batch_size, args.areas, args.area_size,
+                       args.summarize, args.ecmp, args.link_load)
+    if args.stats:
+        instrument.write_report(args.stats, args.stats_file)
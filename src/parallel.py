@@ -0,0 +1,241 @@
+##
+# @file parallel.py
+
+import multiprocessing
+from array import array
+from contextlib import nullcontext
+from multiprocessing import shared_memory
+
+from graph import Graph, csr_bellman_ford, csr_dijkstra
+from routingstate import next_hops_from_previous
+
+## The Graph the worker process last read from shared memory
+workerGraph = None
+
+## The name of the shared memory workerGraph was read from
+workerGraphName = None
+
+## WorkerPool that map_nodes reuses while a run keeps one open, or None
+workerPool = None
+
+
+def write_shared_graph(graph):
+    """! Copy a Graph into a new block of shared memory that worker processes can read it from.
+
+    The block holds the number of nodes and directed links, followed by the nodeIds, offsets and costs as int64 and
+    the targets as int32, so every array stays aligned.
+
+    @param graph A Graph of the network topology.
+
+    @return The SharedMemory of the graph, which the caller has to unlink.
+    """
+    parts = [array('q', [len(graph.nodeIds), len(graph.targets)]), array('q', graph.nodeIds), graph.offsets, graph.costs,
+             graph.targets]
+    memory = shared_memory.SharedMemory(create=True, size=sum(len(part) * part.itemsize for part in parts))
+    position = 0
+    for part in parts:
+        data = memoryview(part).cast('B')
+        memory.buf[position:position + len(data)] = data
+        position += len(data)
+    return memory
+
+
+def read_shared_graph(name):
+    """! Read a Graph that write_shared_graph copied into shared memory.
+
+    @param name The name of the shared memory.
+
+    @return A Graph with its own copy of the arrays, so the shared memory can be unlinked while it is in use.
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        numNodes, numLinks = memory.buf[:16].cast('q')
+        parts = []
+        position = 16
+        for typecode, length in (('q', numNodes), ('q', numNodes + 1), ('q', numLinks), ('i', numLinks)):
+            part = array(typecode)
+            part.frombytes(memory.buf[position:position + length * part.itemsize])
+            parts.append(part)
+            position += length * part.itemsize
+    finally:
+        memory.close()
+    nodeIds, offsets, costs, targets = parts
+    return Graph(nodeIds.tolist(), offsets, targets, costs)
+
+
+def run_chunk(args):
+    """! Run a task over a chunk of node indexes in a worker process, reading the Graph first when it changed.
+
+    @param args A tuple (task, name, chunk) of spf_task or bellman_ford_task, the name of the shared memory of the Graph
+                and the argument of the task.
+
+    @return The result of the task.
+    """
+    global workerGraph, workerGraphName
+    task, name, chunk = args
+    if name != workerGraphName:
+        workerGraph = read_shared_graph(name)
+        workerGraphName = name
+    return task(chunk)
+
+
+def spf_task(srcIndexes):
+    """! Compute the shortest path trees of a chunk of sources in a worker process.
+
+    @param srcIndexes A range of source indexes.
+
+    @return A list of tuples (srcIndex, d, p, n) where d is an array('d') of path costs and p and n are array('i') of
+      previous hop and next hop indexes, with -1 for unreachable destinations.
+    """
+    results = []
+    for srcIndex in srcIndexes:
+        d, p, n = csr_dijkstra(workerGraph, srcIndex)
+        results.append((srcIndex, array('d', d), array('i', p), array('i', n)))
+    return results
+
+
+def bellman_ford_task(args):
+    """! Run Bellman-Ford from a chunk of nodes in a worker process and derive the routing table of each node.
+
+    @param args A tuple (nodeIndexes, detectNegativeCycle) of a range of node indexes and whether to check for negative cycles.
+
+    @return A list of tuples (nodeIndex, distance, nextHop) where distance is an array('d') of path costs and nextHop is an
+      array('i') of the index of the first hop to each destination, with -1 for unreachable destinations.
+    """
+    nodeIndexes, detectNegativeCycle = args
+    results = []
+    for nodeIndex in nodeIndexes:
+        distance, nexthop = csr_bellman_ford(workerGraph, nodeIndex, detectNegativeCycle)
+        nexthop[nodeIndex] = nodeIndex
+        results.append((nodeIndex, array('d', distance), array('i', next_hops_from_previous(nodeIndex, nexthop))))
+    return results
+
+
+def split_indexes(size, workers):
+    """! Split the node indexes into chunks, with a few chunks per worker so that uneven chunks balance out.
+
+    @param size     The number of nodes.
+    @param workers  The number of worker processes.
+
+    @return A list of ranges of node indexes, in order.
+    """
+    chunkSize = max(1, -(-size // (workers * 4)))
+    return [range(start, min(start + chunkSize, size)) for start in range(0, size, chunkSize)]
+
+
+class WorkerPool:
+    """! Pool of worker processes that stays up across recomputes, with the Graph they run over in shared memory.
+
+    The processes start with the first map and are reused by every later one. A map over a Graph that the workers
+    do not have yet copies it into a new block of shared memory, and each worker reads it from there once, with its
+    first chunk, instead of the pool being restarted and handed the pickled Graph.
+
+    Attributes:
+    - workers: the number of worker processes
+    - pool: the multiprocessing Pool, or None before the first map
+    - memory: the SharedMemory of the Graph the workers run over, or None
+    - graph: the Graph in memory, or None
+
+    Methods:
+    - map(graph, task, extra): run a task over every node of a Graph
+    - close(): stop the worker processes and free the shared memory
+    """
+    __slots__ = ('workers', 'pool', 'memory', 'graph')
+
+    def __init__(self, workers):
+        """! Initializing the WorkerPool object.
+
+        @param workers The number of worker processes.
+        """
+        self.workers = workers
+        self.pool = None
+        self.memory = None
+        self.graph = None
+
+    def __enter__(self):
+        """! Use the pool as a context manager that closes it on exit.
+
+        @return The WorkerPool itself.
+        """
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        """! Close the pool when leaving the context.
+        """
+        self.close()
+
+    def map(self, graph, task, extra=None):
+        """! Run a task over every node of a Graph in the worker processes.
+
+        Results are returned in node index order, however the chunks are scheduled, so the merged result is
+        deterministic. The results have to be read to the end before the next map.
+
+        @param graph    A Graph of the network topology.
+        @param task     spf_task or bellman_ford_task.
+        @param extra    If not None, each chunk is passed to the task as a tuple (chunk, extra).
+
+        @return An iterator of the results of the task for each node, in node index order.
+        """
+        if graph is not self.graph:
+            # Every chunk of the previous map was read, so no worker still needs the previous block
+            if self.memory is not None:
+                self.memory.close()
+                self.memory.unlink()
+            self.memory = write_shared_graph(graph)
+            self.graph = graph
+        # The workers start after the first block of shared memory, so they share the resource tracker it started
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.workers)
+        chunks = split_indexes(len(graph), self.workers)
+        name = self.memory.name
+        for results in self.pool.imap(run_chunk, [(task, name, chunk if extra is None else (chunk, extra)) for chunk in chunks]):
+            yield from results
+
+    def close(self):
+        """! Stop the worker processes and free the shared memory of the Graph.
+        """
+        global workerPool
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.memory is not None:
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+        self.graph = None
+        if workerPool is self:
+            workerPool = None
+
+
+def keep_pool(workers):
+    """! Keep one pool of worker processes for every map_nodes of a run, until the returned context exits.
+
+    @param workers The number of worker processes, where 1 keeps no pool.
+
+    @return The WorkerPool, to be used as a context manager, or a context that does nothing.
+    """
+    global workerPool
+    workerPool = WorkerPool(workers) if workers > 1 else None
+    return workerPool if workerPool is not None else nullcontext()
+
+
+def map_nodes(graph, task, workers, extra=None):
+    """! Run a task over every node of a Graph in a pool of worker processes.
+
+    The pool that keep_pool opened is reused when it has the same number of workers, and otherwise a pool is started
+    for this map alone. Results are returned in node index order, however the chunks are scheduled, so the merged
+    result is deterministic.
+
+    @param graph    A Graph of the network topology.
+    @param task     spf_task or bellman_ford_task.
+    @param workers  The number of worker processes.
+    @param extra    If not None, each chunk is passed to the task as a tuple (chunk, extra).
+
+    @return An iterator of the results of the task for each node, in node index order.
+    """
+    if workerPool is not None and workerPool.workers == workers:
+        yield from workerPool.map(graph, task, extra)
+        return
+    with WorkerPool(workers) as pool:
+        yield from pool.map(graph, task, extra)
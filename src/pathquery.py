@@ -0,0 +1,233 @@
+##
+# @file pathquery.py
+
+import heapq
+
+from graph import csr_dijkstra
+
+
+def select_landmarks(graph, count):
+    """! Pick landmarks that are far apart, each one the node farthest from the landmarks picked before it.
+
+    @param graph    A Graph of the network topology.
+    @param count    The number of landmarks to pick.
+
+    @return A list of tuples (landmarkIndex, d) where d is the list of path costs from the landmark to each node by index.
+    """
+    landmarks = []
+    if count < 1 or len(graph) == 0:
+        return landmarks
+
+    # Start from the node farthest from the first node, and then keep taking the node farthest from every landmark
+    nearest = csr_dijkstra(graph, 0)[0]
+    while len(landmarks) < min(count, len(graph)):
+        candidates = [i for i, cost in enumerate(nearest) if cost != float('inf')]
+        landmarkIndex = max(candidates, key=lambda i: (nearest[i], -i)) if candidates else 0
+        if any(landmarkIndex == i for i, _ in landmarks):
+            break
+        d = csr_dijkstra(graph, landmarkIndex)[0]
+        landmarks.append((landmarkIndex, d))
+        nearest = d if len(landmarks) == 1 else [min(a, b) for a, b in zip(nearest, d)]
+    return landmarks
+
+
+## Number of landmarks with the best lower bound between the source and destination that are used in a single query
+ACTIVE_LANDMARKS = 4
+
+
+class PathQuery:
+    """! Point to point route queries over a Graph, without computing a whole shortest path tree per source.
+
+    The path cost comes from a bidirectional Dijkstra search. With landmarks, the path cost to each landmark gives a
+    lower bound on the path cost between any two nodes by the triangle inequality (ALT). The bounds of the landmarks
+    that best separate the source and destination steer both searches towards each other as A* potentials.
+
+    The hops are the ones the link state engines forward a message along, where each router uses the next hop of its
+    own shortest path tree and ties are broken towards the neighbor with the smallest (d, nodeId). Only the nodes on a
+    shortest path from the source to the destination are needed for that, which are found from the path costs to the
+    destination. Link costs have to be positive for the ties to match the engines.
+
+    Attributes:
+    - graph: a Graph of the network topology
+    - landmarks: a list of tuples (landmarkIndex, d) of the path costs from each landmark
+
+    Methods:
+    - lower_bound(u, v): a lower bound on the path cost between two node indexes
+    - distance(srcNodeId, dstNodeId): the path cost between two nodes
+    - route(srcNodeId, dstNodeId): the path cost and hops between two nodes
+    """
+    __slots__ = ('graph', 'landmarks')
+
+    def __init__(self, graph, landmarks=0):
+        """! Initializing the PathQuery object and precomputing the path costs from the landmarks.
+
+        @param graph        A Graph of the network topology.
+        @param landmarks    The number of landmarks used for lower bounds, where 0 disables them.
+        """
+        if min(graph.costs, default=1) <= 0:
+            raise ValueError('Point to point queries need positive link costs')
+        self.graph = graph
+        self.landmarks = select_landmarks(graph, landmarks)
+
+    def lower_bound(self, u, v):
+        """! Get a lower bound on the path cost between two nodes from the landmarks.
+
+        @param u The index of the first node.
+        @param v The index of the second node.
+
+        @return A lower bound on the path cost, which is inf if a landmark reaches only one of the nodes.
+        """
+        bound = 0
+        for _, d in self.landmarks:
+            if d[u] == float('inf') or d[v] == float('inf'):
+                if d[u] != d[v]:
+                    return float('inf')
+                continue
+            bound = max(bound, abs(d[u] - d[v]))
+        return bound
+
+    def active_landmarks(self, s, t):
+        """! Pick the landmarks with the best lower bound between two nodes.
+
+        @param s The index of the source node.
+        @param t The index of the destination node.
+
+        @return A list of at most ACTIVE_LANDMARKS lists of path costs from a landmark that reaches both nodes.
+        """
+        reaching = [d for _, d in self.landmarks if d[s] != float('inf') and d[t] != float('inf')]
+        reaching.sort(key=lambda d: abs(d[s] - d[t]), reverse=True)
+        return reaching[:ACTIVE_LANDMARKS]
+
+    def distance(self, srcNodeId, dstNodeId):
+        """! Get the path cost between two nodes with a bidirectional Dijkstra search.
+
+        The forward search uses the potential (bound to the destination - bound from the source) / 2 and the backward
+        search its negation, so both keep nonnegative reduced costs, and the search stops once the two smallest keys
+        add up to the best path found, since no later path can be cheaper. Without landmarks both potentials are 0.
+
+        @param srcNodeId The nodeId of the source node.
+        @param dstNodeId The nodeId of the destination node.
+
+        @return The path cost, or inf if the destination is unreachable.
+        """
+        graph = self.graph
+        offsets, targets, costs = graph.offsets, graph.targets, graph.costs
+        s, t = graph.index[srcNodeId], graph.index[dstNodeId]
+        if s == t:
+            return 0
+        if self.landmarks and self.lower_bound(s, t) == float('inf'):
+            return float('inf')
+
+        rows = self.active_landmarks(s, t)
+        potentials = {}
+
+        def potential(v):
+            if v not in potentials:
+                potentials[v] = (max([abs(d[v] - d[t]) for d in rows]) - max([abs(d[s] - d[v]) for d in rows])) / 2 if rows else 0
+            return potentials[v]
+
+        # Index 0 searches forward from the source, index 1 backward from the destination
+        dist = ({s: 0}, {t: 0})
+        heaps = ([(potential(s), s)], [(-potential(t), t)])
+        signs = (1, -1)
+        settled = (set(), set())
+        best = float('inf')
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            _, u = heapq.heappop(heaps[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+
+            own, other, sign, heap = dist[side], dist[1 - side], signs[side], heaps[side]
+            cost = own[u]
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                newCost = cost + costs[k]
+                if newCost < own.get(v, float('inf')):
+                    own[v] = newCost
+                    heapq.heappush(heap, (newCost + sign * potential(v), v))
+                if v in other and newCost + other[v] < best:
+                    best = newCost + other[v]
+        return best
+
+    def route(self, srcNodeId, dstNodeId):
+        """! Get the path cost and the hops between two nodes.
+
+        @param srcNodeId The nodeId of the source node.
+        @param dstNodeId The nodeId of the destination node.
+
+        @return A tuple (cost, hops) where hops is a list of nodeIds from the source up to the node before the
+          destination, the same as get_hops in the link state module, or None if the destination is unreachable.
+        """
+        graph = self.graph
+        nodeIds, offsets, targets, costs = graph.nodeIds, graph.offsets, graph.targets, graph.costs
+        s, t = graph.index[srcNodeId], graph.index[dstNodeId]
+        total = self.distance(srcNodeId, dstNodeId)
+        if total == float('inf'):
+            return None
+        if s == t:
+            return 0, []
+
+        # Path costs to the destination of every node that can be on a shortest path from the source (A* towards the source)
+        rows = self.active_landmarks(s, t)
+        toDst = {}
+        heap = [(0, 0, t)]
+        while heap:
+            key, cost, u = heapq.heappop(heap)
+            if key > total:
+                break
+            if u in toDst:
+                continue
+            toDst[u] = cost
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                if v not in toDst:
+                    bound = max([abs(d[v] - d[s]) for d in rows]) if rows else 0
+                    heapq.heappush(heap, (cost + costs[k] + bound, cost + costs[k], v))
+
+        # Path costs from the source over the links on a shortest path, with the predecessors of each node
+        fromSrc = {s: 0}
+        preds = {s: []}
+        succs = {}
+        stack = [s]
+        while stack:
+            u = stack.pop()
+            succs[u] = []
+            for k in range(offsets[u], offsets[u + 1]):
+                v = targets[k]
+                if v in toDst and fromSrc[u] + costs[k] + toDst[v] == total:
+                    succs[u].append(v)
+                    if v not in fromSrc:
+                        fromSrc[v] = fromSrc[u] + costs[k]
+                        preds[v] = []
+                        stack.append(v)
+                    preds[v].append(u)
+
+        # Forward hop by hop: the tree of each router keeps the predecessor with the smallest (d, nodeId) among the
+        # nodes on its own shortest paths, which are the nodes below it, and d from it orders them the same as fromSrc
+        hops = []
+        x = s
+        while x != t:
+            hops.append(nodeIds[x])
+            # Every shortest path leaves through the only link on one, so there is no tie to break
+            if len(succs[x]) == 1:
+                x = succs[x][0]
+                continue
+            below = {x}
+            stack = [x]
+            while stack:
+                for v in succs[stack.pop()]:
+                    if v not in below:
+                        below.add(v)
+                        stack.append(v)
+            v = t
+            while True:
+                u = min((u for u in preds[v] if u in below), key=lambda u: (fromSrc[u], nodeIds[u]))
+                if u == x:
+                    break
+                v = u
+            x = v
+        return total, hops
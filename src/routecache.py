@@ -0,0 +1,69 @@
+##
+# @file routecache.py
+
+from collections import OrderedDict
+
+
+class RouteCache:
+    """! Bounded least recently used cache of routes that are computed on demand.
+
+    Attributes:
+    - compute: a function that computes the routes for a key on a miss
+    - capacity: the largest number of entries that are kept
+    - entries: an OrderedDict of the cached entries, from least to most recently used
+    - hits: the number of lookups that were answered from the cache
+    - misses: the number of lookups that had to compute the routes
+
+    Methods:
+    - get(key): get the routes for a key, computing them on a miss
+    - invalidate(): drop every entry, for example after a topology change
+    """
+    __slots__ = ('compute', 'capacity', 'entries', 'hits', 'misses')
+
+    def __init__(self, compute, capacity=1024):
+        """! Initializing the RouteCache object.
+
+        @param compute  A function that takes a key and returns its routes.
+        @param capacity The largest number of entries that are kept.
+        """
+        if capacity < 1:
+            raise ValueError('The cache needs room for at least one entry')
+        self.compute = compute
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """! Get the routes for a key, computing them and evicting the least recently used entry on a miss.
+
+        @param key The key of the routes, such as a source or destination nodeId.
+
+        @return The routes for the key.
+        """
+        entries = self.entries
+        if key in entries:
+            self.hits += 1
+            entries.move_to_end(key)
+            return entries[key]
+
+        self.misses += 1
+        value = self.compute(key)
+        entries[key] = value
+        if len(entries) > self.capacity:
+            entries.popitem(last=False)
+        return value
+
+    def __contains__(self, key):
+        """! Check if the routes for a key are cached, without counting a lookup.
+
+        @param key The key of the routes.
+
+        @return True if the routes are cached.
+        """
+        return key in self.entries
+
+    def invalidate(self):
+        """! Drop every cached entry.
+        """
+        self.entries.clear()
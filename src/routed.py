@@ -0,0 +1,486 @@
+##
+# @file routed.py
+
+import asyncio
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import distancevector
+import linkstate
+from changebatch import LINK_REMOVED, coalesce_changes
+from graph import Graph
+from lfa import distance_vector_alternates, failover_route, link_key, link_state_alternates, patch_routes
+from snapshot import load_distance_vector, load_link_state
+
+## TCP port the daemon listens on by default
+DEFAULT_PORT = 5331
+
+## Largest request line in bytes
+MAX_REQUEST_SIZE = 1 << 20
+
+## Routing protocols the daemon can run
+PROTOCOLS = ('ls', 'dv')
+
+
+class RoutingTables:
+    """! Routing tables of one version of the topology.
+
+    A RoutingTables object is never changed once it is built, so queries can keep reading it while the next version is
+    computed, and installing a new version is a single assignment.
+
+    Attributes:
+    - protocol: 'ls' for link state or 'dv' for distance vector
+    - version: the number of recomputes that led to these tables, starting at 0
+    - nodes: a dictionary of the nodes of the topology, with their routing tables for distance vector
+    - linkState: the link state information of each node for link state, otherwise None
+    - alternates: the loop-free alternates of every route, as returned by lfa.find_alternates, or None
+    - patches: a dictionary of (srcNodeId, dstNodeId) to a tuple (next hop, path cost) of the routes that were switched
+      to their alternates since the tables were computed
+    - removed: a frozenset of the link keys of the links removed since the tables were computed
+
+    Methods:
+    - route(srcNodeId, dstNodeId): the path cost and formatted route between two nodes
+    - table(nodeId): the routing table of a node
+    - next_hop(nodeId, dstNodeId): the primary next hop of a node towards a destination
+    - failover(changes): the tables with the routes over removed links switched to their alternates
+    """
+    __slots__ = ('protocol', 'version', 'nodes', 'linkState', 'alternates', 'patches', 'removed')
+
+    def __init__(self, protocol, version, nodes, linkState=None, alternates=None, patches=None, removed=frozenset()):
+        """! Initializing the RoutingTables object.
+
+        @param protocol     'ls' for link state or 'dv' for distance vector.
+        @param version      The version of the tables.
+        @param nodes        A dictionary of the nodes of the topology.
+        @param linkState    The link state information of each node for link state.
+        @param alternates   The loop-free alternates of every route, or None.
+        @param patches      A dictionary of the routes switched to their alternates, or None.
+        @param removed      A frozenset of the link keys of the links removed since the tables were computed.
+        """
+        self.protocol = protocol
+        self.version = version
+        self.nodes = nodes
+        self.linkState = linkState
+        self.alternates = alternates
+        self.patches = patches or {}
+        self.removed = removed
+
+    def check_node(self, nodeId):
+        """! Check that a nodeId belongs to the topology.
+
+        @param nodeId The nodeId to check.
+        """
+        if nodeId not in self.nodes:
+            raise ValueError(f'Unknown node {nodeId}')
+
+    def route(self, srcNodeId, dstNodeId):
+        """! Get the route between two nodes, formatted the same way as a message in the output file.
+
+        @param srcNodeId The nodeId of the source node.
+        @param dstNodeId The nodeId of the destination node.
+
+        @return A tuple (cost, route) where cost is None if the destination is unreachable, and route is the
+          "from src to dst cost pathCost hops ..." line.
+        """
+        self.check_node(srcNodeId)
+        self.check_node(dstNodeId)
+        if self.removed:
+            found = failover_route(self.nodes, self.next_hop, self.patches, self.removed, srcNodeId, dstNodeId)
+            if found is None:
+                return None, distancevector.format_route(srcNodeId, dstNodeId, None, None)
+            cost, path = found
+            if self.protocol == 'ls':
+                return cost, f'from {srcNodeId} to {dstNodeId} cost {cost} hops {" ".join(str(x) for x in path[:-1])}'
+            return cost, distancevector.format_route(srcNodeId, dstNodeId, cost, path[1:-1])
+        if self.protocol == 'ls':
+            cost = self.linkState[srcNodeId][0][dstNodeId]
+            route = linkstate.format_route(self.linkState, srcNodeId, dstNodeId)
+        else:
+            entry = self.nodes[srcNodeId].routingTable.get(dstNodeId)
+            cost = entry[1] if entry is not None else float('inf')
+            route = distancevector.find_route(self.nodes, srcNodeId, dstNodeId)
+        return (None if cost == float('inf') else cost), route
+
+    def table(self, nodeId):
+        """! Get the routing table of a node.
+
+        @param nodeId The nodeId of the node.
+
+        @return A list of [dest, nextHop, pathCost] rows for every reachable destination in nodeId order.
+        """
+        self.check_node(nodeId)
+        if self.protocol == 'ls':
+            d, _, n = self.linkState[nodeId]
+            rows = [[dest, n[dest], d[dest]] for dest in sorted(self.nodes) if d[dest] != float('inf')]
+        else:
+            rows = [[dest, nextHop, pathCost] for dest, (nextHop, pathCost) in sorted(self.nodes[nodeId].routingTable.items())]
+        if not self.patches:
+            return rows
+        patched = []
+        for row in rows:
+            nextHop, pathCost = self.patches.get((nodeId, row[0]), row[1:])
+            if nextHop is not None:
+                patched.append([row[0], nextHop, pathCost])
+        return patched
+
+    def next_hop(self, nodeId, dstNodeId):
+        """! Get the primary next hop of a node towards a destination, as computed for these tables.
+
+        @param nodeId       The nodeId of the node.
+        @param dstNodeId    The nodeId of the destination.
+
+        @return The nodeId of the next hop, or None if the destination is unreachable.
+        """
+        if self.protocol == 'ls':
+            return self.linkState[nodeId][2][dstNodeId]
+        entry = self.nodes[nodeId].routingTable.get(dstNodeId)
+        return entry[0] if entry is not None else None
+
+    def failover(self, changes):
+        """! Switch the routes over the links that the changes remove to their loop-free alternates, without a recompute.
+
+        The new tables share everything but the patches with these tables. Only removals are applied; cost changes wait
+        for the next recompute.
+
+        @param changes A list of tuples (nodeId, neighborId, cost), where a cost of -999 removes the link.
+
+        @return The patched RoutingTables at the same version, or these tables if there are no alternates or nothing
+          is removed.
+        """
+        removals = [(nodeId, neighborId) for nodeId, neighborId, cost in changes if cost == LINK_REMOVED
+                    and neighborId in self.nodes[nodeId].neighbors and link_key(nodeId, neighborId) not in self.removed]
+        if self.alternates is None or not removals:
+            return self
+        patches = dict(self.patches)
+        removed = set(self.removed)
+        for nodeId, neighborId in removals:
+            removed.add(link_key(nodeId, neighborId))
+            patch_routes(self.alternates, patches, removed, nodeId, neighborId)
+        return RoutingTables(self.protocol, self.version, self.nodes, self.linkState, self.alternates, patches, frozenset(removed))
+
+
+def copy_nodes(protocol, nodes):
+    """! Copy the nodes of a topology, so that changes can be applied without touching the tables that are being read.
+
+    @param protocol 'ls' for link state or 'dv' for distance vector.
+    @param nodes    A dictionary of nodes.
+
+    @return A dictionary of new Node objects with copies of the neighbors, and of the routing tables for distance vector.
+    """
+    module = linkstate if protocol == 'ls' else distancevector
+    copies = {}
+    for nodeId, node in nodes.items():
+        copies[nodeId] = module.Node(nodeId)
+        copies[nodeId].neighbors = dict(node.neighbors)
+        if protocol == 'dv':
+            copies[nodeId].routingTable = dict(node.routingTable)
+    return copies
+
+
+def compute_tables(protocol, nodes, changes, version, engine='scan', compact=False, alternates=False):
+    """! Apply changes to a copy of the topology and compute its routing tables, in a worker thread.
+
+    @param protocol     'ls' for link state or 'dv' for distance vector.
+    @param nodes        A dictionary of the nodes of the current tables, which is copied and never changed.
+    @param changes      A list of tuples (nodeId, neighborId, cost) to apply, where a cost of -999 removes the link.
+    @param version      The version of the new tables.
+    @param engine       The shortest path engine for link state.
+    @param compact      If True, keep the link state in typed arrays, or run Bellman-Ford over a compact Graph.
+    @param alternates   If True, also precompute the loop-free alternate of every route.
+
+    @return The RoutingTables of the changed topology.
+    """
+    nodes = copy_nodes(protocol, nodes)
+    if protocol == 'ls':
+        for change in changes:
+            linkstate.apply_change(nodes, change)
+        linkState = linkstate.update_nodes(nodes, engine, compact)
+        return RoutingTables(protocol, version, nodes, linkState, link_state_alternates(nodes, linkState) if alternates else None)
+
+    for change in changes:
+        distancevector.change_nodes(nodes, change)
+    links = Graph.from_nodes(nodes) if compact else distancevector.get_links(nodes)
+    distancevector.run_bellman_ford(nodes, list(nodes.keys()), links)
+    return RoutingTables(protocol, version, nodes, None, distance_vector_alternates(nodes) if alternates else None)
+
+
+def parse_change(change):
+    """! Check a change from a request.
+
+    @param change A list [nodeId, neighborId, cost].
+
+    @return The change as a tuple (nodeId, neighborId, cost).
+    """
+    if not isinstance(change, list) or len(change) != 3 or not all(isinstance(x, int) and not isinstance(x, bool) for x in change):
+        raise ValueError(f'Expected a change [nodeId, neighborId, cost], got {change!r}')
+    return tuple(change)
+
+
+def parse_node(request, field):
+    """! Get a nodeId from a request.
+
+    @param request  The decoded request.
+    @param field    The name of the field.
+
+    @return The nodeId.
+    """
+    nodeId = request.get(field)
+    if not isinstance(nodeId, int) or isinstance(nodeId, bool):
+        raise ValueError(f'Expected an integer "{field}"')
+    return nodeId
+
+
+class RouteDaemon:
+    """! Resident routing service that answers route queries and applies link changes over a socket.
+
+    Requests and responses are JSON objects, one per line. Queries are answered from the current RoutingTables right
+    away. Changes are queued, and a single background task applies every queued change at once, coalesced per link,
+    and computes the next tables in an executor thread. The new tables replace the current ones in one assignment on
+    the event loop, so every query sees either the old tables or the new ones, never a mix. With loop-free alternates,
+    a removed link is routed around as soon as its change arrives, by tables that patch only the broken routes, and
+    the recompute replaces them as usual.
+
+    Requests:
+    - {"op": "route", "src": 1, "dst": 2}: the cost and route between two nodes
+    - {"op": "table", "node": 1}: the routing table of a node
+    - {"op": "change", "changes": [[1, 2, 5], [2, 3, -999]], "wait": false}: queue link changes, and with wait, answer
+      once tables that include them are installed
+    - {"op": "status"}: the version of the tables and the number of queued changes
+    - {"op": "shutdown"}: stop the daemon
+
+    Attributes:
+    - tables: the RoutingTables queries are answered from
+    - engine: the shortest path engine for link state
+    - compact: whether the tables are computed in compact form
+    - alternates: whether loop-free alternates are precomputed for failover
+    - executor: the executor the tables are computed in
+    - pending: a list of the changes that are not applied yet
+    - received: the number of changes received so far
+    - applied: the number of received changes that the current tables include
+    - waiters: a list of tuples (received, future) of change requests that wait for their tables
+    - worker: the task that applies the pending changes, or None when there are none
+    - stopped: an asyncio.Event that is set to stop serving
+    - clients: a set of the StreamWriters of the open connections
+    """
+    __slots__ = ('tables', 'engine', 'compact', 'alternates', 'executor', 'pending', 'received', 'applied', 'waiters', 'worker', 'stopped', 'clients')
+
+    def __init__(self, tables, engine='scan', compact=False, executor=None):
+        """! Initializing the RouteDaemon object.
+
+        @param tables   The RoutingTables of the initial topology, whose alternates decide whether new tables get them.
+        @param engine   The shortest path engine for link state.
+        @param compact  If True, compute the tables in compact form.
+        @param executor The executor the tables are computed in, or None for a single worker thread.
+        """
+        self.tables = tables
+        self.engine = engine
+        self.compact = compact
+        self.alternates = tables.alternates is not None
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+        self.received = 0
+        self.applied = 0
+        self.waiters = []
+        self.worker = None
+        self.stopped = None
+        self.clients = set()
+
+    def submit_changes(self, changes):
+        """! Queue link changes and make sure a background task applies them.
+
+        @param changes A list of tuples (nodeId, neighborId, cost).
+
+        @return The number of changes received once these are counted, which the tables include once applied reaches it.
+        """
+        for nodeId, neighborId, _ in changes:
+            self.tables.check_node(nodeId)
+            self.tables.check_node(neighborId)
+        self.tables = self.tables.failover(changes)
+        self.pending.extend(changes)
+        self.received += len(changes)
+        if self.worker is None:
+            self.worker = asyncio.get_running_loop().create_task(self.apply_pending())
+        return self.received
+
+    async def apply_pending(self):
+        """! Apply the queued changes in batches until none are left, installing new tables after each batch.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pending:
+                received = self.received
+                changes = coalesce_changes(self.tables.nodes, self.pending)
+                self.pending = []
+                error = None
+                if changes:
+                    try:
+                        tables = await loop.run_in_executor(self.executor, compute_tables, self.tables.protocol, self.tables.nodes,
+                                                            changes, self.tables.version + 1, self.engine, self.compact, self.alternates)
+                    except Exception as exception:
+                        error = exception
+                    else:
+                        # Removals that arrived during the recompute keep being routed around until the next one
+                        self.tables = tables.failover(self.pending)
+                self.applied = received
+                self.wake_waiters(error)
+        finally:
+            self.worker = None
+
+    def wake_waiters(self, error=None):
+        """! Answer the change requests whose changes the current tables include.
+
+        @param error The exception the last recompute raised, which keeps the previous tables, or None.
+        """
+        waiting = []
+        for received, future in self.waiters:
+            if future.done():
+                continue
+            if received > self.applied:
+                waiting.append((received, future))
+            elif error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(self.tables.version)
+        self.waiters = waiting
+
+    async def handle_request(self, request):
+        """! Answer one decoded request.
+
+        @param request A dictionary with an "op" field.
+
+        @return The response as a dictionary.
+        """
+        if not isinstance(request, dict):
+            raise ValueError('Expected a JSON object')
+        op = request.get('op')
+        tables = self.tables
+        if op == 'route':
+            cost, route = tables.route(parse_node(request, 'src'), parse_node(request, 'dst'))
+            return {'ok': True, 'version': tables.version, 'cost': cost, 'route': route}
+        if op == 'table':
+            return {'ok': True, 'version': tables.version, 'rows': tables.table(parse_node(request, 'node'))}
+        if op == 'change':
+            changes = request.get('changes')
+            if not isinstance(changes, list):
+                raise ValueError('Expected a list of "changes"')
+            received = self.submit_changes([parse_change(change) for change in changes])
+            if not request.get('wait'):
+                return {'ok': True, 'pending': len(self.pending)}
+            future = asyncio.get_running_loop().create_future()
+            self.waiters.append((received, future))
+            self.wake_waiters()
+            return {'ok': True, 'version': await future}
+        if op == 'status':
+            return {'ok': True, 'version': tables.version, 'protocol': tables.protocol, 'nodes': len(tables.nodes),
+                    'pending': len(self.pending), 'recomputing': self.worker is not None, 'failover': len(tables.patches)}
+        if op == 'shutdown':
+            self.stopped.set()
+            return {'ok': True}
+        raise ValueError(f'Unknown op {op!r}')
+
+    async def handle_client(self, reader, writer):
+        """! Answer the requests of one connection, one JSON line at a time, until the client disconnects.
+
+        @param reader The asyncio StreamReader of the connection.
+        @param writer The asyncio StreamWriter of the connection.
+        """
+        self.clients.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    writer.write(json.dumps({'ok': False, 'error': f'Requests are limited to {MAX_REQUEST_SIZE} bytes'}).encode() + b'\n')
+                    break
+                if not line:
+                    break
+                try:
+                    response = await self.handle_request(json.loads(line))
+                except Exception as error:
+                    response = {'ok': False, 'error': str(error)}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=DEFAULT_PORT, unixPath=None):
+        """! Listen on a TCP port or a Unix socket until a shutdown request arrives.
+
+        @param host     The host to listen on for TCP.
+        @param port     The TCP port, where 0 picks a free port.
+        @param unixPath The path of a Unix socket to listen on instead of TCP, or None.
+        """
+        self.stopped = asyncio.Event()
+        if unixPath is not None:
+            server = await asyncio.start_unix_server(self.handle_client, unixPath, limit=MAX_REQUEST_SIZE)
+            address = unixPath
+        else:
+            server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_REQUEST_SIZE)
+            address = '{}:{}'.format(*server.sockets[0].getsockname()[:2])
+        print(f'routed listening on {address}', file=sys.stderr, flush=True)
+        try:
+            async with server:
+                await self.stopped.wait()
+                # Leaving the server waits for every connection to close, so the idle ones are closed first, after the
+                # response to the shutdown request that is already written
+                for writer in list(self.clients):
+                    writer.close()
+            if self.worker is not None:
+                await self.worker
+            self.executor.shutdown()
+        finally:
+            if unixPath is not None and os.path.exists(unixPath):
+                os.remove(unixPath)
+
+
+def load_tables(protocol, topologyFile, engine='scan', compact=False, snapshotFile=None, alternates=False):
+    """! Read a topology file and compute its routing tables, or load them from a snapshot.
+
+    @param protocol     'ls' for link state or 'dv' for distance vector.
+    @param topologyFile The path of the topology file.
+    @param engine       The shortest path engine for link state.
+    @param compact      If True, compute the tables in compact form.
+    @param snapshotFile The path of a snapshot of the topology to load instead of computing the tables, or None.
+    @param alternates   If True, also precompute the loop-free alternate of every route.
+
+    @return The RoutingTables of the topology, at version 0.
+    """
+    if protocol == 'ls':
+        nodes = linkstate.read_topology_file(topologyFile)
+        if snapshotFile is not None:
+            linkState = load_link_state(snapshotFile, Graph.from_nodes(nodes), compact)
+        else:
+            linkState = linkstate.update_nodes(nodes, engine, compact)
+        return RoutingTables(protocol, 0, nodes, linkState, link_state_alternates(nodes, linkState) if alternates else None)
+
+    nodes = distancevector.read_topology_file(topologyFile)
+    if snapshotFile is not None:
+        load_distance_vector(snapshotFile, Graph.from_nodes(nodes), nodes)
+        return RoutingTables(protocol, 0, nodes, None, distance_vector_alternates(nodes) if alternates else None)
+    return compute_tables(protocol, nodes, [], 0, engine, compact, alternates)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a routing daemon that answers route queries and applies link changes over a socket.")
+    parser.add_argument("topologyFile", help="the file containing the initial network topology")
+    parser.add_argument("--protocol", choices=PROTOCOLS, default="ls", help="the routing protocol, link state or distance vector")
+    parser.add_argument("--engine", choices=sorted(linkstate.SPF_ENGINES) + list(linkstate.ALL_PAIRS_ENGINES), default="heap",
+                        help="the shortest path engine for link state")
+    parser.add_argument("--compact", action="store_true", help="keep the routes in typed arrays, or run Bellman-Ford over a compact graph")
+    parser.add_argument("--host", default="127.0.0.1", help="the host to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="the TCP port to listen on, where 0 picks a free port")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--load-snapshot", metavar="FILE", help="load the initial routes from a snapshot instead of computing them")
+    parser.add_argument("--lfa", action="store_true", help="precompute loop-free alternates and route around removed links before the recompute")
+    args = parser.parse_args()
+
+    tables = load_tables(args.protocol, args.topologyFile, args.engine, args.compact, args.load_snapshot, args.lfa)
+    daemon = RouteDaemon(tables, args.engine, args.compact)
+    asyncio.run(daemon.serve(args.host, args.port, args.unix))
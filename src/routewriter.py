@@ -0,0 +1,131 @@
+##
+# @file routewriter.py
+
+## Size of the write buffer of a RouteWriter
+BUFFER_SIZE = 1 << 20
+
+
+def format_table(rows):
+    """! Format the routing table of one node in the output format.
+
+    @param rows An iterable of tuples (dest, nextHop, pathCost), in the order they are written.
+
+    @return The rows as a string with one "dest nextHop pathCost" line each, followed by a blank line.
+    """
+    return ''.join([f'{dest} {nextHop} {pathCost}\n' for dest, nextHop, pathCost in rows]) + '\n'
+
+
+class RouteWriter:
+    """! Buffered writer that keeps a single handle on the output file for a whole run.
+
+    In delta mode only the first routing table is written in full. Every later table only lists the routes that
+    changed since the previous table, as "src dest nextHop pathCost" lines, or "src dest unreachable" for a route that
+    no longer exists, followed by a blank line.
+
+    Attributes:
+    - file: the open output file
+    - delta: whether later tables are written as deltas
+    - previous: a dictionary of the formatted table of each node that was last written, or None before the first table
+
+    Methods:
+    - write(text): write text to the output file
+    - write_lines(lines): write a list of strings to the output file
+    - write_table(tables): write the routing table of every node
+    - close(): flush and close the output file
+    """
+    __slots__ = ('file', 'delta', 'previous')
+
+    def __init__(self, outputFile, delta=False):
+        """! Initializing the RouteWriter object and truncating the output file.
+
+        @param outputFile   The path of the output file.
+        @param delta        If True, write the routes that changed instead of every routing table after the first one.
+        """
+        self.file = open(outputFile, 'w', buffering=BUFFER_SIZE)
+        self.delta = delta
+        self.previous = None
+
+    def __enter__(self):
+        """! Use the writer as a context manager that closes the file on exit.
+
+        @return The RouteWriter itself.
+        """
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        """! Close the output file when leaving the context.
+        """
+        self.close()
+
+    def write(self, text):
+        """! Write text to the output file.
+
+        @param text The text to write.
+        """
+        self.file.write(text)
+
+    def write_lines(self, lines):
+        """! Write a list of strings to the output file in one call.
+
+        @param lines The strings to write, which have to end in a newline themselves.
+        """
+        self.file.write(''.join(lines))
+
+    def write_table(self, tables):
+        """! Write the routing table of every node, or the routes that changed in delta mode.
+
+        Each table is written, or compared with the previous table of its node, as soon as it is formatted, so only one
+        node's table is held besides the previous tables in delta mode.
+
+        @param tables An iterable of tuples (nodeId, rows), where rows is an iterable of tuples (dest, nextHop, pathCost).
+        """
+        if not self.delta:
+            for _, rows in tables:
+                self.file.write(format_table(rows))
+            return
+
+        if self.previous is None:
+            self.previous = {}
+            for nodeId, rows in tables:
+                table = format_table(rows)
+                self.file.write(table)
+                self.previous[nodeId] = table
+            return
+
+        previous = self.previous
+        self.previous = {}
+        for nodeId, rows in tables:
+            table = format_table(rows)
+            previousTable = previous.pop(nodeId, '\n')
+            if table != previousTable:
+                self.file.write(''.join(diff_tables(nodeId, previousTable, table)))
+            self.previous[nodeId] = table
+        self.file.write('\n')
+
+    def close(self):
+        """! Flush and close the output file.
+        """
+        self.file.close()
+
+
+def diff_tables(nodeId, previousTable, table):
+    """! List the routes of a node that changed between two formatted routing tables.
+
+    @param nodeId           The nodeId of the node the tables belong to.
+    @param previousTable    The formatted table that was written before.
+    @param table            The formatted table that replaces it.
+
+    @return A list of "nodeId dest nextHop pathCost" lines for new or changed routes, and "nodeId dest unreachable" lines
+      for routes that were removed.
+    """
+    previousRows = {line.split(' ', 1)[0]: line for line in previousTable.splitlines() if line}
+    lines = []
+    for line in table.splitlines():
+        if not line:
+            continue
+        dest = line.split(' ', 1)[0]
+        if previousRows.pop(dest, None) != line:
+            lines.append(f'{nodeId} {line}\n')
+    for dest in previousRows:
+        lines.append(f'{nodeId} {dest} unreachable\n')
+    return lines
@@ -0,0 +1,194 @@
+##
+# @file routingstate.py
+
+from array import array
+
+
+class RoutingRow:
+    """! Read only view of one row of a RoutingState, indexed by nodeId.
+
+    Attributes:
+    - values: the typed array of the row, indexed by node index
+    - index: a dictionary of nodeIds and their indexes
+    - decode: a function that turns a stored value into the value returned for a nodeId
+    """
+    __slots__ = ('values', 'index', 'decode')
+
+    def __init__(self, values, index, decode):
+        """! Initializing the RoutingRow object.
+
+        @param values   The typed array of the row.
+        @param index    A dictionary of nodeIds and their indexes.
+        @param decode   A function that turns a stored value into the returned value.
+        """
+        self.values = values
+        self.index = index
+        self.decode = decode
+
+    def __getitem__(self, nodeId):
+        """! Get the value of the row for a nodeId.
+
+        @param nodeId The nodeId of the destination.
+
+        @return The decoded value for the destination.
+        """
+        return self.decode(self.values[self.index[nodeId]])
+
+    def __len__(self):
+        """! Get the number of destinations in the row.
+
+        @return The number of destinations.
+        """
+        return len(self.values)
+
+    def __iter__(self):
+        """! Iterate over the nodeIds of the destinations.
+
+        @return An iterator of nodeIds.
+        """
+        return iter(self.index)
+
+    def items(self):
+        """! Iterate over the destinations and their values.
+
+        @return An iterator of tuples (nodeId, value).
+        """
+        decode, values = self.decode, self.values
+        return ((nodeId, decode(values[i])) for nodeId, i in self.index.items())
+
+
+class RoutingState:
+    """! Path costs and next hops of every source, kept in typed arrays instead of dictionaries.
+
+    The state can be used in place of the linkState dictionary: state[srcNodeId] is a tuple (d, p, n) where d and n
+    are RoutingRow views of the path cost and next hop to each destination. The previous hops are not kept once the
+    next hops are derived, so p is always None.
+
+    Attributes:
+    - nodeIds: a list of nodeIds, where the position of a nodeId is its index
+    - index: a dictionary of nodeIds and their indexes
+    - costs: a list of array('d') rows of path costs by index, with inf for unreachable destinations
+    - hops: a list of array('i') rows of next hop indexes, with -1 for unreachable destinations
+
+    Methods:
+    - set_row(srcIndex, d, n): store the path costs and next hop indexes of a source
+    """
+    __slots__ = ('nodeIds', 'index', 'costs', 'hops', 'rows')
+
+    def __init__(self, nodeIds):
+        """! Initializing the RoutingState object. Every source has to be stored with set_row before it is read.
+
+        @param nodeIds A list of nodeIds, where the position of a nodeId is its index.
+        """
+        self.nodeIds = list(nodeIds)
+        self.index = {nodeId: i for i, nodeId in enumerate(self.nodeIds)}
+        size = len(self.nodeIds)
+        self.costs = [None] * size
+        self.hops = [None] * size
+        self.rows = [None] * size
+
+    def set_row(self, srcIndex, d, n):
+        """! Store the path costs and next hops of one source.
+
+        @param srcIndex The index of the source node.
+        @param d        A sequence of path costs by index, with inf for unreachable destinations.
+        @param n        A sequence of next hop indexes by index, with -1 for unreachable destinations.
+        """
+        self.costs[srcIndex] = array('d', d)
+        self.hops[srcIndex] = array('i', n)
+        self.rows[srcIndex] = None
+
+    def decode_cost(self, cost):
+        """! Turn a stored path cost back into the value the dictionary engines produce.
+
+        @param cost The stored path cost.
+
+        @return The path cost as an int, or inf if the destination is unreachable.
+        """
+        return cost if cost == float('inf') else int(cost)
+
+    def decode_hop(self, hop):
+        """! Turn a stored next hop index back into a nodeId.
+
+        @param hop The stored next hop index.
+
+        @return The nodeId of the next hop, or None if the destination is unreachable.
+        """
+        return self.nodeIds[hop] if hop >= 0 else None
+
+    def __getitem__(self, srcNodeId):
+        """! Get the routing information of a source.
+
+        @param srcNodeId The nodeId of the source node.
+
+        @return A tuple (d, None, n) of views of the path cost and the next hop to each destination.
+        """
+        srcIndex = self.index[srcNodeId]
+        if self.rows[srcIndex] is None:
+            self.rows[srcIndex] = (RoutingRow(self.costs[srcIndex], self.index, self.decode_cost), None,
+                                   RoutingRow(self.hops[srcIndex], self.index, self.decode_hop))
+        return self.rows[srcIndex]
+
+    def __contains__(self, srcNodeId):
+        """! Check if a nodeId is a source in the state.
+
+        @param srcNodeId The nodeId to check.
+
+        @return True if the nodeId is in the state.
+        """
+        return srcNodeId in self.index
+
+    def __len__(self):
+        """! Get the number of sources in the state.
+
+        @return The number of sources.
+        """
+        return len(self.nodeIds)
+
+    def __iter__(self):
+        """! Iterate over the nodeIds of the sources.
+
+        @return An iterator of nodeIds.
+        """
+        return iter(self.nodeIds)
+
+    def items(self):
+        """! Iterate over the sources and their routing information.
+
+        @return An iterator of tuples (srcNodeId, (d, None, n)).
+        """
+        return ((nodeId, self[nodeId]) for nodeId in self.nodeIds)
+
+
+def next_hops_from_previous(srcIndex, p):
+    """! Derive the next hop index of every destination from the previous hop indexes of a shortest path tree.
+
+    The shortest path engines produce next hops directly, so this is only needed for previous hops from elsewhere.
+    Each chain of previous hops is only walked once, since the next hop of every node on it is remembered.
+
+    @param srcIndex The index of the source node.
+    @param p        A sequence of previous hop indexes by index, with -1 for unreachable destinations.
+
+    @return A list of next hop indexes by index, with -1 for unreachable destinations.
+    """
+    n = [-1] * len(p)
+    n[srcIndex] = srcIndex
+    known = bytearray(len(p))
+    known[srcIndex] = 1
+    for dstIndex in range(len(p)):
+        if known[dstIndex] or p[dstIndex] < 0:
+            continue
+        # Walk up the tree until a node whose next hop is known or whose previous hop is the source
+        chain = []
+        currIndex = dstIndex
+        while not known[currIndex] and p[currIndex] != srcIndex:
+            chain.append(currIndex)
+            currIndex = p[currIndex]
+        nextHop = n[currIndex] if known[currIndex] else currIndex
+        if not known[currIndex]:
+            n[currIndex] = nextHop
+            known[currIndex] = 1
+        for chainIndex in chain:
+            n[chainIndex] = nextHop
+            known[chainIndex] = 1
+    return n
@@ -0,0 +1,238 @@
+##
+# @file snapshot.py
+
+import hashlib
+import os
+import struct
+import sys
+from array import array
+
+from graph import Graph
+from routingstate import RoutingState
+
+## Bytes at the start of every snapshot file
+SNAPSHOT_MAGIC = b'RTSNAP\r\n'
+
+## Version of the snapshot layout, which has to match exactly when a snapshot is loaded
+SNAPSHOT_VERSION = 1
+
+## Kind of a snapshot of link state information
+LINK_STATE = 1
+
+## Kind of a snapshot of distance vector routing tables
+DISTANCE_VECTOR = 2
+
+## Flag of a link state snapshot that keeps the previous hops
+HAS_PREVIOUS_HOPS = 1
+
+## Header: magic, version, kind, flags, topology hash, number of nodes, number of directed links
+HEADER = struct.Struct('<8sHHI32sQQ')
+
+
+def little_endian(values):
+    """! Get the bytes of a typed array in little endian order, whatever the byte order of the machine.
+
+    @param values A typed array.
+
+    @return The bytes of the array.
+    """
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def read_array(file, typecode, count):
+    """! Read a little endian typed array from a snapshot file.
+
+    @param file     The open snapshot file.
+    @param typecode The typecode of the array.
+    @param count    The number of values to read.
+
+    @return An array of the values.
+    """
+    values = array(typecode)
+    try:
+        values.fromfile(file, count)
+    except EOFError:
+        raise ValueError(f'{file.name}: the snapshot is truncated') from None
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def topology_hash(graph):
+    """! Hash a topology, so that a snapshot is only loaded for the topology it was computed from.
+
+    The hash covers the nodes and links in index order, which is the order they first appear in the topology file, so
+    a topology file with the same links in another order does not match.
+
+    @param graph A Graph of the network topology.
+
+    @return The SHA-256 digest of the topology.
+    """
+    digest = hashlib.sha256()
+    digest.update(little_endian(array('q', graph.nodeIds)))
+    digest.update(little_endian(array('q', graph.offsets)))
+    digest.update(little_endian(array('i', graph.targets)))
+    digest.update(little_endian(array('q', graph.costs)))
+    return digest.digest()
+
+
+def write_snapshot(snapshotFile, graph, kind, flags, arrays):
+    """! Write a snapshot file with its header, the topology and the given arrays.
+
+    The snapshot is written next to its final path and then renamed over it, so a crash never leaves half a snapshot behind.
+
+    @param snapshotFile The path of the snapshot file.
+    @param graph        A Graph of the network topology the state was computed from.
+    @param kind         LINK_STATE or DISTANCE_VECTOR.
+    @param flags        The flags of the snapshot.
+    @param arrays       An iterable of typed arrays that are written after the topology, in order.
+    """
+    tempFile = f'{snapshotFile}.tmp'
+    with open(tempFile, 'wb') as file:
+        file.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, kind, flags, topology_hash(graph), len(graph), len(graph.targets)))
+        file.write(little_endian(array('q', graph.nodeIds)))
+        file.write(little_endian(array('q', graph.offsets)))
+        file.write(little_endian(array('i', graph.targets)))
+        file.write(little_endian(array('q', graph.costs)))
+        for values in arrays:
+            file.write(little_endian(values))
+    os.replace(tempFile, snapshotFile)
+
+
+def read_header(file, kind, graph):
+    """! Read and check the header and topology of a snapshot file.
+
+    @param file     The open snapshot file.
+    @param kind     The kind of snapshot that is expected, LINK_STATE or DISTANCE_VECTOR.
+    @param graph    A Graph of the current topology that has to match the snapshot.
+
+    @return The flags of the snapshot.
+    """
+    data = file.read(HEADER.size)
+    if len(data) < HEADER.size or data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise ValueError(f'{file.name}: not a routing snapshot')
+    magic, version, snapshotKind, flags, digest, numNodes, numLinks = HEADER.unpack(data)
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f'{file.name}: snapshot version {version} is not supported, expected version {SNAPSHOT_VERSION}')
+    if snapshotKind != kind:
+        names = {LINK_STATE: 'link state', DISTANCE_VECTOR: 'distance vector'}
+        raise ValueError(f'{file.name}: snapshot holds {names.get(snapshotKind, "unknown")} routes, expected {names[kind]} routes')
+    if digest != topology_hash(graph):
+        raise ValueError(f'{file.name}: snapshot was computed from a different topology')
+
+    storedGraph = Graph(read_array(file, 'q', numNodes).tolist(), read_array(file, 'q', numNodes + 1),
+                        read_array(file, 'i', numLinks), read_array(file, 'q', numLinks))
+    if topology_hash(storedGraph) != digest:
+        raise ValueError(f'{file.name}: the topology stored in the snapshot does not match its hash')
+    return flags
+
+
+def save_link_state(snapshotFile, graph, linkState):
+    """! Save the link state information of every node to a snapshot file.
+
+    @param snapshotFile The path of the snapshot file.
+    @param graph        A Graph of the network topology the link state was computed from.
+    @param linkState    A dictionary of tuples (d, p, n) for each node, or a RoutingState, which has no previous hops.
+    """
+    nodeIds, index = graph.nodeIds, graph.index
+    compact = isinstance(linkState, RoutingState)
+    if compact and linkState.nodeIds != nodeIds:
+        # Lay the rows of a state in another node order, such as the one of the matrix engine, out in graph order
+        order = [linkState.index[nodeId] for nodeId in nodeIds]
+        position = [index[nodeId] for nodeId in linkState.nodeIds]
+        state = RoutingState(nodeIds)
+        for srcIndex in range(len(nodeIds)):
+            costs, hops = linkState.costs[order[srcIndex]], linkState.hops[order[srcIndex]]
+            state.set_row(srcIndex, [costs[i] for i in order], [position[hops[i]] if hops[i] >= 0 else -1 for i in order])
+        linkState = state
+
+    def rows():
+        for srcIndex, srcNodeId in enumerate(nodeIds):
+            if compact:
+                yield linkState.costs[srcIndex]
+                yield linkState.hops[srcIndex]
+                continue
+            d, p, n = linkState[srcNodeId]
+            yield array('d', [d[nodeId] for nodeId in nodeIds])
+            yield array('i', [index[n[nodeId]] if n[nodeId] is not None else -1 for nodeId in nodeIds])
+            yield array('i', [index[p[nodeId]] if p[nodeId] is not None else -1 for nodeId in nodeIds])
+
+    write_snapshot(snapshotFile, graph, LINK_STATE, 0 if compact else HAS_PREVIOUS_HOPS, rows())
+
+
+def load_link_state(snapshotFile, graph, compact=False):
+    """! Load the link state information of every node from a snapshot file, instead of computing it.
+
+    @param snapshotFile The path of the snapshot file.
+    @param graph        A Graph of the current topology, which has to be the one the snapshot was computed from.
+    @param compact      If True, return a RoutingState, otherwise the dictionaries the engines return.
+
+    @return The link state information in the same form as update_nodes.
+    """
+    nodeIds = graph.nodeIds
+    size = len(nodeIds)
+    with open(snapshotFile, 'rb') as file:
+        flags = read_header(file, LINK_STATE, graph)
+        hasPrevious = bool(flags & HAS_PREVIOUS_HOPS)
+        if not compact and not hasPrevious:
+            raise ValueError(f'{snapshotFile}: snapshot of a compact state has no previous hops and can only be loaded in compact mode')
+
+        state = RoutingState(nodeIds) if compact else {}
+        for srcIndex, srcNodeId in enumerate(nodeIds):
+            d = read_array(file, 'd', size)
+            n = read_array(file, 'i', size)
+            p = read_array(file, 'i', size) if hasPrevious else None
+            if compact:
+                state.costs[srcIndex] = d
+                state.hops[srcIndex] = n
+                continue
+            state[srcNodeId] = (
+                {nodeId: (cost if cost == float('inf') else int(cost)) for nodeId, cost in zip(nodeIds, d)},
+                {nodeId: (nodeIds[prevHop] if prevHop >= 0 else None) for nodeId, prevHop in zip(nodeIds, p)},
+                {nodeId: (nodeIds[nextHop] if nextHop >= 0 else None) for nodeId, nextHop in zip(nodeIds, n)})
+    return state
+
+
+def save_distance_vector(snapshotFile, graph, nodes):
+    """! Save the routing table of every node to a snapshot file, keeping the order of the entries.
+
+    @param snapshotFile The path of the snapshot file.
+    @param graph        A Graph of the network topology the routing tables were computed from.
+    @param nodes        A dictionary of distance vector nodes with their routing tables.
+    """
+    index = graph.index
+    offsets = array('q', [0])
+    destinations = array('i')
+    nextHops = array('i')
+    costs = array('q')
+    for nodeId in graph.nodeIds:
+        for destination, (nextHop, pathCost) in nodes[nodeId].routingTable.items():
+            destinations.append(index[destination])
+            nextHops.append(index[nextHop] if nextHop is not None else -1)
+            costs.append(pathCost)
+        offsets.append(len(destinations))
+    write_snapshot(snapshotFile, graph, DISTANCE_VECTOR, 0, (offsets, destinations, nextHops, costs))
+
+
+def load_distance_vector(snapshotFile, graph, nodes):
+    """! Load the routing table of every node from a snapshot file, instead of running Bellman-Ford.
+
+    @param snapshotFile The path of the snapshot file.
+    @param graph        A Graph of the current topology, which has to be the one the snapshot was computed from.
+    @param nodes        A dictionary of distance vector nodes, whose routing tables are replaced.
+    """
+    nodeIds = graph.nodeIds
+    with open(snapshotFile, 'rb') as file:
+        read_header(file, DISTANCE_VECTOR, graph)
+        offsets = read_array(file, 'q', len(nodeIds) + 1)
+        destinations = read_array(file, 'i', offsets[-1]).tolist()
+        nextHops = read_array(file, 'i', offsets[-1]).tolist()
+        costs = read_array(file, 'q', offsets[-1]).tolist()
+
+    for i, nodeId in enumerate(nodeIds):
+        start, end = offsets[i], offsets[i + 1]
+        nodes[nodeId].routingTable = {nodeIds[destination]: (nodeIds[nextHop] if nextHop >= 0 else None, cost)
+                                      for destination, nextHop, cost in zip(destinations[start:end], nextHops[start:end], costs[start:end])}
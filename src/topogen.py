@@ -0,0 +1,269 @@
+##
+# @file topogen.py
+
+import math
+import os
+import random
+
+from changebatch import LINK_REMOVED
+
+## Default number of links each new node of a scale free topology attaches with
+SCALE_FREE_LINKS = 2
+
+## Default average degree of a random sparse topology
+RANDOM_DEGREE = 4
+
+
+def add_link(links, seen, nodeId, neighborId, cost):
+    """! Add an undirected link to a topology, unless the two nodes are already linked.
+
+    @param links        The list of tuples (nodeId, neighborId, cost) of the topology.
+    @param seen         A set of the pairs (smaller nodeId, larger nodeId) that are already linked.
+    @param nodeId       One end of the link.
+    @param neighborId   The other end of the link.
+    @param cost         The cost of the link.
+
+    @return True if the link was added.
+    """
+    key = (min(nodeId, neighborId), max(nodeId, neighborId))
+    if nodeId == neighborId or key in seen:
+        return False
+    seen.add(key)
+    links.append((nodeId, neighborId, cost))
+    return True
+
+
+def random_topology(numNodes, rng, maxCost=20, degree=RANDOM_DEGREE):
+    """! Generate a connected random sparse topology: a random spanning tree plus random links up to an average degree.
+
+    @param numNodes The number of nodes, numbered from 1.
+    @param rng      The random.Random generator.
+    @param maxCost  The largest link cost.
+    @param degree   The average degree of a node.
+
+    @return A list of tuples (nodeId, neighborId, cost).
+    """
+    links, seen = [], set()
+    for nodeId in range(2, numNodes + 1):
+        add_link(links, seen, nodeId, rng.randint(1, nodeId - 1), rng.randint(1, maxCost))
+    target = min(numNodes * degree // 2, numNodes * (numNodes - 1) // 2)
+    while len(links) < target:
+        add_link(links, seen, rng.randint(1, numNodes), rng.randint(1, numNodes), rng.randint(1, maxCost))
+    return links
+
+
+def grid_topology(numNodes, rng, maxCost=20):
+    """! Generate a grid topology, filled row by row, with as many columns as the square root of the number of nodes.
+
+    @param numNodes The number of nodes, numbered from 1.
+    @param rng      The random.Random generator.
+    @param maxCost  The largest link cost.
+
+    @return A list of tuples (nodeId, neighborId, cost).
+    """
+    columns = math.isqrt(numNodes - 1) + 1
+    links = []
+    for nodeId in range(1, numNodes + 1):
+        if (nodeId - 1) % columns != columns - 1 and nodeId + 1 <= numNodes:
+            links.append((nodeId, nodeId + 1, rng.randint(1, maxCost)))
+        if nodeId + columns <= numNodes:
+            links.append((nodeId, nodeId + columns, rng.randint(1, maxCost)))
+    return links
+
+
+def fat_tree_topology(numNodes, rng, maxCost=20):
+    """! Generate a k-ary fat tree with the smallest even k that has at least the given number of nodes.
+
+    A k-ary fat tree has (k/2)^2 core switches and k pods of k/2 aggregation and k/2 edge switches, with k/2 hosts below
+    each edge switch, so the number of nodes is rounded up to 5k^2/4 + k^3/4.
+
+    @param numNodes The smallest number of nodes, numbered from 1.
+    @param rng      The random.Random generator.
+    @param maxCost  The largest link cost.
+
+    @return A list of tuples (nodeId, neighborId, cost).
+    """
+    k = 2
+    while 5 * k * k // 4 + k ** 3 // 4 < numNodes:
+        k += 2
+    half = k // 2
+    core = list(range(1, half * half + 1))
+    nextId = len(core) + 1
+    links = []
+    for _ in range(k):
+        aggregation = list(range(nextId, nextId + half))
+        edge = list(range(nextId + half, nextId + k))
+        nextId += k
+        for i, aggId in enumerate(aggregation):
+            for j in range(half):
+                links.append((core[i * half + j], aggId, rng.randint(1, maxCost)))
+            for edgeId in edge:
+                links.append((aggId, edgeId, rng.randint(1, maxCost)))
+        for edgeId in edge:
+            for hostId in range(nextId, nextId + half):
+                links.append((edgeId, hostId, rng.randint(1, maxCost)))
+            nextId += half
+    return links
+
+
+def scale_free_topology(numNodes, rng, maxCost=20, linksPerNode=SCALE_FREE_LINKS):
+    """! Generate a scale free topology by preferential attachment (Barabasi-Albert).
+
+    @param numNodes     The number of nodes, numbered from 1.
+    @param rng          The random.Random generator.
+    @param maxCost      The largest link cost.
+    @param linksPerNode The number of links each new node attaches with.
+
+    @return A list of tuples (nodeId, neighborId, cost).
+    """
+    links, seen = [], set()
+    start = min(numNodes, linksPerNode + 1)
+    for nodeId in range(2, start + 1):
+        for neighborId in range(1, nodeId):
+            add_link(links, seen, nodeId, neighborId, rng.randint(1, maxCost))
+    # Every node appears once per link it has, so a uniform pick from the list is proportional to the degree
+    ends = [nodeId for link in links for nodeId in link[:2]]
+    for nodeId in range(start + 1, numNodes + 1):
+        added = 0
+        while added < linksPerNode:
+            neighborId = rng.choice(ends)
+            if add_link(links, seen, nodeId, neighborId, rng.randint(1, maxCost)):
+                ends.append(neighborId)
+                added += 1
+        ends.extend([nodeId] * added)
+    return links
+
+
+def ring_topology(numNodes, rng, maxCost=20):
+    """! Generate a ring topology, the worst case for the number of hops of a route.
+
+    @param numNodes The number of nodes, numbered from 1.
+    @param rng      The random.Random generator.
+    @param maxCost  The largest link cost.
+
+    @return A list of tuples (nodeId, neighborId, cost).
+    """
+    links = [(nodeId, nodeId + 1, rng.randint(1, maxCost)) for nodeId in range(1, numNodes)]
+    if numNodes > 2:
+        links.append((numNodes, 1, rng.randint(1, maxCost)))
+    return links
+
+
+## Topology generators by the name used on the command line
+TOPOLOGY_KINDS = {
+    'random': random_topology,
+    'grid': grid_topology,
+    'fattree': fat_tree_topology,
+    'scalefree': scale_free_topology,
+    'ring': ring_topology,
+}
+
+
+def generate_messages(nodeIds, numMessages, rng):
+    """! Generate messages between random pairs of distinct nodes.
+
+    @param nodeIds      A list of the node ids of the topology.
+    @param numMessages  The number of messages.
+    @param rng          The random.Random generator.
+
+    @return A list of tuples (srcNodeId, dstNodeId, text).
+    """
+    messages = []
+    for i in range(numMessages):
+        srcNodeId, dstNodeId = rng.sample(nodeIds, 2)
+        messages.append((srcNodeId, dstNodeId, f'message {i} from {srcNodeId} to {dstNodeId}'))
+    return messages
+
+
+def generate_changes(links, numChanges, rng, maxCost=20):
+    """! Generate a sequence of link changes: cost changes, removals and restores of removed links.
+
+    Removed links are restored later with their old cost, so the topology keeps flapping around its original shape
+    instead of falling apart.
+
+    @param links        A list of tuples (nodeId, neighborId, cost) of the topology.
+    @param numChanges   The number of changes.
+    @param rng          The random.Random generator.
+    @param maxCost      The largest link cost.
+
+    @return A list of tuples (nodeId, neighborId, cost), where a cost of LINK_REMOVED removes the link.
+    """
+    active = {(nodeId, neighborId): cost for nodeId, neighborId, cost in links}
+    keys = list(active)
+    removed = []
+    changes = []
+    for _ in range(numChanges):
+        choice = rng.random()
+        if removed and choice < 0.2:
+            key = removed.pop(rng.randrange(len(removed)))
+            changes.append((*key, active[key]))
+            continue
+        key = keys[rng.randrange(len(keys))]
+        if choice < 0.4 and key not in removed:
+            removed.append(key)
+            changes.append((*key, LINK_REMOVED))
+        elif key not in removed:
+            active[key] = rng.randint(1, maxCost)
+            changes.append((*key, active[key]))
+        else:
+            removed.remove(key)
+            changes.append((*key, active[key]))
+    return changes
+
+
+def write_lines(fileName, rows):
+    """! Write rows of values as space separated lines.
+
+    @param fileName The path of the file.
+    @param rows     An iterable of tuples of values.
+    """
+    with open(fileName, 'w') as file:
+        file.writelines(' '.join(map(str, row)) + '\n' for row in rows)
+
+
+def generate_workload(kind, numNodes, numMessages, numChanges, seed, directory):
+    """! Generate a topology with matching message and change files, or reuse the files of an earlier identical call.
+
+    The files only depend on the arguments, so the same workload is generated on every machine.
+
+    @param kind         The name of the topology generator in TOPOLOGY_KINDS.
+    @param numNodes     The number of nodes.
+    @param numMessages  The number of messages.
+    @param numChanges   The number of changes.
+    @param seed         The seed of the random generator.
+    @param directory    The directory the files are written to.
+
+    @return A tuple (topologyFile, messageFile, changeFile) of the paths of the files.
+    """
+    if kind not in TOPOLOGY_KINDS:
+        raise ValueError(f'Unknown topology kind {kind}, expected one of {", ".join(TOPOLOGY_KINDS)}')
+    if numNodes < 2:
+        raise ValueError('A topology needs at least two nodes')
+    base = os.path.join(directory, f'{kind}-{numNodes}-m{numMessages}-c{numChanges}-s{seed}')
+    files = (f'{base}.topo', f'{base}.msg', f'{base}.chg')
+    if all(os.path.exists(fileName) for fileName in files):
+        return files
+
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(f'{kind}/{numNodes}/{seed}')
+    links = TOPOLOGY_KINDS[kind](numNodes, rng)
+    nodeIds = sorted({nodeId for link in links for nodeId in link[:2]})
+    write_lines(files[0], links)
+    write_lines(files[1], generate_messages(nodeIds, numMessages, rng))
+    write_lines(files[2], generate_changes(links, numChanges, rng))
+    return files
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a reproducible topology with matching message and change files.")
+    parser.add_argument("kind", choices=TOPOLOGY_KINDS, help="the shape of the topology")
+    parser.add_argument("numNodes", type=int, help="the number of nodes, rounded up to the next fat tree for fattree")
+    parser.add_argument("--messages", type=int, default=100, help="the number of messages")
+    parser.add_argument("--changes", type=int, default=20, help="the number of changes")
+    parser.add_argument("--seed", type=int, default=1, help="the seed of the random generator")
+    parser.add_argument("--directory", default=".", help="the directory the files are written to")
+    args = parser.parse_args()
+
+    print(*generate_workload(args.kind, args.numNodes, args.messages, args.changes, args.seed, args.directory), sep='\n')